@@ -110,26 +110,17 @@ class Cluster:
             return
 
         # calculate gene set enrichment
-        for gene_set in gene_sets:
-
-            if gene_set.hierarchy not in selected_sets:
-                continue
+        results = gene_sets.enrich(genes, ref_genes, hierarchies=selected_sets)
 
+        for gene_set, count, p_val, fdr in zip(results.gene_sets, results.query, results.p_values, results.fdr):
             gs = ClusterGeneSet()
-            enrichment_result = gene_set.set_enrichment(ref_genes, genes.intersection(genes))
-            gs.count = len(enrichment_result.query)
-            gs.p_val = enrichment_result.p_value
+            gs.count = int(count)
+            gs.p_val = float(p_val)
+            gs.fdr = float(fdr)
             gs.name = gene_set.name
             gs.gs_id = gene_set.gs_id
             self.gene_sets.append(gs)
 
-        # calculate FDR
-        p_vals = [gs.p_val for gs in self.gene_sets]
-        fdr_values = FDR(p_vals)
-
-        for gs, fdr in zip(self.gene_sets, fdr_values):
-            gs.fdr = fdr
-
     def __update_gene_objects(self, scores, p_vals, fdr_vals):
         # type: (Union[np.ndarray, list], Union[np.ndarray, list], Union[np.ndarray, list]) ->  None
         """ update gene objects with computed results
@@ -1,17 +1,24 @@
 """ GeneSet module """
-from typing import Tuple
+import threading
+from typing import Dict, List, Tuple, Optional
+from collections import OrderedDict
+
+import numpy as np
 
 from orangecontrib.bioinformatics.utils import serverfiles
 from orangecontrib.bioinformatics.geneset.utils import (
     GeneSet,
     GeneSets,
+    CompactGeneSets,
     GeneSetException,
     NoGeneSetsException,
     filename,
     filename_parse,
+    load_gmt_files,
+    load_gmt_cache_info,
 )
 
-__all__ = (GeneSet, GeneSets, GeneSetException, NoGeneSetsException)
+__all__ = (GeneSet, GeneSets, CompactGeneSets, GeneSetException, NoGeneSetsException)
 DOMAIN = 'gene_sets'
 
 
@@ -65,4 +72,155 @@ def load_gene_sets(hierarchy, tax_id):
 
     """
     file_path = serverfiles.localpath_download(DOMAIN, filename(hierarchy, tax_id))
-    return GeneSets.from_gmt_file_format(file_path)
+    return GeneSets.from_gmt_file_format(file_path, cache=True)
+
+
+def load_gene_sets_many(hierarchies, tax_id, max_workers=None):
+    # type: (List[Tuple[str, ...]], str, Optional[int]) -> List[GeneSets]
+    """ Initialize gene sets from multiple hierarchies. Files are parsed concurrently.
+
+    :param hierarchies: gene set hierarchies.
+    :param tax_id: Taxonomy id
+    :param max_workers: The maximum number of processes used for parsing.
+    :rtype: :obj:`list` of :obj:`GeneSets`, one for each hierarchy
+    """
+    file_paths = [serverfiles.localpath_download(DOMAIN, filename(hierarchy, tax_id)) for hierarchy in hierarchies]
+    return [compact.to_gene_sets() for compact in load_gmt_files(file_paths, cache=True, max_workers=max_workers)]
+
+
+class GeneSetsCatalog:
+    """ Index of available gene set collections, one per (hierarchy, organism).
+
+    Available collections are listed once (see :func:`list_all`) and collections are
+    loaded only when requested. The most recently used collections are kept in memory.
+
+    :param max_loaded: The number of loaded collections kept in memory.
+
+    Example
+    --------
+        >>> catalog = GeneSetsCatalog()
+        >>> catalog.hierarchies(organism='9606')
+        >>> gene_sets = catalog.load_many([('GO', 'biological_process'), ('KEGG', 'pathways')], '9606')
+
+    """
+
+    def __init__(self, max_loaded=8):
+        # type: (int) -> None
+        self.max_loaded = max_loaded
+        self._available = None  # type: Optional[set]
+        self._loaded = OrderedDict()  # type: OrderedDict
+        self._info = {}  # type: Dict[Tuple[Tuple[str, ...], str], dict]
+        self._genes = {}  # type: Dict[str, frozenset]
+        self._lock = threading.RLock()
+
+    def refresh(self):
+        """ Forget the index of available files (e.g. after files were downloaded or updated). """
+        with self._lock:
+            self._available = None
+            self._loaded.clear()
+            self._info.clear()
+            self._genes.clear()
+
+    def available(self):
+        # type: () -> set
+        """ Return a set of available (hierarchy, organism) pairs. """
+        with self._lock:
+            if self._available is None:
+                self._available = set(list_all())
+            return self._available
+
+    def hierarchies(self, organism=None):
+        # type: (Optional[str]) -> List[Tuple[str, ...]]
+        """ Return available hierarchies for `organism` (all hierarchies if None). """
+        return sorted({hier for hier, org in self.available() if organism is None or org == organism})
+
+    def load(self, hierarchy, organism):
+        # type: (Tuple[str, ...], str) -> GeneSets
+        """ Return gene sets of a single hierarchy.
+
+        The returned collection is shared between callers and must not be modified.
+
+        :rtype: :obj:`GeneSets`
+        """
+        return self._load([hierarchy], organism)[0]
+
+    def _load(self, hierarchies, organism):
+        # type: (List[Tuple[str, ...]], str) -> List[GeneSets]
+        keys = [(tuple(hierarchy), organism) for hierarchy in hierarchies]
+        with self._lock:
+            missing = [key for key in OrderedDict.fromkeys(keys) if key not in self._loaded]
+            if len(missing) == 1:
+                self._loaded[missing[0]] = load_gene_sets(*missing[0])
+            elif missing:
+                loaded = load_gene_sets_many([hierarchy for hierarchy, _ in missing], organism)
+                self._loaded.update(zip(missing, loaded))
+
+            result = []
+            for key in keys:
+                self._loaded.move_to_end(key)
+                result.append(self._loaded[key])
+
+            while len(self._loaded) > max(self.max_loaded, len(set(keys))):
+                self._loaded.popitem(last=False)
+
+            return result
+
+    def load_many(self, hierarchies, organism):
+        # type: (List[Tuple[str, ...]], str) -> GeneSets
+        """ Return gene sets from all `hierarchies` in a single collection.
+
+        Hierarchies that are not loaded yet are parsed concurrently (see :func:`load_gene_sets_many`).
+
+        :rtype: :obj:`GeneSets`
+        """
+        collections = self._load(hierarchies, organism)
+        return CompactGeneSets.concatenate(gene_sets.compact() for gene_sets in collections).to_gene_sets()
+
+    def info(self, hierarchy, organism):
+        # type: (Tuple[str, ...], str) -> Optional[dict]
+        """ Return the number of sets and the number of distinct genes in a hierarchy.
+
+        Counts are read from the metadata of the binary cache of the GMT file; gene sets are not loaded
+        and nothing is downloaded or parsed.
+
+        :rtype: :obj:`dict` with ``set_count`` and ``gene_count`` keys, None if the hierarchy
+            was not downloaded and loaded yet
+        """
+        key = (tuple(hierarchy), organism)
+        with self._lock:
+            if key not in self._info:
+                info = load_gmt_cache_info(serverfiles.localpath(DOMAIN, filename(*key)))
+                if info is None:
+                    return None
+                self._info[key] = {'set_count': info['set_count'], 'gene_count': info['gene_count']}
+            return self._info[key]
+
+    def genes(self, organism):
+        # type: (str) -> frozenset
+        """ Return genes from all available hierarchies for `organism`.
+
+        Gene vocabularies are read from binary caches of GMT files. Files without a cache are parsed
+        (and cached), but their gene sets are not kept in memory.
+        """
+        with self._lock:
+            if organism in self._genes:
+                return self._genes[organism]
+            hierarchies = self.hierarchies(organism)
+
+        # files are read without holding the lock, so loading of other collections is not blocked
+        vocabularies = []
+        for hierarchy in hierarchies:
+            file_path = serverfiles.localpath_download(DOMAIN, filename(hierarchy, organism))
+            info = load_gmt_cache_info(file_path)
+            if info is None:
+                vocabularies.append(GeneSets.from_gmt_file_format(file_path, cache=True).compact().genes)
+            else:
+                vocabularies.append(info['genes'])
+
+        genes = frozenset(np.unique(np.concatenate(vocabularies)).tolist()) if vocabularies else frozenset()
+        with self._lock:
+            return self._genes.setdefault(organism, genes)
+
+
+#: A catalog shared by all widgets.
+catalog = GeneSetsCatalog()
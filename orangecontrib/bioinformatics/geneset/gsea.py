@@ -0,0 +1,247 @@
+""" Pre-ranked gene set enrichment analysis (GSEA)
+
+Implements the enrichment score from Subramanian et al., PNAS 2005, computed for all gene sets
+at once from the compact (CSR) membership matrix. Significance is estimated with gene permutations:
+random gene sets of the same size as the tested set, so sets of equal size share one null distribution.
+False discovery rates are estimated from normalized scores of all tested sets and their null distributions,
+as in the original method (not by correcting nominal p-values).
+"""
+import os
+import multiprocessing
+from typing import Iterable, Optional, NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from orangecontrib.bioinformatics.geneset.utils import GeneSets, CompactGeneSets, GeneSetException
+
+# Gene set sizes (after restriction to ranked genes) that are tested by default.
+MIN_SIZE = 15
+MAX_SIZE = 500
+
+gsea_results = NamedTuple(
+    'gsea_results',
+    [
+        ('gene_sets', list),
+        ('size', np.ndarray),
+        ('es', np.ndarray),
+        ('nes', np.ndarray),
+        ('p_values', np.ndarray),
+        ('fdr', np.ndarray),
+    ],
+)
+
+
+def enrichment_scores(hits, weights):
+    # type: (sp.csr_matrix, np.ndarray) -> np.ndarray
+    """ Compute enrichment scores of all gene sets.
+
+    The running sum increases at hits (proportionally to the weight of the hit gene) and decreases
+    at misses. Its maximum is reached at a hit and its minimum just before a hit, so only
+    positions of hits are evaluated.
+
+    :param hits: Binary CSR matrix (sets x ranked genes), columns sorted by decreasing score.
+        Indices must be sorted within rows.
+    :param weights: Weight of each ranked gene (absolute score raised to a power).
+    :return: Signed enrichment score of each set (0 for empty sets).
+    """
+    n_genes = hits.shape[1]
+    indptr, positions = hits.indptr, hits.indices
+    sizes = np.diff(indptr)
+    nonempty = sizes > 0
+    starts = indptr[:-1][nonempty]
+
+    scores = np.zeros(len(sizes))
+    if not len(starts):
+        return scores
+
+    hit_weights = weights[positions]
+    totals = np.add.reduceat(hit_weights, starts)
+    # hits are weighted equally if all of them have zero weight (e.g. scores of hits are 0)
+    unweighted = totals == 0
+    if unweighted.any():
+        hit_weights = np.where(np.repeat(unweighted, sizes[nonempty]), 1.0, hit_weights)
+        totals = np.where(unweighted, sizes[nonempty], totals)
+
+    # segmented cumulative sum of normalized hit weights
+    hit_weights = hit_weights / np.repeat(totals, sizes[nonempty])
+    cumulative = np.cumsum(hit_weights)
+    cumulative -= np.repeat(cumulative[starts] - hit_weights[starts], sizes[nonempty])
+
+    # the number of misses before each hit, normalized
+    hit_index = np.arange(len(positions)) - np.repeat(starts, sizes[nonempty])
+    misses = np.maximum(n_genes - sizes[nonempty], 1)
+    misses = (positions - hit_index) / np.repeat(misses, sizes[nonempty])
+
+    at_hit = cumulative - misses
+    before_hit = at_hit - hit_weights
+
+    maxima = np.maximum.reduceat(at_hit, starts)
+    minima = np.minimum(np.minimum.reduceat(before_hit, starts), 0)
+    scores[nonempty] = np.where(np.abs(maxima) >= np.abs(minima), maxima, minima)
+    return scores
+
+
+def _null_scores(weights, sizes, permutations, seed):
+    # type: (np.ndarray, np.ndarray, int, np.random.SeedSequence) -> np.ndarray
+    """ Enrichment scores of random gene sets (sizes x permutations).
+
+    In each permutation genes are drawn (without replacement) once; a random set of size `m`
+    consists of the first `m` drawn genes. Sets of different sizes are thus not independent,
+    but each size gets its own uniformly sampled null distribution.
+    """
+    rng = np.random.default_rng(seed)
+    n_genes = len(weights)
+    sizes = np.asarray(sizes)
+    shape = (len(sizes), n_genes)
+
+    null = np.empty((len(sizes), permutations))
+    for i in range(permutations):
+        drawn = rng.permutation(n_genes)[: sizes.max()]
+        draw_order = np.argsort(drawn)
+        # a gene is in all sets larger than its draw order, rows of nonzero() are sorted by gene rank
+        rows, columns = np.nonzero(draw_order[np.newaxis, :] < sizes[:, np.newaxis])
+        indptr = np.concatenate(([0], np.cumsum(sizes)))
+        hits = sp.csr_matrix((np.ones(len(rows)), drawn[draw_order][columns], indptr), shape=shape)
+        null[:, i] = enrichment_scores(hits, weights)
+    return null
+
+
+def _significance(scores, null):
+    # type: (np.ndarray, np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray)
+    """ Normalized scores, nominal p-values and the normalized null distribution of each set.
+
+    Positive (negative) scores are compared with the positive (negative) part of the null and
+    normalized by its mean.
+    """
+    scores = scores[:, np.newaxis]
+    positive = scores >= 0
+    null_positive = null >= 0
+
+    same_sign = np.where(positive, null_positive, ~null_positive)
+    extreme = np.where(positive, null >= scores, null <= scores)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        positive_means = np.sum(null * null_positive, axis=1) / np.sum(null_positive, axis=1)
+        negative_means = np.abs(np.sum(null * ~null_positive, axis=1)) / np.sum(~null_positive, axis=1)
+        positive_means, negative_means = positive_means[:, np.newaxis], negative_means[:, np.newaxis]
+        null_means = np.where(positive, positive_means, negative_means)[:, 0]
+        normalized = scores[:, 0] / null_means
+        p_values = np.sum(extreme & same_sign, axis=1) / np.sum(same_sign, axis=1)
+        null_normalized = np.where(null_positive, null / positive_means, null / negative_means)
+    return normalized, p_values, null_normalized
+
+
+def _fdr(normalized, null_normalized):
+    # type: (np.ndarray, np.ndarray) -> np.ndarray
+    """ False discovery rates of normalized scores (Subramanian et al., 2005).
+
+    For a positive score, the fraction of normalized null scores of all sets that are at least as large
+    is divided by the fraction of observed scores that are at least as large; negative scores are
+    compared with negative scores.
+    """
+    fdr = np.full(len(normalized), np.nan)
+    valid = ~np.isnan(normalized)
+    for sign, observed_mask, null_mask in (
+        (1, valid & (normalized >= 0), null_normalized >= 0),
+        (-1, valid & (normalized < 0), null_normalized < 0),
+    ):
+        null = np.sort(sign * null_normalized[null_mask & ~np.isnan(null_normalized)])
+        if not len(null) or not observed_mask.any():
+            continue
+        observed = np.sort(sign * normalized[observed_mask])
+        scores = sign * normalized[observed_mask]
+
+        null_fraction = (len(null) - np.searchsorted(null, scores, side='left')) / len(null)
+        observed_fraction = (len(observed) - np.searchsorted(observed, scores, side='left')) / len(observed)
+        fdr[observed_mask] = np.minimum(null_fraction / observed_fraction, 1)
+    return fdr
+
+
+def gsea(
+    gene_sets,  # type: GeneSets
+    genes,  # type: Iterable
+    scores,  # type: Iterable[float]
+    permutations=1000,  # type: int
+    weight=1.0,  # type: float
+    min_size=MIN_SIZE,  # type: int
+    max_size=MAX_SIZE,  # type: int
+    max_workers=None,  # type: Optional[int]
+    random_state=None,  # type: Optional[int]
+):
+    # type: (...) -> gsea_results
+    """ Pre-ranked gene set enrichment analysis.
+
+    :param gene_sets: Gene sets to test.
+    :param genes: Ranked genes (e.g. gene IDs of columns scored by differential expression).
+    :param scores: Score of each gene, used for ranking (higher is better) and for weighting hits.
+    :param permutations: The number of gene permutations used to estimate significance (0 to skip).
+    :param weight: Exponent of scores in the running sum; with 0, the score is the Kolmogorov-Smirnov statistic.
+    :param min_size: Sets with fewer ranked genes are not tested.
+    :param max_size: Sets with more ranked genes are not tested.
+    :param max_workers: The maximum number of processes used for permutations.
+    :param random_state: Seed for permutations.
+    :rtype: :obj:`gsea_results`, ``fdr`` are estimated from normalized scores of all tested sets.
+
+    Example
+    --------
+        >>> results = gsea(gene_sets, gene_ids, t_statistics, random_state=0)
+        >>> top = sorted(zip(results.p_values, results.nes, results.gene_sets), key=lambda r: r[0])[:10]
+    """
+    genes = np.array([str(gene) for gene in genes], dtype=str)
+    scores = np.asarray(list(scores) if not isinstance(scores, np.ndarray) else scores, dtype=float)
+
+    if len(genes) != len(scores):
+        raise GeneSetException('Genes and scores must be of the same length.')
+    if len(np.unique(genes)) != len(genes):
+        raise GeneSetException('Ranked genes must be unique.')
+    if np.isnan(scores).any():
+        raise GeneSetException('Scores must not contain missing values.')
+
+    order = np.argsort(-scores, kind='stable')
+    genes, scores = genes[order], scores[order]
+    weights = np.abs(scores) ** weight
+
+    compact = gene_sets.compact() if isinstance(gene_sets, GeneSets) else CompactGeneSets.from_gene_sets(gene_sets)
+
+    # columns of the membership matrix (vocabulary) -> ranks
+    rank_of_gene = np.full(len(compact.genes), -1, dtype=np.int64)
+    if len(compact.genes):
+        positions = np.searchsorted(compact.genes, genes)
+        positions[positions == len(compact.genes)] = 0
+        found = compact.genes[positions] == genes
+        rank_of_gene[positions[found]] = np.flatnonzero(found)
+
+    membership = compact.membership.tocoo()
+    ranks = rank_of_gene[membership.col]
+    known = ranks >= 0
+    hits = sp.csr_matrix(
+        (np.ones(known.sum()), (membership.row[known], ranks[known])), shape=(len(compact), len(genes))
+    )
+    hits.sort_indices()
+
+    sizes = np.diff(hits.indptr)
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size))
+    hits, sizes = hits[tested], sizes[tested]
+    es = enrichment_scores(hits, weights)
+
+    nes, p_values, fdr = (np.full(len(tested), np.nan) for _ in range(3))
+    if permutations > 0 and len(tested):
+        unique_sizes, size_index = np.unique(sizes, return_inverse=True)
+
+        workers = min(max_workers or os.cpu_count() or 1, permutations)
+        chunks = [len(chunk) for chunk in np.array_split(np.arange(permutations), workers)]
+        seeds = np.random.SeedSequence(random_state).spawn(workers)
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                nulls = list(pool.map(_null_scores, [weights] * workers, [unique_sizes] * workers, chunks, seeds))
+        else:
+            nulls = [_null_scores(weights, unique_sizes, chunks[0], seeds[0])]
+
+        null = np.hstack(nulls)[size_index.ravel()]
+        nes, p_values, null_nes = _significance(es, null)
+        fdr = _fdr(nes, null_nes)
+
+    return gsea_results([compact.gene_sets[i] for i in tested], sizes, es, nes, p_values, fdr)
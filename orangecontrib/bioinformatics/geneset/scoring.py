@@ -0,0 +1,199 @@
+""" Single-sample gene set scoring
+
+Every sample (e.g. a cell) is scored against all gene sets at once. Genes are ranked within each
+sample once, and scores of all sets are then computed with sparse matrix products between the rank
+matrix and the gene set membership matrix. Samples are processed in chunks, optionally in parallel.
+
+Scoring methods:
+
+* ``'auc'`` -- area under the recovery curve of set genes among the top ranked genes (as in AUCell,
+  Aibar et al., Nature Methods 2017), normalized to [0, 1].
+* ``'ssgsea'`` -- single-sample GSEA (Barbie et al., Nature 2009): the sum of differences between
+  the weighted cumulative distribution of set genes and the distribution of remaining genes.
+"""
+import os
+import multiprocessing
+from typing import List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.stats import rankdata
+
+from Orange.data import Table, Domain, ContinuousVariable
+from Orange.data.util import get_unique_names
+
+from orangecontrib.bioinformatics.geneset.utils import GeneSets, GeneSetException
+from orangecontrib.bioinformatics.widgets.utils.data import TableAnnotation
+
+SCORING_AUC = 'auc'
+SCORING_SSGSEA = 'ssgsea'
+SCORING_METHODS = (SCORING_AUC, SCORING_SSGSEA)
+
+
+def _ranks(x):
+    # type: (np.ndarray) -> np.ndarray
+    """ Positions of genes in each sample (row), sorted by decreasing expression. Ties get average positions. """
+    return rankdata(-x, method='average', axis=1) - 1
+
+
+def _auc_scores(x, membership, max_rank):
+    # type: (np.ndarray, sp.csr_matrix, int) -> np.ndarray
+    # a hit at position p (among the top `max_rank`) adds (max_rank - p) to the area under the recovery curve
+    weights = np.maximum(max_rank - _ranks(x), 0)
+    area = (membership @ weights.T).T
+
+    # area of a set with all genes at the top of the ranking
+    sizes = np.minimum(np.diff(membership.indptr), max_rank)
+    max_area = sizes * max_rank - sizes * (sizes - 1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return area / max_area
+
+
+def _ssgsea_scores(x, membership, alpha):
+    # type: (np.ndarray, sp.csr_matrix, float) -> np.ndarray
+    n_genes = x.shape[1]
+    # the top gene has rank N and contributes to all N steps of the running sum
+    ranks = n_genes - _ranks(x)
+
+    hits_steps = (membership @ ranks.T).T
+    weighted_steps = (membership @ (ranks ** (alpha + 1)).T).T
+    weights = (membership @ (ranks ** alpha).T).T
+
+    sizes = np.diff(membership.indptr)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hits = weighted_steps / weights
+        misses = (n_genes * (n_genes + 1) / 2 - hits_steps) / (n_genes - sizes)
+        return np.where(sizes > 0, hits - misses, np.nan)
+
+
+def _score_chunk(x, membership, method, max_rank, alpha):
+    # type: (np.ndarray, sp.csr_matrix, str, int, float) -> np.ndarray
+    x = x.toarray() if sp.issparse(x) else np.asarray(x, dtype=float)
+    if method == SCORING_AUC:
+        return _auc_scores(x, membership, max_rank)
+    return _ssgsea_scores(x, membership, alpha)
+
+
+def score_samples(
+    gene_sets,  # type: GeneSets
+    x,  # type: np.ndarray
+    genes,  # type: List[str]
+    method=SCORING_AUC,  # type: str
+    max_rank=0.05,  # type: float
+    alpha=0.25,  # type: float
+    min_size=1,  # type: int
+    chunk_size=1000,  # type: int
+    max_workers=None,  # type: Optional[int]
+):
+    # type: (...) -> Tuple[np.ndarray, list]
+    """ Score samples against gene sets.
+
+    :param gene_sets: Gene sets
+    :param x: Expression matrix (samples x genes), dense or sparse.
+    :param genes: Gene IDs of columns of `x`.
+    :param method: ``'auc'`` or ``'ssgsea'``
+    :param max_rank: The number of top ranked genes used to compute AUC, as a number or as a proportion of genes.
+    :param alpha: Exponent of rank weights in ssGSEA.
+    :param min_size: Sets with fewer genes in `genes` are not scored.
+    :param chunk_size: The number of samples ranked at once.
+    :param max_workers: The maximum number of processes scoring chunks.
+    :return: Scores (samples x gene sets) and a list of scored gene sets.
+
+    Example
+    --------
+        >>> scores, scored_sets = score_samples(gene_sets, data.X, gene_ids, method='auc')
+    """
+    if method not in SCORING_METHODS:
+        raise GeneSetException('Unknown scoring method {}, use one of {}'.format(method, SCORING_METHODS))
+    if x.shape[1] != len(genes):
+        raise GeneSetException('The number of genes does not match the number of columns.')
+
+    n_genes = len(genes)
+    max_rank = int(round(max_rank * n_genes)) if isinstance(max_rank, float) else max_rank
+    max_rank = min(max(max_rank, 1), n_genes)
+
+    compact = gene_sets.compact() if isinstance(gene_sets, GeneSets) else GeneSets(list(gene_sets)).compact()
+
+    # columns of the membership matrix (vocabulary) -> columns of x
+    genes = np.array([str(gene) for gene in genes], dtype=str)
+    column_of_gene = np.full(len(compact.genes), -1, dtype=np.int64)
+    if len(compact.genes) and n_genes:
+        positions = np.searchsorted(compact.genes, genes)
+        positions[positions == len(compact.genes)] = 0
+        found = compact.genes[positions] == genes
+        column_of_gene[positions[found]] = np.flatnonzero(found)
+
+    membership = compact.membership.tocoo()
+    columns = column_of_gene[membership.col]
+    known = columns >= 0
+    membership = sp.csr_matrix(
+        (np.ones(known.sum()), (membership.row[known], columns[known])), shape=(len(compact), n_genes)
+    )
+
+    scored = np.flatnonzero(np.diff(membership.indptr) >= max(min_size, 1))
+    membership = membership[scored]
+
+    chunks = [x[start : start + chunk_size] for start in range(0, x.shape[0], chunk_size)]
+    workers = min(len(chunks), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        n = len(chunks)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            scores = list(
+                pool.map(_score_chunk, chunks, [membership] * n, [method] * n, [max_rank] * n, [alpha] * n)
+            )
+    else:
+        scores = [_score_chunk(chunk, membership, method, max_rank, alpha) for chunk in chunks]
+
+    scores = np.vstack(scores) if scores else np.zeros((0, len(scored)))
+    return scores, [compact.gene_sets[i] for i in scored]
+
+
+def _table_genes(data):
+    # type: (Table) -> List[str]
+    """ Gene IDs of columns: values of the gene ID attribute (if set) or variable names. """
+    gene_id_attribute = data.attributes.get(TableAnnotation.gene_id_attribute)
+    if gene_id_attribute is None:
+        return [var.name for var in data.domain.attributes]
+    return [str(var.attributes.get(gene_id_attribute, '')) for var in data.domain.attributes]
+
+
+def score_table(data, gene_sets, method=SCORING_AUC, **kwargs):
+    # type: (...) -> Table
+    """ Score data instances against gene sets.
+
+    Genes must be in columns. If the table defines the gene ID attribute
+    (``TableAnnotation.gene_id_attribute``), genes are matched by the values of that attribute,
+    otherwise by column names.
+
+    :param data: Expression data with genes in columns.
+    :param gene_sets: Gene sets
+    :param method: ``'auc'`` or ``'ssgsea'``
+    :param kwargs: Parameters of :func:`score_samples`.
+    :return: A table with one column per gene set, class variables and metas of `data` are preserved.
+    """
+    if not data.attributes.get(TableAnnotation.gene_as_attr_name, True):
+        raise GeneSetException('Genes must be in columns.')
+
+    scores, scored_sets = score_samples(gene_sets, data.X, _table_genes(data), method=method, **kwargs)
+
+    existing = [var.name for var in data.domain.class_vars + data.domain.metas]
+    names = get_unique_names(existing, [gene_set.name or gene_set.gs_id for gene_set in scored_sets])
+
+    attributes = []
+    for name, gene_set in zip(names, scored_sets):
+        var = ContinuousVariable(name)
+        var.attributes['gs_id'] = gene_set.gs_id
+        attributes.append(var)
+
+    domain = Domain(attributes, data.domain.class_vars, data.domain.metas)
+    table = Table.from_numpy(domain, scores, data.Y, data.metas, ids=data.ids)
+    # columns are not genes anymore
+    annotations = {
+        TableAnnotation.gene_as_attr_name,
+        TableAnnotation.gene_id_attribute,
+        TableAnnotation.gene_id_column,
+    }
+    table.attributes = {key: value for key, value in data.attributes.items() if key not in annotations}
+    table.name = data.name
+    return table
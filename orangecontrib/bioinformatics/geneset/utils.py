@@ -1,10 +1,19 @@
 """ GeneSets utility functions """
-from typing import List, Tuple, NamedTuple
+import os
+import gzip
+import multiprocessing
+from typing import List, Tuple, Iterable, Optional, NamedTuple
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
+import scipy.sparse as sp
+
+from scipy.sparse.csgraph import connected_components
 
 from orangecontrib.bioinformatics.utils import ensure_type
-from orangecontrib.bioinformatics.utils.statistics import Hypergeometric
+from orangecontrib.bioinformatics.utils import cache as binary_cache
+from orangecontrib.bioinformatics.utils.statistics import FDR, Hypergeometric
 
 
 def filename(hierarchy, organism):  # type: (Tuple[str, str], str) -> str
@@ -47,14 +56,51 @@ def filename_parse(fn):  # type: (str) -> (Tuple[Tuple[str, str], str])
 GENE_SET_ATTRIBUTES = ('gs_id', 'hierarchy', 'organism', 'name', 'genes', 'description', 'link')
 HYPERGEOMETRIC = Hypergeometric()
 
+# Measures of overlap between two gene sets A and B.
+OVERLAP_INTERSECTION = 'intersection'  # |A & B|
+OVERLAP_JACCARD = 'jaccard'  # |A & B| / |A | B|
+OVERLAP_COEFFICIENT = 'overlap'  # |A & B| / min(|A|, |B|)
+OVERLAP_MEASURES = (OVERLAP_INTERSECTION, OVERLAP_JACCARD, OVERLAP_COEFFICIENT)
+
+# Parsed GMT files are cached next to the source file, in a '<file>.gmt.cache' directory.
+GMT_CACHE_SUFFIX = '.cache'
+GMT_CACHE_VERSION = 2
+_CACHE_METADATA_ATTRIBUTES = ('gs_id', 'hierarchy', 'organism', 'name', 'description', 'link')
+
 # change this when python 3.4 is not supported anymore
 enrichment_result = NamedTuple(
     'enrichment_result', [('query', set), ('reference', set), ('p_value', float), ('enrichment_score', float)]
 )
 
+enrichment_results = NamedTuple(
+    'enrichment_results',
+    [
+        ('gene_sets', list),
+        ('query', np.ndarray),
+        ('reference', np.ndarray),
+        ('p_values', np.ndarray),
+        ('fdr', np.ndarray),
+        ('enrichment_score', np.ndarray),
+    ],
+)
+
+
+class _LazyGenes:
+    """ Genes of a gene set, decoded from :obj:`CompactGeneSets` on first access. """
+
+    __slots__ = ('compact', 'index')
+
+    def __init__(self, compact, index):
+        self.compact = compact
+        self.index = index
+
+    def __call__(self):
+        return self.compact.set_genes(self.index)
+
 
 class GeneSet:
-    __slots__ = GENE_SET_ATTRIBUTES
+    # genes are stored in a "private" slot, so they can be loaded lazily
+    __slots__ = tuple('_genes' if attr == 'genes' else attr for attr in GENE_SET_ATTRIBUTES)
 
     def __init__(self, gs_id=None, hierarchy=None, organism=None, name=None, genes=None, description=None, link=None):
         """ Object representing a single set of genes
@@ -76,13 +122,25 @@ class GeneSet:
         self.description = description
         self.link = link
 
+    @property
+    def genes(self):
+        if isinstance(self._genes, _LazyGenes):
+            self._genes = self._genes()
+        return self._genes
+
+    @genes.setter
+    def genes(self, genes):
+        self._genes = genes
+
     def __hash__(self):
         return self.gs_id.__hash__() + self.name.__hash__()
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             if self.__slots__ == other.__slots__:
-                return all(getattr(self, attr) == getattr(other, attr) for attr in self.__slots__)
+                return all(
+                    getattr(self, attr.lstrip('_')) == getattr(other, attr.lstrip('_')) for attr in self.__slots__
+                )
 
         return False
 
@@ -134,6 +192,382 @@ class GeneSet:
         )
 
 
+class CompactGeneSets:
+    """ Integer encoded representation of a collection of gene sets.
+
+    Genes of all sets are encoded into a global (sorted) vocabulary and set membership is stored
+    as a CSR sparse matrix (sets x genes). Overlaps of all sets with a query are then computed
+    with a single sparse matrix-vector product.
+    """
+
+    def __init__(self, gene_sets, genes, membership):
+        # type: (List[GeneSet], np.ndarray, sp.csr_matrix) -> None
+
+        #: A list of :obj:`GeneSet` objects. The i-th set corresponds to the i-th row of `membership`.
+        self.gene_sets = gene_sets
+
+        #: Sorted array of gene IDs (strings), the vocabulary.
+        self.genes = genes
+
+        #: Binary CSR matrix (sets x genes).
+        self.membership = membership
+
+    @classmethod
+    def from_gene_sets(cls, gene_sets):
+        # type: (Iterable[GeneSet]) -> CompactGeneSets
+        """ Encode gene sets.
+
+        :param gene_sets: :obj:`GeneSet` objects
+        :rtype: :obj:`CompactGeneSets`
+        """
+        gene_sets = list(gene_sets)
+        members = [[str(gene) for gene in gene_set.genes or ()] for gene_set in gene_sets]
+
+        indptr = np.zeros(len(members) + 1, dtype=np.int64)
+        np.cumsum([len(genes) for genes in members], out=indptr[1:])
+
+        flat = list(chain.from_iterable(members))
+        genes = sorted(set(flat))
+        vocabulary = dict(zip(genes, range(len(genes))))
+        indices = np.fromiter(map(vocabulary.__getitem__, flat), dtype=np.int64, count=len(flat))
+
+        membership = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(gene_sets), len(genes))
+        )
+        # gene IDs are strings here, {1, '1'} would result in duplicates (this also sorts indices).
+        membership.sum_duplicates()
+        membership.data[:] = 1
+
+        return cls(gene_sets, np.array(genes, dtype=str), membership)
+
+    def __len__(self):
+        return len(self.gene_sets)
+
+    def set_sizes(self):
+        # type: () -> np.ndarray
+        """ Return the number of genes in each set. """
+        return np.diff(self.membership.indptr)
+
+    def encode(self, genes):
+        # type: (Iterable) -> np.ndarray
+        """ Return vocabulary indices of known `genes`. Genes that are not in any set are ignored.
+
+        :param genes: Gene IDs
+        """
+        genes = np.array([str(gene) for gene in genes], dtype=str)
+        if not len(genes) or not len(self.genes):
+            return np.array([], dtype=np.int64)
+
+        positions = np.searchsorted(self.genes, genes)
+        positions[positions == len(self.genes)] = 0
+        return np.unique(positions[self.genes[positions] == genes])
+
+    def indicator(self, genes):
+        # type: (Iterable) -> np.ndarray
+        """ Return a boolean vector over the vocabulary, marking `genes`. """
+        vector = np.zeros(len(self.genes), dtype=bool)
+        vector[self.encode(genes)] = True
+        return vector
+
+    def overlap(self, genes):
+        # type: (Iterable) -> np.ndarray
+        """ Return the number of `genes` in each set. """
+        return self.membership @ self.indicator(genes).astype(np.int32)
+
+    def overlaps(self, gene_lists):
+        # type: (List[Iterable]) -> np.ndarray
+        """ Return overlap counts of all sets with each of the gene lists, as a matrix (sets x lists).
+
+        :param gene_lists: A list of gene lists
+        """
+        columns = [self.encode(genes) for genes in gene_lists]
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        np.cumsum([len(column) for column in columns], out=indptr[1:])
+        indices = np.concatenate(columns) if columns else np.array([], dtype=np.int64)
+
+        queries = sp.csc_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(self.genes), len(columns))
+        )
+        return (self.membership @ queries).toarray()
+
+    def subset(self, rows):
+        # type: (np.ndarray) -> CompactGeneSets
+        """ Return a collection of gene sets at `rows`. The vocabulary is shared. """
+        rows = np.asarray(rows, dtype=np.int64)
+        return CompactGeneSets([self.gene_sets[i] for i in rows], self.genes, self.membership[rows])
+
+    def overlap_matrix(self, measure=OVERLAP_JACCARD, threshold=0.0, chunk_size=500):
+        # type: (str, float, int) -> sp.csr_matrix
+        """ Return pairwise overlaps of all sets as a sparse matrix (sets x sets).
+
+        Intersections are computed with a sparse product of the membership matrix with its transpose,
+        `chunk_size` sets at a time. Only overlaps above `threshold` are kept, so the memory used
+        is bounded by the size of the result. The diagonal is not included.
+
+        :param measure: ``'intersection'``, ``'jaccard'`` or ``'overlap'`` (see ``OVERLAP_MEASURES``)
+        :param threshold: Only keep values strictly greater than the threshold.
+        :param chunk_size: The number of rows computed at once.
+        :rtype: :obj:`scipy.sparse.csr_matrix`
+        """
+        if measure not in OVERLAP_MEASURES:
+            raise GeneSetException('Unknown overlap measure {}, use one of {}'.format(measure, OVERLAP_MEASURES))
+
+        membership = self.membership.astype(np.int32)
+        transposed = membership.T.tocsc()
+        sizes = self.set_sizes()
+        blocks = []
+
+        for start in range(0, len(self), chunk_size):
+            block = (membership[start : start + chunk_size] @ transposed).tocoo()
+            rows, columns = block.row + start, block.col
+            values = block.data.astype(float)
+
+            if measure == OVERLAP_JACCARD:
+                values /= sizes[rows] + sizes[columns] - block.data
+            elif measure == OVERLAP_COEFFICIENT:
+                values /= np.minimum(sizes[rows], sizes[columns])
+
+            keep = (values > threshold) & (rows != columns)
+            blocks.append((values[keep], rows[keep], columns[keep]))
+
+        values, rows, columns = (np.concatenate(parts) for parts in zip(*blocks)) if blocks else ([], [], [])
+        return sp.csr_matrix((values, (rows, columns)), shape=(len(self), len(self)))
+
+    def redundancy_clusters(self, threshold=0.5, measure=OVERLAP_JACCARD):
+        # type: (float, str) -> np.ndarray
+        """ Group redundant sets: sets are in the same cluster if they are connected
+        by a chain of overlaps greater than `threshold` (single linkage).
+
+        :param threshold: Overlaps above the threshold are considered redundant.
+        :param measure: Overlap measure, see :meth:`overlap_matrix`.
+        :return: Cluster label of each set.
+        """
+        _, labels = connected_components(self.overlap_matrix(measure, threshold), directed=False)
+        return labels
+
+    def enrich(self, query, reference, prob=HYPERGEOMETRIC):
+        # type: (Iterable, Iterable, Hypergeometric) -> enrichment_results
+        """ Compute enrichment of `query` genes in all sets at once.
+
+        Same as calling :meth:`GeneSet.set_enrichment` for each set, followed by the FDR correction.
+
+        :param query: Query genes
+        :param reference: Reference genes
+        :param prob: Probability distribution (must implement vectorized ``p_values``)
+        :rtype: :obj:`enrichment_results`
+        """
+        query = {str(gene) for gene in query}
+        reference = {str(gene) for gene in reference}
+
+        query_counts = self.overlap(query)
+        reference_counts = self.overlap(reference)
+        n, N = len(query), len(reference)  # noqa: N806
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            query_p = query_counts / n if n else np.full(len(self), np.nan)
+            ref_p = reference_counts / N if N else np.full(len(self), np.nan)
+            enrichment = np.where(ref_p > 0, query_p / ref_p, np.nan)
+
+        p_values = np.asarray(prob.p_values(query_counts, N, reference_counts, n), dtype=float)
+        return enrichment_results(
+            list(self.gene_sets), query_counts, reference_counts, p_values, np.array(FDR(p_values)), enrichment
+        )
+
+    def save(self, path, source=None):
+        # type: (str, Optional[str]) -> None
+        """ Save encoded gene sets into directory `path`.
+
+        Vocabulary and CSR arrays are stored as ``.npy`` files (so they can be memory mapped on load),
+        gene set attributes are stored in ``metadata.json``. An existing cache is replaced, not overwritten
+        (see :func:`orangecontrib.bioinformatics.utils.cache.write_cache`).
+
+        :param path: Cache directory
+        :param source: Key of the source the sets were loaded from, checked by :meth:`load`.
+        """
+        arrays = {
+            'genes': self.genes.astype(str),
+            'indptr': self.membership.indptr.astype(np.int64),
+            'indices': self.membership.indices.astype(np.int32),
+        }
+        metadata = self._metadata()
+        metadata.update(version=GMT_CACHE_VERSION, source=source, set_count=len(self), gene_count=len(self.genes))
+        binary_cache.write_cache(path, arrays, metadata)
+
+    @classmethod
+    def load(cls, path, source=None):
+        # type: (str, Optional[str]) -> CompactGeneSets
+        """ Load gene sets saved with :meth:`save`. Arrays are memory mapped and genes
+        of each :obj:`GeneSet` are decoded only when accessed.
+
+        :param path: Cache directory
+        :param source: If given, it must match the key the cache was saved with.
+        :rtype: :obj:`CompactGeneSets`
+        """
+        metadata = cls._load_metadata(path, source)
+        genes = binary_cache.read_array(path, 'genes')
+        indptr = binary_cache.read_array(path, 'indptr')
+        indices = binary_cache.read_array(path, 'indices')
+
+        return cls._from_arrays(genes, indptr, indices, metadata)
+
+    @classmethod
+    def load_info(cls, path, source=None):
+        # type: (str, Optional[str]) -> dict
+        """ Read the number of sets and genes and the (memory mapped) gene vocabulary of gene sets saved
+        with :meth:`save`, without loading the sets.
+
+        :rtype: :obj:`dict` with ``set_count``, ``gene_count`` and ``genes`` keys
+        """
+        metadata = cls._load_metadata(path, source)
+        genes = binary_cache.read_array(path, 'genes')
+        return {'set_count': metadata['set_count'], 'gene_count': metadata['gene_count'], 'genes': genes}
+
+    @staticmethod
+    def _load_metadata(path, source):
+        # type: (str, Optional[str]) -> dict
+        try:
+            return binary_cache.read_metadata(path, GMT_CACHE_VERSION, source)
+        except ValueError:
+            raise GeneSetException('Gene sets cache {} is out of date'.format(path))
+
+    def _metadata(self):
+        # type: () -> dict
+        """ Gene set attributes (except genes), stored column-wise. Hierarchies are stored as
+        indices into a list of unique hierarchies.
+        """
+        hierarchies = sorted({gs.hierarchy for gs in self.gene_sets if gs.hierarchy is not None})
+        hierarchy_index = {hierarchy: i for i, hierarchy in enumerate(hierarchies)}
+
+        metadata = {attr: [getattr(gs, attr) for gs in self.gene_sets] for attr in _CACHE_METADATA_ATTRIBUTES}
+        metadata['hierarchy'] = [hierarchy_index.get(gs.hierarchy, -1) for gs in self.gene_sets]
+        metadata['hierarchies'] = hierarchies
+        return metadata
+
+    @classmethod
+    def _from_arrays(cls, genes, indptr, indices, metadata):
+        # type: (np.ndarray, np.ndarray, np.ndarray, dict) -> CompactGeneSets
+        """ Inverse of :meth:`_metadata`, genes of gene sets are decoded lazily. """
+        membership = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(indptr) - 1, len(genes))
+        )
+
+        hierarchies = [tuple(hierarchy) for hierarchy in metadata['hierarchies']]
+        compact = cls([], genes, membership)
+
+        for i, (gs_id, hierarchy, organism, name, description, link) in enumerate(
+            zip(*(metadata[attr] for attr in _CACHE_METADATA_ATTRIBUTES))
+        ):
+            compact.gene_sets.append(
+                GeneSet(
+                    gs_id=gs_id,
+                    hierarchy=hierarchies[hierarchy] if hierarchy >= 0 else None,
+                    organism=organism,
+                    name=name,
+                    genes=_LazyGenes(compact, i),
+                    description=description,
+                    link=link,
+                )
+            )
+
+        return compact
+
+    def __reduce__(self):
+        # Pickle arrays and columnar attributes instead of GeneSet objects and their (decoded) genes,
+        # this is how collections are passed between processes.
+        return (
+            CompactGeneSets._from_arrays,
+            (
+                np.asarray(self.genes),
+                np.asarray(self.membership.indptr),
+                np.asarray(self.membership.indices),
+                self._metadata(),
+            ),
+        )
+
+    @classmethod
+    def concatenate(cls, collections):
+        # type: (Iterable[CompactGeneSets]) -> CompactGeneSets
+        """ Merge collections into one, over a common vocabulary.
+
+        Gene sets that appear in more than one collection are kept only once.
+
+        :param collections: :obj:`CompactGeneSets` objects
+        :rtype: :obj:`CompactGeneSets`
+        """
+        collections = list(collections)
+        if not collections:
+            return cls.from_gene_sets([])
+        if len(collections) == 1:
+            return collections[0]
+
+        genes = np.unique(np.concatenate([np.asarray(c.genes, dtype=str) for c in collections]))
+
+        gene_sets, rows, seen = [], [], set()
+        for compact in collections:
+            # vocabularies are sorted, so indices are remapped with a single search
+            columns = np.searchsorted(genes, compact.genes)
+            membership = compact.membership.tocoo()
+            membership = sp.csr_matrix(
+                (membership.data, (membership.row, columns[membership.col])), shape=(len(compact), len(genes))
+            )
+
+            keep = []
+            for i, gene_set in enumerate(compact.gene_sets):
+                if gene_set not in seen:
+                    seen.add(gene_set)
+                    keep.append(i)
+            gene_sets.extend(compact.gene_sets[i] for i in keep)
+            rows.append(membership[keep])
+
+        membership = sp.vstack(rows, format='csr') if rows else sp.csr_matrix((0, len(genes)), dtype=np.int32)
+        membership.sort_indices()
+        return cls(gene_sets, genes, membership)
+
+    def to_gene_sets(self):
+        # type: () -> GeneSets
+        """ Return :obj:`GeneSets` with this object as its (cached) compact representation. """
+        gene_sets = GeneSets()
+        gene_sets.update(self.gene_sets, validate=False)
+        gene_sets._compact = self
+        return gene_sets
+
+    def gmt_lines(self, rows=None):
+        # type: (Optional[Iterable[int]]) -> Iterable[str]
+        """ Generate lines of a GMT file for sets at `rows` (all sets by default).
+
+        Genes are sorted once for the whole vocabulary: integer IDs in numerical order first,
+        followed by other IDs in alphabetical order.
+        """
+        order = _gene_order(self.genes)
+        genes = np.asarray(self.genes)[order]
+
+        # renumber columns so that their order matches the order of genes, then sort each row
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        membership = sp.csr_matrix(
+            (self.membership.data, rank[self.membership.indices], self.membership.indptr), shape=self.membership.shape
+        )
+        membership.sort_indices()
+        indptr, indices = membership.indptr, membership.indices
+
+        for row in range(len(self)) if rows is None else rows:
+            gene_set = self.gene_sets[row]
+            members = genes[indices[indptr[row] : indptr[row + 1]]].tolist()
+            yield '\t'.join([gene_set.gs_id, gene_set.gmt_description()] + members)
+
+    def set_genes(self, index, genes=None):
+        # type: (int, Optional[np.ndarray]) -> set
+        """ Return genes of the `index`-th set.
+
+        :param index: Index of the gene set
+        :param genes: Optional boolean indicator (see :meth:`indicator`); if given, return only marked genes.
+        """
+        members = self.membership.indices[self.membership.indptr[index] : self.membership.indptr[index + 1]]
+        if genes is not None:
+            members = members[genes[members]]
+        return set(self.genes[members].tolist())
+
+
 class GeneSets(set):
     """ A collection of gene sets: contains :obj:`GeneSet` objects.
     """
@@ -141,16 +575,163 @@ class GeneSets(set):
     def __init__(self, sets=None):
         # type: (List[GeneSet]) -> None
         super().__init__()
+        self._compact = None
 
         if sets:
             self.update(ensure_type(sets, list))
 
-    def update(self, sets):
-        # type: (List[GeneSet]) -> None
+    def update(self, sets, validate=True):
+        # type: (Iterable[GeneSet], bool) -> None
+        """ Add gene sets to the collection.
+
+        :param sets: :obj:`GeneSet` objects
+        :param validate: Check the type of each object. Type checks can be skipped for sets
+            from trusted sources (e.g. parsed from GMT files).
+        """
+        if not validate:
+            self._compact = None
+            super().update(sets)
+            return
 
         for g_set in sets:
             self.add(ensure_type(g_set, GeneSet))
 
+    def add(self, g_set):
+        self._compact = None
+        super().add(g_set)
+
+    def remove(self, g_set):
+        self._compact = None
+        super().remove(g_set)
+
+    def discard(self, g_set):
+        self._compact = None
+        super().discard(g_set)
+
+    def pop(self):
+        self._compact = None
+        return super().pop()
+
+    def clear(self):
+        self._compact = None
+        super().clear()
+
+    def intersection_update(self, *others):
+        self._compact = None
+        super().intersection_update(*others)
+
+    def difference_update(self, *others):
+        self._compact = None
+        super().difference_update(*others)
+
+    def symmetric_difference_update(self, other):
+        self._compact = None
+        super().symmetric_difference_update(other)
+
+    def __ior__(self, other):
+        self._compact = None
+        return super().__ior__(other)
+
+    def __iand__(self, other):
+        self._compact = None
+        return super().__iand__(other)
+
+    def __isub__(self, other):
+        self._compact = None
+        return super().__isub__(other)
+
+    def __ixor__(self, other):
+        self._compact = None
+        return super().__ixor__(other)
+
+    def enrich(self, query, reference, prob=HYPERGEOMETRIC, hierarchies=None):
+        # type: (Iterable, Iterable, Hypergeometric, Optional[List[Tuple[str, ...]]]) -> enrichment_results
+        """ Compute enrichment of `query` genes in all gene sets in one batch.
+
+        :param query: Query genes
+        :param reference: Reference genes
+        :param prob: Probability distribution (must implement vectorized ``p_values``)
+        :param hierarchies: If given, only sets from these hierarchies are tested.
+        :rtype: :obj:`enrichment_results`
+
+        Example
+        --------
+            >>> results = gene_sets.enrich(query, reference)
+            >>> hits = [(gs.name, p) for gs, p in zip(results.gene_sets, results.fdr) if p < 0.05]
+        """
+        compact = self.compact()
+        if hierarchies is not None:
+            hierarchies = set(hierarchies)
+            compact = compact.subset(
+                [i for i, gene_set in enumerate(compact.gene_sets) if gene_set.hierarchy in hierarchies]
+            )
+        return compact.enrich(query, reference, prob=prob)
+
+    def overlap_matrix(self, measure=OVERLAP_JACCARD, threshold=0.0):
+        # type: (str, float) -> Tuple[List[GeneSet], sp.csr_matrix]
+        """ Compute pairwise overlaps of all gene sets.
+
+        :param measure: ``'intersection'``, ``'jaccard'`` or ``'overlap'``
+        :param threshold: Only keep values strictly greater than the threshold.
+        :return: A list of gene sets and a sparse matrix of overlaps between them (in the same order).
+
+        Example
+        --------
+            >>> gene_sets, jaccard = gene_sets.overlap_matrix(threshold=0.5)
+            >>> pairs = [(gene_sets[i].name, gene_sets[j].name) for i, j in zip(*jaccard.nonzero()) if i < j]
+        """
+        compact = self.compact()
+        return list(compact.gene_sets), compact.overlap_matrix(measure, threshold)
+
+    def redundancy_clusters(self, threshold=0.5, measure=OVERLAP_JACCARD, scores=None):
+        # type: (float, str, Optional[dict]) -> List[List[GeneSet]]
+        """ Group redundant (heavily overlapping) gene sets.
+
+        Each cluster starts with its representative: the set with the lowest score
+        (e.g. enrichment p-value) if `scores` are given, otherwise the largest set.
+
+        :param threshold: Overlaps above the threshold are considered redundant.
+        :param measure: Overlap measure, see :meth:`overlap_matrix`.
+        :param scores: A mapping from :obj:`GeneSet` to score, lower is better.
+        :rtype: :obj:`list` of :obj:`list` of :obj:`GeneSet`
+        """
+        compact = self.compact()
+        labels = compact.redundancy_clusters(threshold, measure)
+        sizes = compact.set_sizes()
+
+        if scores is not None:
+            keys = np.array([scores.get(gene_set, np.inf) for gene_set in compact.gene_sets], dtype=float)
+        else:
+            keys = -sizes.astype(float)
+
+        order = np.lexsort((-sizes, keys, labels))
+        clusters = np.split(order, np.flatnonzero(np.diff(labels[order])) + 1) if len(order) else []
+        return [[compact.gene_sets[i] for i in cluster] for cluster in clusters]
+
+    def collapse_redundant(self, threshold=0.5, measure=OVERLAP_JACCARD, scores=None):
+        # type: (float, str, Optional[dict]) -> GeneSets
+        """ Return representatives of clusters of redundant gene sets, see :meth:`redundancy_clusters`.
+
+        :rtype: :obj:`GeneSets`
+        """
+        gene_sets = GeneSets()
+        representatives = [cluster[0] for cluster in self.redundancy_clusters(threshold, measure, scores)]
+        gene_sets.update(representatives, validate=False)
+        return gene_sets
+
+    def compact(self):
+        # type: () -> CompactGeneSets
+        """ Return integer encoded representation of this collection.
+
+        The result is cached until the collection is modified. Note that changing genes of
+        an already added :obj:`GeneSet` is not tracked.
+
+        :rtype: :obj:`CompactGeneSets`
+        """
+        if self._compact is None:
+            self._compact = CompactGeneSets.from_gene_sets(self)
+        return self._compact
+
     def common_org(self):
         """ Return a common organism. """
         if len(self) == 0:
@@ -211,7 +792,7 @@ class GeneSets(set):
         [genes.update(gene_set.genes) for gene_set in self]
         return genes
 
-    def to_gmt_file_format(self, file_path):  # type: (str) -> None
+    def to_gmt_file_format(self, file_path, compress=None):  # type: (str, Optional[bool]) -> None
         """ The GMT file format is a tab delimited file format that describes gene sets.
 
         In the GMT format, each row represents a gene set.
@@ -219,46 +800,191 @@ class GeneSets(set):
         gmt_description: 'gs_id','hierarchy','organism','name','genes','description','link'
 
         :param file_path: Path to where file will be created
+        :param compress: Compress the file with gzip (by default, if `file_path` ends with ``.gz``).
 
         """
+        if self._compact is None:
+            write_gmt_file(sorted(self), file_path, compress=compress)
+            return
 
-        with open(file_path, 'w') as gmt_file:
-            for gene_set in sorted(self):
-                genes = sorted(map(str, gene_set.genes), key=lambda x: int(x))
-                line = '\t'.join([gene_set.gs_id, gene_set.gmt_description()] + genes)
-                gmt_file.write(line + '\n')
+        # genes of encoded collections are sorted for all sets at once, see CompactGeneSets.gmt_lines
+        rows = sorted(range(len(self._compact)), key=self._compact.gene_sets.__getitem__)
+        _write_gmt_lines(self._compact.gmt_lines(rows), file_path, compress)
 
     @staticmethod
-    def from_gmt_file_format(file_path):  # type: (str) -> GeneSets
+    def from_gmt_file_format(file_path, cache=False):  # type: (str, bool) -> GeneSets
         """ Load GeneSets object from GMT file.
 
-        :param file_path: path to a file on local disk
+        :param file_path: path to a file on local disk (gzip compressed if it ends with ``.gz``)
+        :param cache: Use (and create) a binary cache of the parsed file, stored next to it.
+            The cache is rebuilt when the GMT file changes.
         :rtype: :obj:`GeneSets`
         """
-        index = {label: index for index, label in enumerate(GENE_SET_ATTRIBUTES)}
-
-        with open(file_path, 'r', encoding='utf-8') as gmt_file:
-            gene_sets = []
-
-            for line in gmt_file:
-                columns = [column.strip() for column in line.split('\t')]
-                gs_info = columns[1].split(',')
-                hierarchy = tuple(gs_info[index['hierarchy']].split('-'))
-                genes = {str(gene) for gene in columns[2:]}
-
-                gene_set = GeneSet(
-                    gs_id=columns[0],
-                    genes=genes,
-                    hierarchy=hierarchy,
-                    name=gs_info[index['name']],
-                    organism=gs_info[index['organism']],
-                    description=gs_info[index['description']],
-                    link=gs_info[index['link']],
-                )
+        if cache:
+            compact = _load_gmt_cache(file_path)
+            if compact is not None:
+                return compact.to_gene_sets()
+            source = binary_cache.source_key(file_path)
+
+        gene_sets = GeneSets()
+        gene_sets.update(_parse_gmt_file(file_path), validate=False)
+
+        if cache:
+            try:
+                gene_sets.compact().save(file_path + GMT_CACHE_SUFFIX, source=source)
+            except OSError:
+                # cache is an optimization only
+                pass
+
+        return gene_sets
+
+    @staticmethod
+    def from_gmt_files(file_paths, cache=False, max_workers=None):
+        # type: (List[str], bool, Optional[int]) -> GeneSets
+        """ Load gene sets from multiple GMT files into a single collection.
+
+        :param file_paths: paths to files on local disk
+        :param cache: Use (and create) binary caches of parsed files, see :meth:`from_gmt_file_format`.
+        :param max_workers: The maximum number of processes used for parsing.
+        :rtype: :obj:`GeneSets`
+        """
+        return CompactGeneSets.concatenate(load_gmt_files(file_paths, cache, max_workers)).to_gene_sets()
+
+
+def _open_gmt_file(file_path, mode, compress=None):
+    if compress is None:
+        compress = file_path.endswith('.gz')
+    newline = '\n' if mode == 'w' else None
+    if compress:
+        return gzip.open(file_path, mode + 't', encoding='utf-8', newline=newline)
+    return open(file_path, mode, encoding='utf-8', newline=newline)
+
+
+def _gene_order(genes):  # type: (np.ndarray) -> np.ndarray
+    """ Return indices that sort gene IDs: integer IDs first, in numerical order, then other IDs alphabetically. """
+    genes = np.asarray(genes, dtype=str)
+    # IDs that do not fit into int64 are sorted alphabetically
+    numeric = np.char.isdigit(genes) & (np.char.str_len(genes) < 19)
+    keys = np.zeros(len(genes), dtype=np.int64)
+    keys[numeric] = genes[numeric].astype(np.int64)
+    return np.lexsort((genes, keys, ~numeric))
+
+
+def _write_gmt_lines(lines, file_path, compress=None, chunk_size=1000):
+    # type: (Iterable[str], str, Optional[bool], int) -> None
+    with _open_gmt_file(file_path, 'w', compress) as gmt_file:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                gmt_file.write('\n'.join(chunk) + '\n')
+                chunk = []
+
+        if chunk:
+            gmt_file.write('\n'.join(chunk) + '\n')
 
-                gene_sets.append(gene_set)
 
-            return GeneSets(gene_sets)
+def write_gmt_file(gene_sets, file_path, compress=None, chunk_size=1000):
+    # type: (Iterable[GeneSet], str, Optional[bool], int) -> None
+    """ Write gene sets to a GMT file (see :meth:`GeneSets.to_gmt_file_format`).
+
+    Gene sets are consumed one at a time, so they can be produced by a generator,
+    and lines are written in chunks.
+
+    :param gene_sets: :obj:`GeneSet` objects, written in the given order
+    :param file_path: Path to where file will be created
+    :param compress: Compress the file with gzip (by default, if `file_path` ends with ``.gz``).
+    :param chunk_size: The number of lines written at once.
+    """
+
+    def lines():
+        for gene_set in gene_sets:
+            genes = sorted(str(gene) for gene in gene_set.genes or ())
+            if ''.join(genes).isdigit():
+                # the common case, all IDs are integers (ties are kept in alphabetical order)
+                genes.sort(key=int)
+            else:
+                genes = np.array(genes, dtype=str)[_gene_order(genes)].tolist()
+            yield '\t'.join([gene_set.gs_id, gene_set.gmt_description()] + genes)
+
+    _write_gmt_lines(lines(), file_path, compress, chunk_size)
+
+
+def _parse_gmt_file(file_path):  # type: (str) -> List[GeneSet]
+    index = {label: index for index, label in enumerate(GENE_SET_ATTRIBUTES)}
+    gene_sets = []
+
+    with _open_gmt_file(file_path, 'r') as gmt_file:
+        for line in gmt_file:
+            columns = [column.strip() for column in line.split('\t')]
+            gs_info = columns[1].split(',')
+            hierarchy = tuple(gs_info[index['hierarchy']].split('-'))
+            genes = {str(gene) for gene in columns[2:]}
+
+            gene_set = GeneSet(
+                gs_id=columns[0],
+                genes=genes,
+                hierarchy=hierarchy,
+                name=gs_info[index['name']],
+                organism=gs_info[index['organism']],
+                description=gs_info[index['description']],
+                link=gs_info[index['link']],
+            )
+
+            gene_sets.append(gene_set)
+
+    return gene_sets
+
+
+def _load_gmt_cache(file_path):  # type: (str) -> Optional[CompactGeneSets]
+    """ Return gene sets from the binary cache of a GMT file, None if it is missing or out of date. """
+    try:
+        return CompactGeneSets.load(file_path + GMT_CACHE_SUFFIX, source=binary_cache.source_key(file_path))
+    except (OSError, ValueError, KeyError, GeneSetException):
+        return None
+
+
+def load_gmt_cache_info(file_path):  # type: (str) -> Optional[dict]
+    """ Return the number of sets and genes and the gene vocabulary of a GMT file from its binary cache
+    (see :meth:`CompactGeneSets.load_info`), None if the cache is missing or out of date.
+    """
+    try:
+        return CompactGeneSets.load_info(file_path + GMT_CACHE_SUFFIX, source=binary_cache.source_key(file_path))
+    except (OSError, ValueError, KeyError, GeneSetException):
+        return None
+
+
+def _load_gmt_file(file_path, cache):  # type: (str, bool) -> CompactGeneSets
+    # runs in a worker process, compact collections are cheap to send back (see CompactGeneSets.__reduce__)
+    return GeneSets.from_gmt_file_format(file_path, cache=cache).compact()
+
+
+def load_gmt_files(file_paths, cache=False, max_workers=None):
+    # type: (List[str], bool, Optional[int]) -> List[CompactGeneSets]
+    """ Load multiple GMT files, parsing them concurrently in a process pool.
+
+    Files with an up-to-date binary cache are loaded (memory mapped) in the calling process,
+    only the remaining files are parsed in worker processes.
+
+    :param file_paths: paths to files on local disk
+    :param cache: Use (and create) binary caches of parsed files.
+    :param max_workers: The maximum number of worker processes (default: the number of CPUs).
+        If 1, files are parsed in the calling process.
+    :rtype: :obj:`list` of :obj:`CompactGeneSets`, in the order of `file_paths`
+    """
+    file_paths = list(file_paths)
+    loaded = {path: _load_gmt_cache(path) for path in file_paths} if cache else {}
+    pending = [path for path in file_paths if loaded.get(path) is None]
+
+    workers = min(len(pending), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        # workers are spawned, forking a process with running (e.g. Qt) threads is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            loaded.update(zip(pending, pool.map(_load_gmt_file, pending, [cache] * len(pending))))
+    else:
+        loaded.update((path, _load_gmt_file(path, cache)) for path in pending)
+
+    return [loaded[path] for path in file_paths]
 
 
 class NoGeneSetsException(Exception):
@@ -4,12 +4,19 @@ import re
 import sys
 import tarfile
 import warnings
+from typing import Optional
+from functools import partial
 from collections import namedtuple, defaultdict
+from collections.abc import Mapping
 
-import six
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
 
 from orangecontrib.bioinformatics.ncbi import taxonomy
+from orangecontrib.bioinformatics.utils import cache as binary_cache
 from orangecontrib.bioinformatics.utils import statistics, serverfiles, progress_bar_milestones
+from orangecontrib.bioinformatics.go import topology, similarity
 from orangecontrib.bioinformatics.go.config import DOMAIN, FILENAME_ONTOLOGY, FILENAME_ANNOTATION
 
 intern = sys.intern
@@ -17,6 +24,13 @@ default_database_path = os.path.join(serverfiles.localpath(), DOMAIN)
 
 _CVS_REVISION_RE = re.compile(r"^(rev)?(\d+\.\d+)+$")
 
+# Parsed ontology is cached next to the .obo file, in a '<file>.obo.cache' directory.
+ONTOLOGY_CACHE_SUFFIX = '.cache'
+ONTOLOGY_CACHE_VERSION = 1
+
+# Relations that point from a term to its ancestor (e.g. `has_part` points to a part, not to a more general term).
+ANCESTOR_RELATIONS = frozenset({'is_a', 'part_of', 'regulates', 'positively_regulates', 'negatively_regulates'})
+
 evidence_types = {
     # Experimental
     'EXP': 'Inferred from Experiment',
@@ -88,6 +102,11 @@ multiplicity_set = {
 
 multiple_tag_set = multiplicity_set
 
+_INTERN_TAGS = {"id", "name", "namespace", "alt_id", "is_a"}
+
+# Tags stored in the binary ontology cache, other tags are read from the .obo file when needed.
+_INDEXED_TAGS = frozenset({"id", "name", "namespace", "alt_id", "is_a", "relationship", "subset", "is_obsolete"})
+
 builtin_obo_objects = [
     """
 [Typedef]
@@ -129,11 +148,94 @@ definition: Indicates that a term is the intersection of several others [OBO:def
 ]
 
 
+def _parse_tag_line(line):
+    """ Parse a `tag: value {modifiers} ! comment` line of an OBO stanza. Return None if the line is not a tag line.
+    """
+    tag, colon, rest = line.rstrip("\r\n").partition(":")
+    if not colon:
+        return None
+    rest, _, comment = rest.partition("!")
+    value, brace, modifiers = rest.partition("{")
+    if brace:
+        modifiers = modifiers.strip("}")
+    tag = intern(tag)
+    value = value.strip()
+    comment = comment.strip()
+    if tag in _INTERN_TAGS:
+        value, comment = intern(value), intern(comment)
+    return tag, value, modifiers, comment
+
+
+def _parse_obo(lines):
+    """ Parse lines of an OBO file one at a time.
+
+    Yield ``(None, header_lines)`` first, followed by ``(stanza_type, tag_lines, offset)`` for each stanza,
+    where `tag_lines` are parsed with :func:`_parse_tag_line` and `offset` is the position of the stanza
+    in the (utf-8 encoded) file, in bytes.
+    """
+    header, stanza, tag_lines, start = [], None, [], 0
+    offset = 0
+    for line in lines:
+        if isinstance(line, str):
+            line_offset, offset = offset, offset + (len(line) if line.isascii() else len(line.encode("utf-8")))
+        else:
+            line_offset, offset = offset, offset + len(line)
+            line = line.decode("utf-8")
+
+        first = line[:1]
+        if first == "!":
+            continue
+        elif first == "[":
+            if stanza is None:
+                yield None, header
+            else:
+                yield stanza, tag_lines, start
+            stanza, tag_lines, start = line.strip()[1:-1], [], line_offset
+        elif stanza is None:
+            header.append(line)
+        else:
+            parsed = _parse_tag_line(line)
+            if parsed is not None:
+                tag_lines.append(parsed)
+
+    if stanza is None:
+        yield None, header
+    else:
+        yield stanza, tag_lines, start
+
+
+def _csr_gather(indptr, indices, rows):
+    """ Return concatenated `indices` of the given `rows` of a CSR structure. """
+    starts = np.asarray(indptr)[rows]
+    counts = np.asarray(indptr)[np.asarray(rows) + 1] - starts
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - starts, counts)
+    return np.asarray(indices)[positions]
+
+
+def _read_stanza(file_path, offset):
+    """ Return parsed tag lines of the stanza at `offset` in an OBO file. """
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        f.readline()  # stanza type
+        tag_lines = []
+        for line in f:
+            line = line.decode('utf-8')
+            if line.startswith('['):
+                break
+            if not line.startswith('!'):
+                parsed = _parse_tag_line(line)
+                if parsed is not None:
+                    tag_lines.append(parsed)
+        return tag_lines
+
+
 class OBOObject:
     """ Represents a generic OBO object (e.g. Term, Typedef, Instance, ...)
-    """
 
-    _INTERN_TAGS = ["id", "name", "namespace", "alt_id", "is_a"]
+    Tag values are accessible as attributes (e.g. ``term.name``). Objects of ontologies loaded
+    from the binary cache hold only the most common tags; the full stanza is read from the
+    OBO file when any other tag is requested.
+    """
 
     def __init__(self, stanza=None, ontology=None):
         self.ontology = ontology
@@ -141,37 +243,42 @@ class OBOObject:
         self.values = {}
         self.related = set()
         self.related_to = set()
+        #: A function that returns all tag lines of this object (if only some tags are loaded)
+        self._stanza = None
+        #: Tags that are known to be complete even if the full stanza is not loaded
+        self._loaded_tags = frozenset()
         if stanza:
             self.parse_stanza(stanza)
 
     def parse_stanza(self, stanza):
-        intern_tags = set(self._INTERN_TAGS)
-        for line in stanza.splitlines():
-            if ":" not in line:
-                continue
-            tag, rest = line.split(":", 1)
-            value, modifiers, comment = "", "", ""
-            if "!" in rest:
-                rest, comment = rest.split("!")
-            if "{" in rest:
-                value, modifiers = rest.split("{", 1)
-                modifiers = modifiers.strip("}")
-            else:
-                value = rest
-            tag = intern(tag)
-            value = value.strip()
-            comment = comment.strip()
-            if tag in intern_tags:
-                value, comment = intern(value), intern(comment)
-            self._lines.append((tag, value, modifiers, comment))
+        self._set_lines([line for line in map(_parse_tag_line, stanza.splitlines()) if line is not None])
+        self.related = set(self.related_objects())
+
+    def _set_lines(self, tag_lines):
+        self._lines = tag_lines
+        self.values = {}
+        for tag, value, _, _ in tag_lines:
             if tag in multiple_tag_set:
                 self.values.setdefault(tag, []).append(value)
             else:
                 self.values[tag] = value
-        self.related = set(self.related_objects())
-        self.__dict__.update(self.values)
-        if "def" in self.__dict__:
-            self.__dict__["def_"] = self.__dict__["def"]
+
+    def _load_stanza(self):
+        if self._stanza is not None:
+            tag_lines, self._stanza = self._stanza(), None
+            self._set_lines(tag_lines)
+
+    def __getattr__(self, name):
+        # Only called if there is no attribute `name`: look it up in tag values.
+        if name.startswith("__") or "values" not in self.__dict__:
+            raise AttributeError(name)
+        tag = "def" if name == "def_" else name
+        if tag not in self.values and tag not in self._loaded_tags:
+            self._load_stanza()
+        try:
+            return self.values[tag]
+        except KeyError:
+            raise AttributeError(name) from None
 
     def related_objects(self):
         """Return a list of tuple pairs where the first element is relationship
@@ -187,6 +294,7 @@ class OBOObject:
     def __repr__(self):
         """ Return a string representation of the object in OBO format
         """
+        self._load_stanza()
         _repr = "[%s]\n" % type(self).__name__
         for tag, value, modifiers, comment in self._lines:
             _repr = _repr + tag + ": " + value
@@ -221,6 +329,351 @@ class Instance(OBOObject):
     pass
 
 
+class _OntologyIndex:
+    """ Columnar representation of ontology terms (the binary ontology cache).
+
+    Term ``i`` has id ``ids[i]``; parents of term ``i`` are ``parents[parent_indptr[i]:parent_indptr[i + 1]]``
+    (term indices) with relation types ``relations`` (indices into ``relation_types``). Names are stored as
+    one utf-8 encoded buffer, subsets as a CSR matrix of indices into ``subsets``.
+
+    Ancestors, levels and depths are computed on the DAG of :data:`ANCESTOR_RELATIONS` (see :meth:`parent_matrix`).
+    """
+
+    ARRAYS = (
+        'ids',
+        'names',
+        'name_offsets',
+        'namespace',
+        'obsolete',
+        'stanza_offsets',
+        'parent_indptr',
+        'parents',
+        'relations',
+        'subset_indptr',
+        'subset_codes',
+        'alt_ids',
+        'alt_targets',
+    )
+
+    def __init__(self, arrays, namespaces, relation_types, subsets):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.namespaces = namespaces
+        self.relation_types = relation_types
+        self.subsets = subsets
+
+        self.index = dict(zip(self.ids.tolist(), range(len(self.ids))))
+
+        # children of each term, the reverse of parent edges
+        counts = np.diff(self.parent_indptr)
+        order = np.argsort(self.parents, kind='stable')
+        self.children = np.repeat(np.arange(len(self.ids), dtype=np.int32), counts)[order]
+        self.child_relations = np.asarray(self.relations)[order]
+        self.child_indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parents, minlength=len(self.ids)), out=self.child_indptr[1:])
+
+        # the DAG structures below are computed when first needed
+        self._parent_matrix = None
+        self._child_matrix = None
+        self._levels = None
+        self._closure = None
+        self._descendant_closure = None
+        self._depths = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def parent_matrix(self):
+        """ Sparse boolean (terms x terms) matrix with parents of each term in its row.
+
+        Only relations in :data:`ANCESTOR_RELATIONS` are included. A valid ontology has no cycles; if there
+        are any, terms of a cycle are not ancestors of each other, and each gets all parents of the cycle.
+        """
+        if self._parent_matrix is None:
+            n = len(self.ids)
+            codes = [code for code, type_id in enumerate(self.relation_types) if type_id in ANCESTOR_RELATIONS]
+            upward = np.isin(self.relations, codes)
+            rows = np.repeat(np.arange(n), np.diff(self.parent_indptr))[upward]
+            columns = np.asarray(self.parents)[upward]
+
+            matrix = sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(n, n))
+            n_components, labels = connected_components(matrix, directed=True, connection='strong')
+            cyclic = labels[rows] == labels[columns]
+            if cyclic.any():
+                warnings.warn(
+                    'The ontology graph contains cycles, {} relations are ignored'.format(cyclic.sum()), RuntimeWarning
+                )
+                data = np.ones((~cyclic).sum(), dtype=bool)
+                matrix = sp.csr_matrix((data, (rows[~cyclic], columns[~cyclic])), shape=(n, n))
+                # parents of a component (other than its members) are parents of each member
+                members = sp.csr_matrix((np.ones(n, dtype=bool), (np.arange(n), labels)), shape=(n, n_components))
+                matrix = (members @ (members.T @ matrix)).tocsr()
+
+            matrix.sort_indices()
+            self._parent_matrix = matrix
+        return self._parent_matrix
+
+    def child_matrix(self):
+        """ Transpose of :meth:`parent_matrix`: children of each term in its row. """
+        if self._child_matrix is None:
+            self._child_matrix = self.parent_matrix().T.tocsr()
+            self._child_matrix.sort_indices()
+        return self._child_matrix
+
+    def levels(self):
+        """ Length of the longest path from a root to each term, so parents are on lower levels than children.
+
+        Terms are leveled in topological order (Kahn's algorithm, processing one level at a time).
+        """
+        if self._levels is None:
+            n = len(self.ids)
+            children = self.child_matrix()
+            remaining = np.diff(self.parent_matrix().indptr)
+            levels = np.full(n, -1, dtype=np.int32)
+            frontier = np.flatnonzero(remaining == 0)
+            level = 0
+            while len(frontier):
+                levels[frontier] = level
+                remaining = remaining - np.bincount(
+                    _csr_gather(children.indptr, children.indices, frontier), minlength=n
+                )
+                frontier = np.flatnonzero((remaining == 0) & (levels < 0))
+                level += 1
+            self._levels = levels
+        return self._levels
+
+    def depths(self):
+        """ Minimum and maximum depth of each term, the number of terms on the shortest and on the longest
+        path from a root to the term (roots have depth 1).
+
+        Minimum depths are propagated from roots to leaves, one level at a time.
+        """
+        if self._depths is None:
+            levels = self.levels()
+            order = np.argsort(levels, kind='stable')
+            bounds = np.searchsorted(levels[order], np.arange(levels.max(initial=-1) + 2))
+            parent_matrix = self.parent_matrix()
+            indptr, parents = parent_matrix.indptr, parent_matrix.indices
+
+            min_depth = np.ones(len(self.ids), dtype=np.int32)
+            # terms on levels above 0 have parents on lower levels
+            for start, end in zip(bounds[1:-1], bounds[2:]):
+                rows = order[start:end]
+                counts = indptr[rows + 1] - indptr[rows]
+                parent_depths = min_depth[_csr_gather(indptr, parents, rows)]
+                min_depth[rows] = np.minimum.reduceat(parent_depths, np.cumsum(counts) - counts) + 1
+            self._depths = (min_depth, levels + 1)
+        return self._depths
+
+    def closure(self):
+        """ Transitive closure of the graph: a sparse boolean (terms x terms) matrix,
+        in which row i marks term i and all its ancestors.
+        """
+        if self._closure is None:
+            n = len(self.ids)
+            levels = self.levels()
+            order = np.argsort(levels, kind='stable')
+            bounds = np.searchsorted(levels[order], np.arange(levels.max(initial=-1) + 2))
+            # rows and columns in level order, so parents of a level are in the rows above it
+            parents = self.parent_matrix()[order][:, order].tocsr()
+
+            blocks = [sp.csr_matrix((0, n), dtype=bool)]
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                above = sp.vstack(blocks, format='csr') if len(blocks) > 1 else blocks[0]
+                itself = sp.csr_matrix(
+                    (np.ones(end - start, dtype=bool), order[start:end], np.arange(end - start + 1)),
+                    shape=(end - start, n),
+                )
+                blocks = [above, (parents[start:end, :start] @ above + itself).tocsr()]
+
+            closure = sp.vstack(blocks, format='csr')[np.argsort(order)]
+            closure.sort_indices()
+            self._closure = closure
+        return self._closure
+
+    def descendant_closure(self):
+        """ Transpose of :meth:`closure`: row i marks term i and all its descendants. """
+        if self._descendant_closure is None:
+            self._descendant_closure = self.closure().T.tocsr()
+            self._descendant_closure.sort_indices()
+        return self._descendant_closure
+
+    def ancestors(self, terms):
+        """ Return sorted indices of `terms` (term indices) and all their ancestors. """
+        closure = self.closure()
+        return np.unique(_csr_gather(closure.indptr, closure.indices, terms))
+
+    def descendants(self, terms):
+        """ Return sorted indices of `terms` (term indices) and all their descendants. """
+        closure = self.descendant_closure()
+        return np.unique(_csr_gather(closure.indptr, closure.indices, terms))
+
+    def nearest(self, targets):
+        """ Map each term to the nearest `targets` (term indices) among its ancestors.
+
+        A target is nearest to a term if it can be reached from the term without passing through
+        another target; a target maps to itself. The mapping is propagated from roots to leaves,
+        one level at a time.
+
+        :return: A sparse boolean (terms x targets) matrix.
+        """
+        n = len(self.ids)
+        targets = np.asarray(targets, dtype=np.int64)
+        target_column = np.full(n, -1, dtype=np.int64)
+        target_column[targets] = np.arange(len(targets))
+
+        levels = self.levels()
+        order = np.argsort(levels, kind='stable')
+        bounds = np.searchsorted(levels[order], np.arange(levels.max(initial=-1) + 2))
+        parents = self.parent_matrix()
+
+        mapping = np.zeros((n, len(targets)), dtype=bool)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            rows = order[start:end]
+            level_parents = parents[rows]
+            used = np.unique(level_parents.indices)
+            mapping[rows] = level_parents[:, used] @ mapping[used]
+            rows = rows[target_column[rows] >= 0]
+            mapping[rows] = False
+            mapping[rows, target_column[rows]] = True
+        return sp.csr_matrix(mapping)
+
+    @classmethod
+    def from_terms(cls, terms, stanza_offsets=None, related=None):
+        """ Encode parsed :class:`Term` objects (a dict id -> term) and, optionally, their related objects. """
+        ids = list(terms)
+        index = {term_id: i for i, term_id in enumerate(ids)}
+        alias = {alt_id: index[term_id] for term_id, term in terms.items() for alt_id in term.values.get('alt_id', [])}
+
+        namespaces, relation_types, subsets = {}, {}, {}
+        names, namespace, obsolete, parents, relations, subset_codes = [], [], [], [], [], []
+        parent_indptr, subset_indptr = [0], [0]
+
+        if related is None:
+            related = [term.related_objects() for term in terms.values()]
+
+        for term, term_related in zip(terms.values(), related):
+            values = term.values
+            names.append(values.get('name', '').encode('utf-8'))
+            if 'namespace' in values:
+                namespace.append(namespaces.setdefault(values['namespace'], len(namespaces)))
+            else:
+                namespace.append(-1)
+            obsolete.append(values.get('is_obsolete') == 'true')
+
+            for type_id, parent in term_related:
+                parent = index.get(parent, alias.get(parent))
+                if parent is not None:
+                    parents.append(parent)
+                    relations.append(relation_types.setdefault(type_id, len(relation_types)))
+            parent_indptr.append(len(parents))
+
+            subset_codes.extend(subsets.setdefault(subset, len(subsets)) for subset in values.get('subset', []))
+            subset_indptr.append(len(subset_codes))
+
+        name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in names], out=name_offsets[1:])
+
+        arrays = {
+            'ids': np.array(ids, dtype=str),
+            'names': np.frombuffer(b''.join(names), dtype=np.uint8),
+            'name_offsets': name_offsets,
+            'namespace': np.array(namespace, dtype=np.int16),
+            'obsolete': np.array(obsolete, dtype=bool),
+            'stanza_offsets': np.array(
+                stanza_offsets if stanza_offsets is not None else [-1] * len(ids), dtype=np.int64
+            ),
+            'parent_indptr': np.array(parent_indptr, dtype=np.int64),
+            'parents': np.array(parents, dtype=np.int32),
+            'relations': np.array(relations, dtype=np.int16),
+            'subset_indptr': np.array(subset_indptr, dtype=np.int64),
+            'subset_codes': np.array(subset_codes, dtype=np.int16),
+            'alt_ids': np.array(list(alias), dtype=str),
+            'alt_targets': np.array(list(alias.values()), dtype=np.int32),
+        }
+        return cls(arrays, list(namespaces), list(relation_types), list(subsets))
+
+    def save(self, path, metadata):
+        metadata = dict(
+            metadata, namespaces=self.namespaces, relation_types=self.relation_types, subsets=self.subsets
+        )
+        binary_cache.write_cache(path, {name: getattr(self, name) for name in self.ARRAYS}, metadata)
+
+    @classmethod
+    def load(cls, path, source):
+        """ Load the index saved with :meth:`save`, arrays are memory mapped. Return the index and metadata. """
+        metadata = binary_cache.read_metadata(path, ONTOLOGY_CACHE_VERSION, source)
+        arrays = {name: binary_cache.read_array(path, name) for name in cls.ARRAYS}
+        return cls(arrays, metadata['namespaces'], metadata['relation_types'], metadata['subsets']), metadata
+
+    def name(self, i):
+        return self.names[self.name_offsets[i] : self.name_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def related(self, i):
+        """ Return (relation type, parent id) pairs of the i-th term. """
+        start, end = self.parent_indptr[i], self.parent_indptr[i + 1]
+        return [
+            (self.relation_types[relation], self.ids[parent])
+            for parent, relation in zip(self.parents[start:end].tolist(), self.relations[start:end].tolist())
+        ]
+
+    def related_to(self, i):
+        """ Return (relation type, child id) pairs of the i-th term. """
+        start, end = self.child_indptr[i], self.child_indptr[i + 1]
+        return [
+            (self.relation_types[relation], self.ids[child])
+            for child, relation in zip(self.children[start:end].tolist(), self.child_relations[start:end].tolist())
+        ]
+
+    def term_subsets(self, i):
+        return [self.subsets[code] for code in self.subset_codes[self.subset_indptr[i] : self.subset_indptr[i + 1]]]
+
+    def values(self, i, alt_ids):
+        """ Reconstruct tag values of the i-th term stored in the index. """
+        values = {'id': intern(str(self.ids[i])), 'name': self.name(i)}
+        if self.namespace[i] >= 0:
+            values['namespace'] = intern(self.namespaces[self.namespace[i]])
+        if alt_ids:
+            values['alt_id'] = sorted(alt_ids)
+        if self.obsolete[i]:
+            values['is_obsolete'] = 'true'
+
+        for type_id, parent in self.related(i):
+            if type_id == 'is_a':
+                values.setdefault('is_a', []).append(intern(str(parent)))
+            else:
+                values.setdefault('relationship', []).append('{} {}'.format(type_id, parent))
+
+        subsets = self.term_subsets(i)
+        if subsets:
+            values['subset'] = subsets
+        return values
+
+
+class _Terms(Mapping):
+    """ Terms of an ontology by id. :class:`Term` objects are created when first accessed.
+    """
+
+    def __init__(self, ontology, terms=None):
+        self._ontology = ontology
+        self._terms = terms if terms is not None else {}
+
+    def __getitem__(self, term_id):
+        term = self._terms.get(term_id)
+        if term is None:
+            term = self._terms[term_id] = self._ontology._make_term(self._ontology._index.index[term_id])
+        return term
+
+    def __contains__(self, term_id):
+        return term_id in self._ontology._index.index
+
+    def __iter__(self):
+        return iter(self._ontology._index.index)
+
+    def __len__(self):
+        return len(self._ontology._index)
+
+
 class Ontology:
     """
     :class:`Ontology` is the class representing a gene ontology.
@@ -229,6 +682,9 @@ class Ontology:
         A filename of an .obo formated file.
     :param progress_callback:
         Optional `float -> None` function.
+    :param bool cache:
+        Use (and create) a binary cache of the parsed ontology, stored next to the file.
+        By default, the cache is used for the ontology from serverfiles.
 
 
     Example
@@ -243,7 +699,7 @@ class Ontology:
 
     version = 1
 
-    def __init__(self, filename=None, progress_callback=None):
+    def __init__(self, filename=None, progress_callback=None, cache=None):
         self.terms = {}
         self.typedefs = {}
         self.instances = {}
@@ -252,11 +708,15 @@ class Ontology:
         self.reverse_alias_mapper = defaultdict(set)
         self.header = ""
 
+        self._index = None  # type: Optional[_OntologyIndex]
+        self._source_path = None  # type: Optional[str]
+        self._slims_cache = {}
+
         if filename is not None:
-            self.parse_file(filename, progress_callback)
+            self.parse_file(filename, progress_callback, cache=bool(cache))
         else:
             filename = serverfiles.localpath_download(DOMAIN, FILENAME_ONTOLOGY)
-            self.parse_file(filename, progress_callback)
+            self.parse_file(filename, progress_callback, cache=cache is None or cache)
 
     @classmethod
     def load(cls, progress_callback=None):
@@ -268,61 +728,150 @@ class Ontology:
         """
         filename = serverfiles.localpath_download(DOMAIN, FILENAME_ONTOLOGY)
 
-        return cls(filename, progress_callback=progress_callback)
+        return cls(filename, progress_callback=progress_callback, cache=True)
 
     Load = load
 
-    def parse_file(self, file, progress_callback=None):
+    def parse_file(self, file, progress_callback=None, cache=False):
         """
         Parse the file. file can be a filename string or an open file like
         object. The optional progressCallback will be called with a single
         argument to report on the progress.
+
+        If `cache` is True (and `file` is a path to an .obo file), the parsed ontology
+        is stored in a binary cache next to the file and loaded from it next time.
         """
+        self._slims_cache = {}
+        path = None
         if isinstance(file, str):
             if os.path.isfile(file) and tarfile.is_tarfile(file):
                 f = tarfile.open(file).extractfile("gene_ontology_edit.obo")
             elif os.path.isfile(file):
-                f = open(file)
+                path = file
             elif os.path.isdir(file):
-                f = open(os.path.join(file, "gene_ontology_edit.obo"))
+                path = os.path.join(file, "gene_ontology_edit.obo")
             else:
                 raise ValueError("Cannot open %r for parsing" % file)
         else:
             f = file
 
-        data = [line.decode() if not isinstance(line, str) else line for line in f.readlines()]
-        data = "".join([line for line in data if not line.startswith("!")])
-        self.header = data[: data.index("[Term]")]
-        c = re.compile(r"\[.+?\].*?\n\n", re.DOTALL)
-        data = c.findall(data)
-
-        milestones = progress_bar_milestones(len(data), 90)
-        for i, block in enumerate(builtin_obo_objects + data):
-            if block.startswith("[Term]"):
-                term = Term(block, self)
-                self.terms[term.id] = term
-            elif block.startswith("[Typedef]"):
-                typedef = Typedef(block, self)
-                self.typedefs[typedef.id] = typedef
-            elif block.startswith("[Instance]"):
-                instance = Instance(block, self)
-                self.instances[instance.id] = instance
-            if progress_callback and i in milestones:
-                progress_callback(90.0 * i / len(data))
+        if path is not None:
+            if cache:
+                try:
+                    self._load_cache(path)
+                    return
+                except (OSError, ValueError, KeyError):
+                    pass
+            source = binary_cache.source_key(path)
+            # newlines are not translated, so offsets of stanzas match positions in the file
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                self._parse(f, os.path.getsize(path), progress_callback)
+            self._source_path = path
+        else:
+            self._parse(f, None, progress_callback)
+
+        if cache and path is not None:
+            try:
+                self._save_cache(path, source)
+            except OSError:
+                # cache is an optimization only
+                pass
+
+    def _parse(self, f, size, progress_callback=None):
+        terms, offsets, related = {}, {}, {}
+        stanza_types = {"Term": Term, "Typedef": Typedef, "Instance": Instance}
+        self.typedefs, self.instances = {}, {}
+
+        for block in builtin_obo_objects:
+            typedef = Typedef(block, self)
+            self.typedefs[typedef.id] = typedef
+
+        stanzas = _parse_obo(f)
+        _, header = next(stanzas)
+        self.header = "".join(header)
+
+        for i, (stanza, tag_lines, offset) in enumerate(stanzas):
+            obj_type = stanza_types.get(stanza)
+            if obj_type is None:
+                continue
+            obj = obj_type(ontology=self)
+            obj._set_lines(tag_lines)
+            obj_related = obj.related_objects()
+            obj.related = set(obj_related)
+
+            if obj_type is Term:
+                terms[obj.id] = obj
+                offsets[obj.id] = offset
+                related[obj.id] = obj_related
+            elif obj_type is Typedef:
+                self.typedefs[obj.id] = obj
+            else:
+                self.instances[obj.id] = obj
+
+            if progress_callback and size and i % 1000 == 0:
+                progress_callback(90.0 * offset / size)
 
         self.alias_mapper = {}
         self.reverse_alias_mapper = defaultdict(set)
-        milestones = progress_bar_milestones(len(self.terms), 10)
-        for i, (id, term) in enumerate(six.iteritems(self.terms)):
+        milestones = progress_bar_milestones(len(terms), 10)
+        for i, (id, term) in enumerate(terms.items()):
             for type_id, parent in term.related:
-                self.terms[parent].related_to.add((type_id, id))
-            try:
-                self.alias_mapper.update([(alt_id, id) for alt_id in term.alt_id])
-                self.reverse_alias_mapper[id].update(term.alt_id)
-            except AttributeError:
-                pass
+                terms[parent].related_to.add((type_id, id))
+            alt_ids = term.values.get('alt_id', [])
+            if alt_ids:
+                self.alias_mapper.update([(alt_id, id) for alt_id in alt_ids])
+                self.reverse_alias_mapper[id].update(alt_ids)
             if progress_callback and i in milestones:
-                progress_callback(90.0 + 10.0 * i / len(self.terms))
+                progress_callback(90.0 + 10.0 * i / len(terms))
+
+        self._index = _OntologyIndex.from_terms(terms, list(offsets.values()), list(related.values()))
+        self.terms = _Terms(self, terms)
+
+    def _save_cache(self, path, source):
+        metadata = {
+            'version': ONTOLOGY_CACHE_VERSION,
+            'source': source,
+            'header': self.header,
+            'typedefs': [repr(typedef) for typedef in self.typedefs.values()],
+            'instances': [repr(instance) for instance in self.instances.values()],
+        }
+        self._index.save(path + ONTOLOGY_CACHE_SUFFIX, metadata)
+
+    def _load_cache(self, path):
+        index, metadata = _OntologyIndex.load(path + ONTOLOGY_CACHE_SUFFIX, binary_cache.source_key(path))
+
+        self._index = index
+        self._source_path = path
+        self.header = metadata['header']
+        self.typedefs = {typedef.id: typedef for typedef in (Typedef(block, self) for block in metadata['typedefs'])}
+        self.instances = {obj.id: obj for obj in (Instance(block, self) for block in metadata['instances'])}
+
+        self.alias_mapper = dict(zip(index.alt_ids.tolist(), index.ids[index.alt_targets].tolist()))
+        self.reverse_alias_mapper = defaultdict(set)
+        for alt_id, term_id in self.alias_mapper.items():
+            self.reverse_alias_mapper[term_id].add(alt_id)
+
+        self.terms = _Terms(self)
+
+    def _make_term(self, i):
+        """ Create the i-th :class:`Term` from the index. Tags that are not in the index are read from the file. """
+        term = Term(ontology=self)
+        term_id = str(self._index.ids[i])
+        term._set_lines(
+            [
+                (tag, value, "", "")
+                for tag, values in self._index.values(i, self.reverse_alias_mapper.get(term_id)).items()
+                for value in (values if isinstance(values, list) else [values])
+            ]
+        )
+        offset = int(self._index.stanza_offsets[i])
+        if offset >= 0 and self._source_path is not None:
+            term._stanza = partial(_read_stanza, self._source_path, offset)
+            term._loaded_tags = _INDEXED_TAGS
+
+        term.related = set(self._index.related(i))
+        term.related_to = set(self._index.related_to(i))
+        return term
 
     def defined_slims_subsets(self):
         """
@@ -343,7 +892,11 @@ class Ontology:
         .. seealso:: :func:`defined_slims_subsets`
 
         """
-        return [id for id, term in self.terms.items() if subset in getattr(term, "subset", set())]
+        if subset not in self._index.subsets:
+            return []
+        code = self._index.subsets.index(subset)
+        terms = np.repeat(np.arange(len(self._index)), np.diff(self._index.subset_indptr))
+        return self._index.ids[np.unique(terms[self._index.subset_codes == code])].tolist()
 
     def set_slims_subset(self, subset):
         """
@@ -369,17 +922,73 @@ class Ontology:
         :param str term: Term ID.
 
         """
-        queue = {term}
-        visited = set()
-        slims = set()
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            if term in self.slims_subset:
-                slims.add(term)
-            else:
-                queue.update({tid for _, tid in self[term].related} - visited)
-        return slims
+        i = self._term_indices([term])[0]
+        if term in self.slims_subset:
+            return {term}
+        slims, mapping = self._slims_mapping()
+        return set(slims[mapping.indices[mapping.indptr[i] : mapping.indptr[i + 1]]].tolist())
+
+    def map_to_slims(self, term_ids):
+        """
+        Return a dictionary with sets of the most specific slim term IDs for each term in `term_ids`
+        (see :func:`slims_for_term`).
+
+        Slims of all terms are computed at once, by propagating them from roots to leaves in
+        topological order, and cached for each slims subset.
+
+        :param list term_ids: A list of term IDs.
+        :rtype: :class:`dict`
+        """
+        term_ids = list(term_ids)
+        slims, mapping = self._slims_mapping()
+        rows = mapping[self._term_indices(term_ids)]
+        return {
+            term: {term} if term in self.slims_subset else set(slims[rows.indices[start:end]].tolist())
+            for term, start, end in zip(term_ids, rows.indptr[:-1].tolist(), rows.indptr[1:].tolist())
+        }
+
+    def slim_gene_counts(self, term_ids, gene_ids):
+        """
+        Return a dictionary with the number of distinct genes annotated to each slim term.
+
+        Annotations are given as two lists of equal length: annotated terms and genes. A gene counts
+        for all slims of its terms; terms that are not in the ontology are ignored.
+
+        :param list term_ids: Annotated term IDs.
+        :param list gene_ids: Annotated gene IDs.
+        :rtype: :class:`dict`
+        """
+        index, alias_mapper = self._index.index, self.alias_mapper
+        terms = np.array([index.get(alias_mapper.get(term, term), -1) for term in term_ids], dtype=np.int64)
+        genes = np.unique(np.asarray(list(gene_ids), dtype=str), return_inverse=True)[1].ravel()
+        known = terms >= 0
+        direct = sp.csr_matrix(
+            (np.ones(known.sum(), dtype=bool), (genes[known], terms[known])),
+            shape=(genes.max(initial=-1) + 1, len(self._index)),
+        )
+        return self._slim_gene_counts(direct)
+
+    def _slim_gene_counts(self, direct):
+        """ Count genes of each slim from a sparse boolean (genes x terms) matrix of annotations. """
+        slims, mapping = self._slims_mapping()
+        counts = (direct.astype(np.int32) @ mapping.astype(np.int32)).getnnz(axis=0)
+        return {slim: count for slim, count in zip(slims.tolist(), counts.tolist()) if count}
+
+    def _slims_mapping(self):
+        """ Return slim term IDs and a (terms x slims) matrix of the most specific slims of each term.
+        Mappings are cached for each slims subset.
+        """
+        subset = frozenset(self.slims_subset)
+        if subset not in self._slims_cache:
+            indices = np.array(sorted(self._index.index[term] for term in subset if term in self._index.index))
+            indices = indices.astype(np.int64)
+            self._slims_cache[subset] = (self._index.ids[indices], self._index.nearest(indices))
+        return self._slims_cache[subset]
+
+    def _term_indices(self, terms):
+        """ Return indices of `terms` (IDs or alternative IDs) in the ontology index. """
+        index, alias_mapper = self._index.index, self.alias_mapper
+        return np.array([index[alias_mapper.get(term, term)] for term in terms], dtype=np.int64)
 
     def extract_super_graph(self, terms):
         """
@@ -389,13 +998,9 @@ class Ontology:
 
         """
         terms = [terms] if isinstance(terms, str) else terms
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update({tid for _, tid in self[term].related} - visited)
-        return visited
+        parents = self._index.parent_matrix()
+        parents = _csr_gather(parents.indptr, parents.indices, self._term_indices(terms))
+        return set(terms) | set(self._index.ids[self._index.ancestors(parents)].tolist())
 
     def extract_sub_graph(self, terms):
         """
@@ -404,25 +1009,33 @@ class Ontology:
         :param list terms: A list of term IDs.
 
         """
-        terms = [terms] if type(terms) == str else terms
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update({tid for _, tid in self[term].related_to} - visited)
-        return visited
+        terms = [terms] if isinstance(terms, str) else terms
+        children = self._index.child_matrix()
+        children = _csr_gather(children.indptr, children.indices, self._term_indices(terms))
+        return set(terms) | set(self._index.ids[self._index.descendants(children)].tolist())
 
-    def term_depth(self, term, cache_={}):
+    def term_depth(self, term):
         """
         Return the minimum depth of a `term`.
 
         (length of the shortest path to this term from the top level term).
 
         """
-        if term not in cache_:
-            cache_[term] = min([self.term_depth(parent) + 1 for _, parent in self[term].related] or [1])
-        return cache_[term]
+        return int(self.term_depths([term])[0])
+
+    def term_depths(self, terms, maximum=False):
+        """
+        Return an array of minimum (or maximum) depths of `terms`.
+
+        Depths of all terms are computed once per ontology, in topological order.
+
+        :param list terms: A list of term IDs.
+        :param bool maximum: Return lengths of the longest instead of the shortest paths from the top level term.
+        :rtype: :class:`numpy.ndarray`
+
+        """
+        min_depth, max_depth = self._index.depths()
+        return (max_depth if maximum else min_depth)[self._term_indices(terms)]
 
     def __getitem__(self, termid):
         """
@@ -458,6 +1071,58 @@ class Ontology:
         return termid in self.terms or termid in self.alias_mapper
 
 
+#: Aspects of annotations, in the order of their codes in columnar annotation arrays
+ASPECTS = ('Process', 'Function', 'Component')
+
+# Approximate size (in bytes) of a batch of lines read from an annotations file
+ANNOTATIONS_BATCH_SIZE = 1 << 22
+
+# Parsed annotations are cached next to the annotations file, in a '<file>.tab.cache' directory.
+ANNOTATIONS_CACHE_SUFFIX = '.cache'
+ANNOTATIONS_CACHE_VERSION = 1
+
+# Fields with sorted tables of distinct values (which can be searched), other fields are stored in string tables
+_SORTED_FIELDS = ('gene_id', 'go_id', 'evidence')
+
+class _StringTable:
+    """ A table of strings, stored as a single utf-8 encoded buffer and offsets of strings in it. """
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def tolist(self):
+        data, offsets = self.buffer.tobytes(), self.offsets.tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _encode_column(values, sort=False):
+    """ Encode strings as integer codes into a table of distinct values.
+
+    Return codes and, if `sort` is True, a sorted array of distinct values, otherwise a :class:`_StringTable`.
+    """
+    table = {}
+    codes = np.fromiter((table.setdefault(value, len(table)) for value in values), dtype=np.int32, count=len(values))
+    if not sort:
+        return codes, _StringTable.from_strings(list(table))
+
+    distinct = np.array(list(table), dtype=str)
+    order = np.argsort(distinct, kind='stable')
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order))
+    return rank[codes], distinct[order]
+
+
 annotation_fields = ["tax_id", "gene_id", "go_id", "evidence", "qualifier", "go_term", "pubMed", "aspect"]
 
 
@@ -495,25 +1160,30 @@ class Annotations:
 
     """
 
-    def __init__(self, organism, ontology=None, progress_callback=None, filename=None):
-        #: A dictionary mapping a gene (gene_id) to a set of all annotations of that gene.
-        self.gene_annotations = defaultdict(list)
-
-        #: A dictionary mapping a GO term id to a set of annotations that are directly annotated to that term
-        self.term_anotations = defaultdict(list)
+    def __init__(self, organism, ontology=None, progress_callback=None, filename=None, cache=None):
+        # Annotations are held as a list of records (with indices by gene and term) and/or in columnar
+        # form; each is created from the other when needed.
+        self._records = []
+        self._gene_annotations = defaultdict(list)
+        self._term_anotations = defaultdict(list)
+        self._columns = None
+        self._tables = None
 
         self.all_annotations = defaultdict(list)
+        self._direct = None
+        self._matrices = {}
+        self._information_content = {}
+        self._terms = None
 
         self._gene_names = None
         self._gene_names_dict = None
 
-        #: A list of all :class:`AnnotationRecords` instances.
-        self.annotations = []
         self.header = ''
         self.taxid = organism
 
         self._ontology = ontology
 
+        source = None
         if filename is None:
             try:
                 filename = serverfiles.localpath_download(
@@ -522,8 +1192,49 @@ class Annotations:
             except FileNotFoundError:
                 raise taxonomy.UnknownSpeciesIdentifier(organism)
 
+            cache = cache is None or cache
+            if cache:
+                try:
+                    info = serverfiles.info(DOMAIN, FILENAME_ANNOTATION.format(organism))
+                    source = '{}|{}'.format(info.get('datetime'), binary_cache.source_key(filename))
+                except (OSError, ValueError):
+                    pass
+
+        if cache:
+            source = source or binary_cache.source_key(filename)
+            try:
+                self._load_cache(filename + ANNOTATIONS_CACHE_SUFFIX, source)
+                return
+            except (OSError, ValueError, KeyError):
+                pass
+
         self._parse_file(filename)
 
+        if cache:
+            try:
+                self._save_cache(filename + ANNOTATIONS_CACHE_SUFFIX, source)
+            except OSError:
+                # cache is an optimization only
+                pass
+
+    @property
+    def annotations(self):
+        """ A list of all :class:`AnnotationRecords` instances. """
+        self._materialize()
+        return self._records
+
+    @property
+    def gene_annotations(self):
+        """ A dictionary mapping a gene (gene_id) to a set of all annotations of that gene. """
+        self._materialize()
+        return self._gene_annotations
+
+    @property
+    def term_anotations(self):
+        """ A dictionary mapping a GO term id to a set of annotations that are directly annotated to that term. """
+        self._materialize()
+        return self._term_anotations
+
     @property
     def ontology(self):
         return self._ontology
@@ -532,7 +1243,7 @@ class Annotations:
     def ontology(self, ontology):
         """ Set the ontology to use in the annotations mapping.
         """
-        self.all_annotations = defaultdict(list)
+        self._invalidate()
         self._ontology = ontology
 
     def _ensure_ontology(self):
@@ -540,26 +1251,170 @@ class Annotations:
             self.ontology = Ontology()
 
     def _parse_file(self, file_path):
-
         with open(file_path, 'r') as anno_file:
             self.header = anno_file.readline()
 
-            for line in anno_file.readlines():
-                self.add_annotation(AnnotationRecord.from_string(line))
+            while True:
+                lines = anno_file.readlines(ANNOTATIONS_BATCH_SIZE)
+                if not lines:
+                    break
+                self._add_records(map(AnnotationRecord.from_string, lines))
 
-    def add_annotation(self, a):
-        """ Add a single :class:`AnotationRecord` instance to this object.
+    def _add_records(self, records):
+        """ Add :class:`AnnotationRecord` instances in bulk. Derived caches are invalidated once per call.
         """
-        if not isinstance(a, AnnotationRecord):
-            a = AnnotationRecord(a)
-        if not a.gene_id or not a.go_id or a.qualifier == 'NOT':
+        self._materialize()
+        gene_annotations, term_anotations = self._gene_annotations, self._term_anotations
+        added = [a for a in records if a.gene_id and a.go_id and a.qualifier != 'NOT']
+        for a in added:
+            gene_annotations[a.gene_id].append(a)
+            term_anotations[a.go_id].append(a)
+        self._records.extend(added)
+        self._columns = self._tables = None
+        self._invalidate()
+
+    def _materialize(self):
+        """ Create annotation records from columns (e.g. of annotations loaded from the cache). """
+        if self._records is not None:
             return
 
-        self.gene_annotations[a.gene_id].append(a)
-        self.term_anotations[a.go_id].append(a)
+        fields = []
+        for field in annotation_fields:
+            values = self._tables[field].tolist()
+            fields.append(list(map(values.__getitem__, self._columns[field].tolist())))
+        records = list(map(AnnotationRecord._make, zip(*fields)))
+
+        gene_annotations, term_anotations = defaultdict(list), defaultdict(list)
+        for a in records:
+            gene_annotations[a.gene_id].append(a)
+            term_anotations[a.go_id].append(a)
+        self._records, self._gene_annotations, self._term_anotations = records, gene_annotations, term_anotations
 
-        self.annotations.append(a)
+    def _invalidate(self):
+        """ Discard data derived from annotations (and the ontology). """
         self.all_annotations = defaultdict(list)
+        self._direct = None
+        self._matrices = {}
+        self._information_content = {}
+        self._terms = None
+
+    def _annotation_columns(self):
+        """ Return annotations in columnar form: a dict of arrays with codes of each field of
+        :class:`AnnotationRecord` (indices into tables of distinct values, see :meth:`_annotation_tables`),
+        ``evidence_bits`` (a bit from :obj:`evidence_dict` for each annotation) and ``aspect_index``
+        (an index into :obj:`ASPECTS`, -1 for unknown aspects).
+        """
+        if self._columns is None:
+            columns, tables = {}, {}
+            for field in annotation_fields:
+                values = [getattr(a, field) for a in self._records]
+                columns[field], tables[field] = _encode_column(values, sort=field in _SORTED_FIELDS)
+
+            # codes that are not in evidence_dict have no bit, these can only be matched by name
+            bits = np.array([evidence_dict.get(code, 0) for code in tables['evidence'].tolist()], dtype=np.int64)
+            columns['evidence_bits'] = bits[columns['evidence']]
+
+            aspects = [ASPECTS.index(aspect) if aspect in ASPECTS else -1 for aspect in tables['aspect'].tolist()]
+            columns['aspect_index'] = np.array(aspects, dtype=np.int8)[columns['aspect']]
+
+            self._columns, self._tables = columns, tables
+        return self._columns
+
+    def _annotation_tables(self):
+        """ Return tables of distinct values of each field, indexed by codes in :meth:`_annotation_columns`.
+        Tables of gene IDs, GO IDs and evidence codes are sorted arrays.
+        """
+        self._annotation_columns()
+        return self._tables
+
+    def _save_cache(self, path, source):
+        """ Save annotations in columnar form into directory `path`. """
+        columns, tables = self._annotation_columns(), self._annotation_tables()
+        arrays = dict(columns)
+        for field, table in tables.items():
+            if isinstance(table, _StringTable):
+                arrays[field + '.buffer'], arrays[field + '.offsets'] = table.buffer, table.offsets
+            else:
+                arrays[field + '.table'] = table
+
+        metadata = {
+            'version': ANNOTATIONS_CACHE_VERSION,
+            'source': source,
+            'header': self.header,
+            'columns': list(columns),
+        }
+        binary_cache.write_cache(path, arrays, metadata)
+
+    def _load_cache(self, path, source):
+        """ Load annotations saved with :meth:`_save_cache`. Arrays are memory mapped,
+        annotation records are created only when needed.
+        """
+        metadata = binary_cache.read_metadata(path, ANNOTATIONS_CACHE_VERSION, source)
+
+        def load(name):
+            return binary_cache.read_array(path, name)
+
+        columns = {name: load(name) for name in metadata['columns']}
+        tables = {
+            field: load(field + '.table')
+            if field in _SORTED_FIELDS
+            else _StringTable(load(field + '.buffer'), load(field + '.offsets'))
+            for field in annotation_fields
+        }
+
+        self.header = metadata['header']
+        self._columns, self._tables = columns, tables
+        self._records = self._gene_annotations = self._term_anotations = None
+        self._invalidate()
+
+    def _select(self, evidence_codes=None, aspects=None):
+        """ Return a mask of annotations with any of `evidence_codes` and `aspects` (all if None).
+
+        Evidence codes are matched with a single bitwise AND of their combined bits.
+        """
+        columns = self._annotation_columns()
+        evidence_codes = set(evidence_codes or evidence_dict.keys())
+
+        bits = 0
+        for code in evidence_codes:
+            bits |= evidence_dict.get(code, 0)
+        mask = (columns['evidence_bits'] & bits) != 0
+
+        unknown = [code for code in evidence_codes if not evidence_dict.get(code)]
+        if unknown:
+            codes = np.flatnonzero(np.isin(self._annotation_tables()['evidence'], unknown))
+            mask |= np.isin(columns['evidence'], codes)
+
+        if aspects is not None:
+            aspects = [ASPECTS.index(aspect) for aspect in aspects if aspect in ASPECTS]
+            mask &= np.isin(columns['aspect_index'], aspects)
+        return mask
+
+    def _gene_codes(self, genes):
+        """ Return codes of `genes` (gene IDs) that have annotations. """
+        gene_ids = self._annotation_tables()['gene_id']
+        genes = np.array([gene for gene in genes if isinstance(gene, str)], dtype=str)
+        if not len(gene_ids) or not len(genes):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.searchsorted(gene_ids, genes)
+        positions[positions == len(gene_ids)] = 0
+        return np.unique(positions[gene_ids[positions] == genes])
+
+    def _annotation_terms(self):
+        """ Return the index of the annotated term in the ontology index for each annotation (-1 if unknown). """
+        if self._terms is None:
+            index, alias_mapper = self.ontology._index.index, self.ontology.alias_mapper
+            go_ids = self._annotation_tables()['go_id'].tolist()
+            terms = np.array([index.get(alias_mapper.get(go_id, go_id), -1) for go_id in go_ids], dtype=np.int64)
+            self._terms = terms[self._annotation_columns()['go_id']]
+        return self._terms
+
+    def add_annotation(self, a):
+        """ Add a single :class:`AnotationRecord` instance to this object.
+        """
+        if not isinstance(a, AnnotationRecord):
+            a = AnnotationRecord(a)
+        self._add_records([a])
 
     def get_genes_with_known_annotation(self, genes):
         """ Return only genes with known annotation
@@ -567,28 +1422,8 @@ class Annotations:
         :param genes: List of genes
 
         """
-        return {gene for gene in genes if self.gene_annotations[gene]}
-
-    def _collect_annotations(self, go_id, visited):
-        """ Recursive function collects and caches all annotations for id
-        """
-        if go_id not in self.all_annotations and go_id not in visited:
-            if go_id in self.ontology.reverse_alias_mapper:
-                annotations = [
-                    self.term_anotations.get(alt_id, []) for alt_id in self.ontology.reverse_alias_mapper[go_id]
-                ] + [self.term_anotations[go_id]]
-            else:
-                annotations = [self.term_anotations[go_id]]  # annotations for this term alone
-            visited.add(go_id)
-
-            for type_id, child in self.ontology[go_id].related_to:
-                aa = self._collect_annotations(child, visited)
-                if type(aa) == set:
-                    annotations.append(aa)  # if it was already reduced in get_all_annotations
-                else:
-                    annotations.extend(aa)
-            self.all_annotations[go_id] = annotations
-        return self.all_annotations[go_id]
+        known = self.genes()
+        return {gene for gene in genes if gene in known}
 
     def get_annotations_by_go_id(self, go_id):
         """ Return a set of all annotations (instances of :obj:`AnnotationRecord`)
@@ -599,13 +1434,31 @@ class Annotations:
         """
         self._ensure_ontology()
         id = self.ontology.alias_mapper.get(go_id, go_id)
-        if id not in self.all_annotations or type(self.all_annotations[id]) == list:
+        if id not in self.all_annotations:
+            direct, annotated = self._direct_annotations()
+            subterms = self.ontology._index.descendants(self.ontology._term_indices([id]))
             annot_set = set()
-            for annots in self._collect_annotations(id, set()):
-                annot_set.update(annots)
+            for i in subterms[annotated[subterms]].tolist():
+                annot_set.update(direct[i])
             self.all_annotations[id] = annot_set
         return self.all_annotations[id]
 
+    def _direct_annotations(self):
+        """ Return a dict of annotations directly annotated to each term (by index of the term in the
+        ontology, including annotations of its alternative IDs), and a mask of annotated terms.
+        """
+        if self._direct is None:
+            index, alias_mapper = self.ontology._index.index, self.ontology.alias_mapper
+            direct = defaultdict(list)
+            for go_id, annotations in self.term_anotations.items():
+                i = index.get(alias_mapper.get(go_id, go_id))
+                if i is not None and annotations:
+                    direct[i].extend(annotations)
+            annotated = np.zeros(len(index), dtype=bool)
+            annotated[list(direct)] = True
+            self._direct = (direct, annotated)
+        return self._direct
+
     def get_genes_by_go_term(self, go_id, evidence_codes=None):
         """ Return a list of genes annotated by specified `evidence_codes`
         to GO term 'id' and all it's subterms."
@@ -616,12 +1469,14 @@ class Annotations:
                List of evidence codes to consider when matching annotations to terms.
 
         """
-        evidence_codes = set(evidence_codes or evidence_dict.keys())
-        annotations = self.get_annotations_by_go_id(go_id)
-        return list({int(ann.gene_id) for ann in annotations if ann.evidence in evidence_codes})
+        self._ensure_ontology()
+        subterms = self.ontology._index.descendants(self.ontology._term_indices([go_id]))
+        mask = self._select(evidence_codes) & np.isin(self._annotation_terms(), subterms)
+        gene_codes = np.unique(self._annotation_columns()['gene_id'][mask])
+        return [int(gene_id) for gene_id in self._annotation_tables()['gene_id'][gene_codes].tolist()]
 
     def genes(self):
-        return {ann.gene_id for ann in self.annotations}
+        return set(self._annotation_tables()['gene_id'].tolist())
 
     def get_enriched_terms(
         self,
@@ -650,8 +1505,46 @@ class Annotations:
         :param use_fdr:
         :param progress_callback:
         """
+        return self.get_enriched_terms_many(
+            [genes],
+            reference,
+            evidence_codes,
+            slims_only=slims_only,
+            aspect=aspect,
+            prob=prob,
+            use_fdr=use_fdr,
+            progress_callback=progress_callback,
+        )[0]
+
+    def get_enriched_terms_many(
+        self,
+        gene_lists,
+        reference=None,
+        evidence_codes=None,
+        slims_only=False,
+        aspect=None,
+        prob=statistics.Binomial(),
+        use_fdr=True,
+        progress_callback=None,
+    ):
+        """
+        Return enriched terms for each list of genes, in the format of :func:`get_enriched_terms`.
+
+        Gene lists (e.g. clusters) are enriched against the same reference: reference counts
+        are computed once and query counts of all lists with a single sparse matrix product.
+        P-Values are FDR adjusted within each list if use_fdr is True (default).
 
-        all_genes = set(genes)
+        :param gene_lists: A list of lists of genes
+        :param reference: List of genes (if None all genes included in the annotations will be used).
+        :param evidence_codes:  List of evidence codes to consider.
+        :param slims_only: If `True` return only slim terms.
+        :param aspect: Which aspects to use, see :func:`get_enriched_terms`.
+        :param prob:
+        :param use_fdr:
+        :param progress_callback:
+        :rtype: :class:`list` of :class:`dict`
+        """
+        gene_lists = [list(genes) for genes in gene_lists]
 
         if aspect is None:
             aspects_set = {'Process', 'Component', 'Function'}
@@ -662,25 +1555,9 @@ class Annotations:
 
         if reference is None:
             reference = self.genes()
+        reference = set(reference)
 
         evidence_codes = set(evidence_codes or evidence_dict.keys())
-        annotations = [
-            ann
-            for gene in genes
-            for ann in self.gene_annotations[gene]
-            if ann.evidence in evidence_codes and ann.aspect in aspects_set
-        ]
-
-        ref_annotations = {
-            ann
-            for gene in reference
-            for ann in self.gene_annotations[gene]
-            if ann.evidence in evidence_codes and ann.aspect in aspects_set
-        }
-
-        annotations_dict = defaultdict(set)
-        for ann in annotations:
-            annotations_dict[ann.go_id].add(ann)
 
         self._ensure_ontology()
 
@@ -688,49 +1565,289 @@ class Annotations:
             warnings.warn("Unspecified slims subset in the ontology! " "Using 'goslim_generic' subset", UserWarning)
             self.ontology.set_slims_subset('goslim_generic')
 
-        terms = annotations_dict.keys()
-        filtered_terms = [term for term in terms if term in self.ontology]
-
-        if len(terms) != len(filtered_terms):
-            term_diff = set(terms) - set(filtered_terms)
+        columns, tables = self._annotation_columns(), self._annotation_tables()
+        query_codes = self._gene_codes({gene for genes in gene_lists for gene in genes})
+        selected = self._select(evidence_codes, aspects_set) & np.isin(columns['gene_id'], query_codes)
+        term_diff = set(tables['go_id'][columns['go_id'][selected & (self._annotation_terms() < 0)]].tolist())
+        if term_diff:
             warnings.warn(
                 "%s terms in the annotations were not found in the " "ontology." % ",".join(map(repr, term_diff)),
                 UserWarning,
             )
 
-        terms = self.ontology.extract_super_graph(filtered_terms)
-        res = {}
+        gene_ids, matrix = self._annotation_matrix(evidence_codes, aspects_set)
+        gene_rows = dict(zip(gene_ids, range(len(gene_ids))))
+
+        # (lists x genes) indicator matrix of query genes
+        rows = [sorted({gene_rows[gene] for gene in genes if gene in gene_rows}) for genes in gene_lists]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=indptr[1:])
+        indices = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=indptr[-1])
+        queries = sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(len(rows), len(gene_ids)))
+
+        in_reference = np.zeros(len(gene_ids), dtype=bool)
+        in_reference[[gene_rows[gene] for gene in reference if gene in gene_rows]] = True
+        mapped = queries.multiply(in_reference[np.newaxis, :]).tocsr()
+        mapped.eliminate_zeros()
+
+        # terms annotated to query genes (directly or through their subterms) are tested
+        annotated = (queries @ matrix).tocsr()
+        mapped_counts = (mapped.astype(np.int32) @ matrix.astype(np.int32)).toarray()
+        reference_counts = matrix.T @ in_reference.astype(np.int64)
+
+        if slims_only:
+            slims = self.ontology._term_indices(term for term in self.ontology.slims_subset if term in self.ontology)
+
+        candidates = []
+        for i in range(len(gene_lists)):
+            terms = np.sort(annotated.indices[annotated.indptr[i] : annotated.indptr[i + 1]])
+            candidates.append(np.intersect1d(terms, slims) if slims_only else terms)
+
+        # p-values of all lists in one call
+        sizes = [len(terms) for terms in candidates]
+        p_values = self._p_values(
+            prob,
+            np.concatenate([mapped_counts[i, terms] for i, terms in enumerate(candidates)] + [[]]),
+            len(reference),
+            np.concatenate([reference_counts[terms] for terms in candidates] + [[]]),
+            np.repeat([len(genes) for genes in gene_lists], sizes),
+        )
+        p_values = np.split(p_values, np.cumsum(sizes)[:-1])
+
+        term_ids = self.ontology._index.ids
+        results = []
+        for i, terms in enumerate(candidates):
+            p = p_values[i]
+            # terms are listed by increasing p-value if p-values are FDR adjusted
+            order = np.argsort(p, kind='stable') if use_fdr else np.arange(len(terms))
+            terms, p = terms[order], p[order]
+            if use_fdr:
+                p = np.asarray(statistics.FDR(p, ordered=True), dtype=float)
+
+            # mapped genes of each term are query genes in the reference annotated to the term
+            mapped_rows = mapped.indices[mapped.indptr[i] : mapped.indptr[i + 1]]
+            mapped_genes = [gene_ids[row] for row in mapped_rows.tolist()]
+            term_genes = matrix[mapped_rows][:, terms].tocsc()
+            genes_indptr, genes_indices = term_genes.indptr.tolist(), term_genes.indices.tolist()
+
+            results.append(
+                {
+                    term: (
+                        [mapped_genes[k] for k in genes_indices[genes_indptr[j] : genes_indptr[j + 1]]],
+                        p_value,
+                        reference_count,
+                    )
+                    for j, (term, p_value, reference_count) in enumerate(
+                        zip(term_ids[terms].tolist(), p.tolist(), reference_counts[terms].tolist())
+                    )
+                }
+            )
 
-        milestones = progress_bar_milestones(len(terms), 100)
+            if progress_callback:
+                progress_callback(100.0 * (i + 1) / len(candidates))
+        return results
 
-        for i, term in enumerate(terms):
-            if slims_only and term not in self.ontology.slims_subset:
-                continue
-            all_annotations = self.get_annotations_by_go_id(term).intersection(ref_annotations)
-            all_annotated_genes = {ann.gene_id for ann in all_annotations}
-            mapped_genes = all_genes.intersection(all_annotated_genes)
+    def get_enriched_terms_topology(
+        self,
+        genes,
+        reference=None,
+        method=topology.TOPOLOGY_ELIM,
+        evidence_codes=None,
+        aspect=None,
+        prob=statistics.Hypergeometric(),
+        cutoff=0.01,
+    ):
+        """
+        Return enriched terms in the format of :func:`get_enriched_terms`, with significance of terms
+        decorrelated by the topology of the ontology (see :mod:`orangecontrib.bioinformatics.go.topology`).
 
-            if len(reference) > len(all_annotated_genes):
-                mapped_reference_genes = reference.intersection(all_annotated_genes)
-            else:
-                mapped_reference_genes = all_annotated_genes.intersection(reference)
+        Listed genes and reference counts are those used in the test of each term (e.g. genes that were
+        not eliminated by significant subterms). P-values are not FDR adjusted.
 
-            res[term] = (
-                [gene for gene in mapped_genes],
-                prob.p_value(len(mapped_genes), len(reference), len(mapped_reference_genes), len(genes)),
-                len(mapped_reference_genes),
-            )
+        :param genes: List of genes
+        :param reference: List of genes (if None all genes included in the annotations will be used).
+        :param method: ``'elim'``, ``'weight'``, ``'parent-child-union'`` or ``'parent-child-intersection'``
+        :param evidence_codes:  List of evidence codes to consider.
+        :param aspect: Which aspects to use, see :func:`get_enriched_terms`.
+        :param prob: A distribution with vectorized ``p_values`` (:class:`statistics.Hypergeometric`
+                     or :class:`statistics.Binomial`).
+        :param cutoff: The significance level used by the elim method.
+        """
+        if method not in topology.TOPOLOGY_METHODS:
+            raise ValueError('Unknown method {}, use one of {}'.format(method, topology.TOPOLOGY_METHODS))
 
-            if progress_callback and i in milestones:
-                progress_callback(100.0 * i / len(terms))
+        aspects_set, evidence_codes = self._aspects_and_codes(aspect, evidence_codes)
+        genes = set(genes)
+        reference = set(self.genes() if reference is None else reference)
+
+        self._ensure_ontology()
+        index = self.ontology._index
+        gene_ids, matrix = self._annotation_matrix(evidence_codes, aspects_set)
+
+        rows = np.array([i for i, gene in enumerate(gene_ids) if gene in reference], dtype=np.int64)
+        query = np.array([gene_ids[i] in genes for i in rows.tolist()], dtype=bool)
+        matrix = matrix[rows]
+
+        # terms annotated to query genes are closed under ancestors, genes from other terms are never counted
+        terms = np.flatnonzero(matrix[query].getnnz(axis=0))
+        matrix = matrix[:, terms].tocsc()
+        n, N = len(genes), len(reference)  # noqa: N806
+
+        if method == topology.TOPOLOGY_ELIM:
+            closure = index.closure()[terms][:, terms].tocsr()
+            k, m, p_values, counted = topology.elim(matrix, query, index.levels()[terms], closure, n, N, prob, cutoff)
+        elif method == topology.TOPOLOGY_WEIGHT:
+            parents = index.parent_matrix()[terms][:, terms].tocsr()
+            k, m, p_values, counted = topology.weight(matrix, query, index.levels()[terms], parents, n, N, prob)
+        else:
+            intersection = method == topology.TOPOLOGY_PARENT_CHILD_INTERSECTION
+            parents = index.parent_matrix()[terms][:, terms].tocsr()
+            k, m, p_values, counted = topology.parent_child(matrix, query, parents, n, N, prob, intersection)
+
+        counted = sp.csc_matrix(counted[query])
+        query_genes = [gene_ids[i] for i in rows[query].tolist()]
+        indptr, indices = counted.indptr.tolist(), counted.indices.tolist()
+        m = np.rint(m).astype(np.int64).tolist()
+        return {
+            term: ([query_genes[g] for g in indices[indptr[j] : indptr[j + 1]]], p_value, m[j])
+            for j, (term, p_value) in enumerate(zip(index.ids[terms].tolist(), p_values.tolist()))
+        }
+
+    @staticmethod
+    def _p_values(prob, k, N, m, n):  # noqa: N803
+        """ Compute p-values of all terms at once if `prob` supports it. """
+        if hasattr(prob, 'p_values'):
+            return np.asarray(prob.p_values(k, N, m, n), dtype=float)
+        return np.array([prob.p_value(int(k_), N, int(m_), n) for k_, m_ in zip(k, m)], dtype=float)
 
-        if use_fdr:
-            res = sorted(res.items(), key=lambda x: x[1][1])
-            res = {
-                id: (genes, p, ref)
-                for (id, (genes, _, ref)), p in zip(res, statistics.FDR([p for _, (_, p, _) in res]))
-            }
-        return res
+    def _annotation_matrix(self, evidence_codes, aspects):
+        """ Return annotated genes and a sparse boolean (genes x terms) matrix of their annotations,
+        propagated to all ancestors of annotated terms. Columns correspond to terms in the ontology index.
+
+        Matrices are cached for each combination of evidence codes and aspects.
+        """
+        key = (frozenset(evidence_codes), frozenset(aspects))
+        if key not in self._matrices:
+            gene_ids, direct = self._direct_matrix(evidence_codes, aspects)
+            self._matrices[key] = (gene_ids, (direct @ self.ontology._index.closure()).tocsr())
+        return self._matrices[key]
+
+    def _direct_matrix(self, evidence_codes, aspects):
+        """ Return annotated genes and a sparse boolean (genes x terms) matrix of their direct annotations. """
+        selected = self._select(evidence_codes, aspects) & (self._annotation_terms() >= 0)
+        gene_codes, rows = np.unique(self._annotation_columns()['gene_id'][selected], return_inverse=True)
+        direct = sp.csr_matrix(
+            (np.ones(len(rows), dtype=bool), (rows.ravel(), self._annotation_terms()[selected])),
+            shape=(len(gene_codes), len(self.ontology._index)),
+        )
+        return self._annotation_tables()['gene_id'][gene_codes].tolist(), direct
+
+    def get_slim_gene_counts(self, evidence_codes=None, aspect=None):
+        """
+        Return a dictionary with the number of genes annotated to each slim term of the ontology's
+        slims subset (see :func:`Ontology.map_to_slims`).
+
+        :param evidence_codes: List of evidence codes to consider.
+        :param aspect: Which aspects to use, see :func:`get_enriched_terms`.
+        """
+        self._ensure_ontology()
+        aspects, evidence_codes = self._aspects_and_codes(aspect, evidence_codes)
+        return self.ontology._slim_gene_counts(self._direct_matrix(evidence_codes, aspects)[1])
+
+    def _aspects_and_codes(self, aspect, evidence_codes):
+        if aspect is None:
+            aspects = set(ASPECTS)
+        elif isinstance(aspect, str):
+            aspects = {aspect}
+        else:
+            aspects = set(aspect)
+        return aspects, set(evidence_codes or evidence_dict.keys())
+
+    def _ic(self, evidence_codes, aspects):
+        """ Information content of all terms in the ontology index (cached). """
+        key = (frozenset(evidence_codes), frozenset(aspects))
+        if key not in self._information_content:
+            _, matrix = self._annotation_matrix(evidence_codes, aspects)
+            counts = matrix.getnnz(axis=0)
+            self._information_content[key] = similarity.information_content(counts, self.ontology._index.namespace)
+        return self._information_content[key]
+
+    def information_content(self, evidence_codes=None, aspect=None):
+        """ Return a dictionary of information content of annotated terms.
+
+        Information content of a term is ``-log(p)``, where `p` is the proportion of genes annotated
+        to the term (or its subterms) among genes annotated to the root of its namespace.
+
+        :param evidence_codes: List of evidence codes to consider.
+        :param aspect: Which aspects to use, see :func:`get_enriched_terms`.
+        """
+        self._ensure_ontology()
+        aspects, evidence_codes = self._aspects_and_codes(aspect, evidence_codes)
+        ic = self._ic(evidence_codes, aspects)
+        terms = np.flatnonzero(~np.isnan(ic))
+        return dict(zip(self.ontology._index.ids[terms].tolist(), ic[terms].tolist()))
+
+    def term_similarity(
+        self, terms1, terms2=None, measure=similarity.SIMILARITY_RESNIK, evidence_codes=None, aspect=None
+    ):
+        """ Return a matrix (terms1 x terms2) of semantic similarities between GO terms.
+
+        :param terms1: List of term ids.
+        :param terms2: List of term ids (`terms1` if None).
+        :param measure: ``'resnik'``, ``'lin'`` or ``'jiang'``, see :mod:`orangecontrib.bioinformatics.go.similarity`
+        :param evidence_codes: Evidence codes of annotations used to compute information content.
+        :param aspect: Aspects of annotations used to compute information content.
+        :rtype: :class:`numpy.ndarray`
+        """
+        self._ensure_ontology()
+        aspects, evidence_codes = self._aspects_and_codes(aspect, evidence_codes)
+        ic = self._ic(evidence_codes, aspects)
+        rows = self.ontology._term_indices(terms1)
+        columns = rows if terms2 is None else self.ontology._term_indices(terms2)
+        return similarity.term_similarity(self.ontology._index.closure(), ic, rows, columns, measure)
+
+    def gene_similarity(
+        self,
+        genes,
+        measure=similarity.SIMILARITY_RESNIK,
+        evidence_codes=None,
+        aspect='Process',
+        chunk_size=64,
+        max_workers=None,
+    ):
+        """ Return a matrix (genes x genes) of best-match average similarities of terms annotated to genes.
+
+        Rows and columns of genes without annotations are `nan`.
+
+        :param genes: List of genes
+        :param measure: ``'resnik'``, ``'lin'`` or ``'jiang'``, see :mod:`orangecontrib.bioinformatics.go.similarity`
+        :param evidence_codes: List of evidence codes to consider.
+        :param aspect: Which aspects to use (biological process by default), see :func:`get_enriched_terms`.
+        :param chunk_size: The number of terms processed at once.
+        :param max_workers: The maximum number of processes.
+        :rtype: :class:`numpy.ndarray`
+        """
+        self._ensure_ontology()
+        aspects, evidence_codes = self._aspects_and_codes(aspect, evidence_codes)
+        gene_ids, direct = self._direct_matrix(evidence_codes, aspects)
+        gene_rows = dict(zip(gene_ids, range(len(gene_ids))))
+
+        genes = list(genes)
+        found = np.array([gene in gene_rows for gene in genes], dtype=bool)
+        rows = np.array([gene_rows[gene] for gene in genes if gene in gene_rows], dtype=np.int64)
+
+        matrix = np.full((len(genes), len(genes)), np.nan, dtype=np.float32)
+        if len(rows):
+            found = np.flatnonzero(found)
+            matrix[np.ix_(found, found)] = similarity.gene_similarity(
+                direct[rows],
+                self.ontology._index.closure(),
+                self._ic(evidence_codes, aspects),
+                measure,
+                chunk_size=chunk_size,
+                max_workers=max_workers,
+            )
+        return matrix
 
     def get_annotated_terms(self, genes, direct_annotation_only=False, evidence_codes=None, progress_callback=None):
         """ Return all terms that are annotated by genes with evidence_codes.
@@ -739,28 +1856,43 @@ class Annotations:
         genes = [genes] if type(genes) == str else genes
         genes = {gene for gene in genes}
 
-        evidence_codes = set(evidence_codes or evidence_dict.keys())
-        annotations = [ann for gene in genes for ann in self.gene_annotations[gene] if ann.evidence in evidence_codes]
+        columns, tables = self._annotation_columns(), self._annotation_tables()
+        selected = np.flatnonzero(self._select(evidence_codes) & np.isin(columns['gene_id'], self._gene_codes(genes)))
 
         dd = defaultdict(set)
-        for ann in annotations:
-            dd[ann.go_id].add(ann.gene_id)
+        go_ids, gene_ids = tables['go_id'][columns['go_id'][selected]], tables['gene_id'][columns['gene_id'][selected]]
+        for go_id, gene_id in zip(go_ids.tolist(), gene_ids.tolist()):
+            dd[go_id].add(gene_id)
 
         if not direct_annotation_only:
             self._ensure_ontology()
             terms = dd.keys()
-            filtered_terms = [term for term in terms if term in self.ontology]
-            if len(terms) != len(filtered_terms):
-                term_diff = set(terms) - set(filtered_terms)
+            term_diff = {term for term in terms if term not in self.ontology}
+            if term_diff:
                 warnings.warn(
                     "%s terms in the annotations were not found in the " "ontology." % ",".join(map(repr, term_diff)),
                     UserWarning,
                 )
 
-            terms = self.ontology.extract_super_graph(filtered_terms)
-            for i, term in enumerate(terms):
-                term_annotations = self.get_annotations_by_go_id(term).intersection(annotations)
-                dd[term].update([ann.gene_id for ann in term_annotations])
+            # propagate annotations of selected genes to all ancestors of annotated terms
+            term_columns = self._annotation_terms()[selected]
+            known = term_columns >= 0
+            gene_codes, rows = np.unique(columns['gene_id'][selected][known], return_inverse=True)
+            gene_ids = tables['gene_id'][gene_codes]
+            direct = sp.csr_matrix(
+                (np.ones(len(rows), dtype=bool), (rows.ravel(), term_columns[known])),
+                shape=(len(gene_ids), len(self.ontology._index)),
+            )
+            propagated = (direct @ self.ontology._index.closure()).tocsc()
+
+            term_ids = self.ontology._index.ids
+            for i in np.flatnonzero(np.diff(propagated.indptr)).tolist():
+                term_genes = gene_ids[propagated.indices[propagated.indptr[i] : propagated.indptr[i + 1]]].tolist()
+                dd[str(term_ids[i])].update(term_genes)
+
+            # alternative IDs get all genes of their terms
+            for term in [term for term in terms if term in self.ontology.alias_mapper]:
+                dd[term].update(dd[self.ontology.alias_mapper[term]])
         return dict(dd)
 
     def __add__(self, iterable):
@@ -785,7 +1917,9 @@ class Annotations:
     def __len__(self):
         """ Return the number of annotations
         """
-        return len(self.annotations)
+        if self._records is None:
+            return len(self._columns['gene_id'])
+        return len(self._records)
 
     def __getitem__(self, index):
         """ Return the i-th annotation record
@@ -808,8 +1942,7 @@ class Annotations:
     def extend(self, lines):
         """ Add multiple annotations
         """
-        for line in lines:
-            self.add_annotation(line)
+        self._add_records(line if isinstance(line, AnnotationRecord) else AnnotationRecord(line) for line in lines)
 
 
 def filter_by_p_value(terms, p_value=0.01):
@@ -0,0 +1,251 @@
+""" Semantic similarity of GO terms and genes
+
+Information content of a term is ``-log(p)``, where ``p`` is the proportion of genes annotated to the term
+(directly or through its subterms) among genes annotated to the root of its namespace.
+
+Term similarity measures are based on the information content of the most informative common ancestor
+(MICA) of two terms:
+
+* ``'resnik'`` -- IC(MICA) (Resnik, IJCAI 1995),
+* ``'lin'`` -- 2 IC(MICA) / (IC(t1) + IC(t2)) (Lin, ICML 1998),
+* ``'jiang'`` -- 1 / (1 + IC(t1) + IC(t2) - 2 IC(MICA)) (Jiang and Conrath, 1997).
+
+Gene similarity is the best-match average (BMA) of similarities between terms of two genes.
+
+Ancestors of each term are kept sorted by decreasing information content, and membership of ancestors
+is stored as packed bitsets; the MICA of two terms is then the first ancestor of one term that is set
+in the bitset of the other, found for blocks of term pairs at once with array operations. For Resnik's
+measure, the best match of a term among terms of a gene is found directly from the bitset of all
+ancestors of the gene.
+"""
+import os
+import multiprocessing
+from typing import Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+SIMILARITY_RESNIK = 'resnik'
+SIMILARITY_LIN = 'lin'
+SIMILARITY_JIANG = 'jiang'
+SIMILARITY_MEASURES = (SIMILARITY_RESNIK, SIMILARITY_LIN, SIMILARITY_JIANG)
+
+# the maximal number of elements of temporary arrays of a block
+_BLOCK_SIZE = 1 << 25
+
+
+def information_content(counts, namespace):
+    # type: (np.ndarray, np.ndarray) -> np.ndarray
+    """ Information content of terms from the numbers of annotated genes (including annotations of subterms).
+
+    :param counts: The number of genes annotated to each term.
+    :param namespace: Namespace code of each term (negative if unknown).
+    :return: Information content, `nan` for terms without annotations.
+    """
+    counts = np.asarray(counts, dtype=float)
+    groups = np.asarray(namespace, dtype=np.int64) + 1
+    totals = np.zeros(groups.max(initial=0) + 1)
+    np.maximum.at(totals, groups, counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, -np.log(counts / totals[groups]), np.nan)
+
+
+class _AncestorTable:
+    """ Ancestors of terms, sorted by decreasing information content.
+
+    Row ``i`` of `columns` lists ancestors of term ``i`` (including the term) as columns of the packed
+    membership bitsets `bits`; rows are padded with a column that is never set.
+    """
+
+    def __init__(self, closure, ic, terms):
+        # type: (sp.csr_matrix, np.ndarray, np.ndarray) -> None
+        rows = closure[terms].tocsr()
+        space, columns = np.unique(rows.indices, return_inverse=True)
+        lengths = np.diff(rows.indptr)
+        row_ids = np.repeat(np.arange(len(terms)), lengths)
+
+        order = np.lexsort((-ic[rows.indices], row_ids))
+        positions = np.arange(len(order)) - rows.indptr[row_ids]
+        width = max(lengths.max(initial=0), 1)
+
+        self.ic = ic[terms]
+        self.lengths = lengths
+        self.columns = np.full((len(terms), width), len(space), dtype=np.int64)
+        self.columns[row_ids, positions] = columns.ravel()[order]
+        self.ancestor_ic = np.zeros((len(terms), width))
+        self.ancestor_ic[row_ids, positions] = ic[rows.indices[order]]
+
+        self.members = sp.csr_matrix(
+            (np.ones(len(row_ids), dtype=bool), (row_ids, columns.ravel())), shape=(len(terms), len(space) + 1)
+        )
+        self.bits = np.packbits(self.members.toarray(), axis=1)
+
+    def __len__(self):
+        return len(self.ic)
+
+    def ancestor_bits(self, groups):
+        # type: (sp.csr_matrix) -> np.ndarray
+        """ Packed bitsets of ancestors of groups of terms, given as a sparse (groups x terms) matrix. """
+        members = sp.csr_matrix(groups, dtype=np.int32) @ self.members.astype(np.int32)
+        return np.packbits(members.toarray() > 0, axis=1)
+
+    def mica(self, rows1, bits2):
+        # type: (np.ndarray, np.ndarray) -> Tuple[np.ndarray, np.ndarray]
+        """ Information content of the most informative common ancestors of terms `rows1` and
+        (the union of) ancestors in packed bitsets `bits2`.
+
+        :return: IC of MICA and a mask of pairs with a common ancestor, both of shape (rows1 x bits2).
+        """
+        width = max(self.lengths[rows1].max(initial=0), 1)
+        columns = self.columns[rows1, :width]
+        # hits[j, i, l] is non-zero if the l-th ancestor of rows1[i] is set in bits2[j]
+        hits = np.take(bits2, columns >> 3, axis=1)
+        hits &= np.uint8(128) >> (columns & 7).astype(np.uint8)
+        # the first hit has the largest weight
+        dtype = np.uint8 if width < 256 else np.uint16
+        hits = np.minimum(hits, 1, dtype=dtype)
+        hits *= np.arange(width, 0, -1, dtype=dtype)
+        best = hits.max(axis=2).T
+
+        found = best > 0
+        first = np.where(found, width - best.astype(np.int64), 0)
+        ic = self.ancestor_ic[rows1][np.arange(len(rows1))[:, np.newaxis], first]
+        return np.where(found, ic, 0.0), found
+
+    def similarity(self, rows1, rows2, measure):
+        # type: (np.ndarray, np.ndarray, str) -> np.ndarray
+        """ Similarities of two lists of terms (rows). """
+        return self.compare(rows1, self.bits[rows2], self.ic[rows2], measure)
+
+    def compare(self, rows1, bits2, ic2, measure):
+        # type: (np.ndarray, np.ndarray, Optional[np.ndarray], str) -> np.ndarray
+        """ Similarities of terms `rows1` to terms with ancestors `bits2` and information content `ic2`
+        (which is not needed for Resnik's measure).
+
+        Terms in `rows1` are processed in blocks of terms with similar numbers of ancestors.
+        """
+        order = np.argsort(self.lengths[rows1], kind='stable')
+        lengths = np.maximum(self.lengths[rows1][order], 1) * max(len(bits2), 1)
+        similarity = np.zeros((len(rows1), len(bits2)))
+        start = 0
+        while start < len(order):
+            stop = min(start + max(1, _BLOCK_SIZE // lengths[start]), len(order))
+            # all terms of a block are padded to the number of ancestors of its last term
+            stop = min(start + max(1, _BLOCK_SIZE // lengths[stop - 1]), stop)
+            block = order[start:stop]
+            similarity[block] = self._similarity(rows1[block], bits2, ic2, measure)
+            start = stop
+        return similarity
+
+    def _similarity(self, rows1, bits2, ic2, measure):
+        mica, found = self.mica(rows1, bits2)
+        if measure == SIMILARITY_RESNIK:
+            return mica
+
+        ic1, ic2 = self.ic[rows1][:, np.newaxis], ic2[np.newaxis, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if measure == SIMILARITY_LIN:
+                # terms with zero IC are roots, similar only to themselves
+                similarity = np.where(ic1 + ic2 > 0, 2 * mica / (ic1 + ic2), 1.0)
+            else:
+                similarity = 1 / (1 + ic1 + ic2 - 2 * mica)
+        return np.where(found, similarity, 0.0)
+
+
+def term_similarity(closure, ic, terms1, terms2, measure=SIMILARITY_RESNIK):
+    # type: (sp.csr_matrix, np.ndarray, np.ndarray, np.ndarray, str) -> np.ndarray
+    """ Similarity matrix (terms1 x terms2) of two lists of term indices.
+
+    :param closure: Sparse boolean (terms x terms) matrix, row `i` marks term `i` and all its ancestors.
+    :param ic: Information content of terms, see :func:`information_content`.
+    :param terms1: Term indices.
+    :param terms2: Term indices.
+    :param measure: ``'resnik'``, ``'lin'`` or ``'jiang'``
+    """
+    if measure not in SIMILARITY_MEASURES:
+        raise ValueError('Unknown measure {}, use one of {}'.format(measure, SIMILARITY_MEASURES))
+    terms, rows = np.unique(np.concatenate([terms1, terms2]).astype(np.int64), return_inverse=True)
+    rows = rows.ravel()
+    table = _AncestorTable(closure, ic, terms)
+    return table.similarity(rows[: len(terms1)], rows[len(terms1) :], measure)
+
+
+_worker_state = None
+
+
+def _set_worker_state(state):
+    global _worker_state
+    _worker_state = state
+
+
+def _best_matches(bounds, state=None):
+    # type: (Tuple[int, int], Optional[dict]) -> np.ndarray
+    """ Similarity of the best matching term of each gene, for terms (rows) ``bounds[0]:bounds[1]``. """
+    state = state or _worker_state
+    table, gene_terms, measure = state['table'], state['gene_terms'], state['measure']
+    rows = np.arange(*bounds)
+    if measure == SIMILARITY_RESNIK:
+        # the best match is the most informative ancestor shared with any term of the gene
+        return table.compare(rows, state['gene_bits'], None, measure).astype(np.float32)
+
+    similarity = table.similarity(rows, np.arange(len(table)), measure).astype(np.float32)
+    return np.maximum.reduceat(similarity[:, gene_terms.indices], gene_terms.indptr[:-1], axis=1)
+
+
+def gene_similarity(gene_terms, closure, ic, measure=SIMILARITY_RESNIK, chunk_size=64, max_workers=None):
+    # type: (sp.csr_matrix, sp.csr_matrix, np.ndarray, str, int, Optional[int]) -> np.ndarray
+    """ Best-match average similarity of all pairs of genes.
+
+    Terms are processed in chunks of `chunk_size`, optionally in parallel: for each term of a chunk,
+    its similarity to the best matching term of every gene is computed. Best matches are then averaged
+    over terms of genes with a single sparse matrix product.
+
+    :param gene_terms: Sparse boolean (genes x terms) matrix of (direct) annotations; every gene
+        must have at least one annotation.
+    :param closure: Sparse boolean (terms x terms) matrix, row `i` marks term `i` and all its ancestors.
+    :param ic: Information content of terms, see :func:`information_content`.
+    :param measure: ``'resnik'``, ``'lin'`` or ``'jiang'``
+    :param chunk_size: The number of terms processed at once.
+    :param max_workers: The maximum number of processes.
+    :return: A symmetric (genes x genes) matrix of single precision floats.
+    """
+    if measure not in SIMILARITY_MEASURES:
+        raise ValueError('Unknown measure {}, use one of {}'.format(measure, SIMILARITY_MEASURES))
+
+    gene_terms = sp.csr_matrix(gene_terms, dtype=bool)
+    terms = np.flatnonzero(gene_terms.getnnz(axis=0))
+    gene_terms = gene_terms[:, terms].tocsr()
+    gene_terms.sort_indices()
+    n_genes = gene_terms.shape[0]
+    if np.any(np.diff(gene_terms.indptr) == 0):
+        raise ValueError('All genes must have annotations.')
+
+    table = _AncestorTable(closure, ic, terms)
+    state = {'table': table, 'gene_terms': gene_terms, 'measure': measure}
+    if measure == SIMILARITY_RESNIK:
+        state['gene_bits'] = table.ancestor_bits(gene_terms)
+    chunks = [(start, min(start + chunk_size, len(terms))) for start in range(0, len(terms), chunk_size)]
+
+    # similarity of each term to the best matching term of each gene (terms x genes)
+    best = np.empty((len(terms), n_genes), dtype=np.float32)
+    workers = min(len(chunks), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_set_worker_state,
+            initargs=(state,),
+        ) as pool:
+            for (start, stop), matches in zip(chunks, pool.map(_best_matches, chunks)):
+                best[start:stop] = matches
+    else:
+        for start, stop in chunks:
+            best[start:stop] = _best_matches((start, stop), state)
+
+    # average best matches over terms of each gene
+    weights = sp.csr_matrix(gene_terms.multiply(1 / np.diff(gene_terms.indptr)[:, np.newaxis]), dtype=np.float32)
+    averages = np.asarray(weights @ best)
+    averages += averages.T
+    averages /= 2
+    return averages
@@ -0,0 +1,184 @@
+""" Topology-aware GO enrichment
+
+Terms are not tested independently: the significance of a term depends on its neighbours in the GO graph,
+which removes much of the redundancy of results of the classic (term by term) test.
+
+* ``'elim'`` -- terms are processed bottom-up; genes of significant terms are removed from all their
+  ancestors (Alexa et al., Bioinformatics 2006).
+* ``'weight'`` -- terms are processed bottom-up; genes of a term that are also annotated to a more
+  significant child are down-weighted by the ratio of significances, and children of a more significant
+  term are penalized the same way (a level-wise variant of the weight algorithm by Alexa et al., 2006).
+* ``'parent-child-union'``, ``'parent-child-intersection'`` -- a term is tested against the population
+  of genes annotated to any (union) or all (intersection) of its parents (Grossmann et al.,
+  Bioinformatics 2007).
+
+All methods work on a sparse (genes x terms) matrix of annotations propagated to ancestors. Terms are
+processed one level at a time (deepest first), so each step is a few sparse matrix products.
+"""
+from typing import Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+TOPOLOGY_ELIM = 'elim'
+TOPOLOGY_WEIGHT = 'weight'
+TOPOLOGY_PARENT_CHILD_UNION = 'parent-child-union'
+TOPOLOGY_PARENT_CHILD_INTERSECTION = 'parent-child-intersection'
+TOPOLOGY_METHODS = (
+    TOPOLOGY_ELIM,
+    TOPOLOGY_WEIGHT,
+    TOPOLOGY_PARENT_CHILD_UNION,
+    TOPOLOGY_PARENT_CHILD_INTERSECTION,
+)
+
+
+def _levels_bottom_up(levels):
+    # type: (np.ndarray) -> list
+    """ Return indices of terms on each level, from the deepest level up. """
+    order = np.argsort(-levels, kind='stable')
+    bounds = np.flatnonzero(np.diff(levels[order])) + 1
+    return np.split(order, bounds)
+
+
+def _significance(p_values):
+    # type: (np.ndarray) -> np.ndarray
+    return -np.log10(np.maximum(p_values, np.finfo(float).tiny))
+
+
+def elim(annotations, query, levels, closure, n, N, prob, cutoff):  # noqa: N803
+    # type: (sp.csc_matrix, np.ndarray, np.ndarray, sp.csr_matrix, int, int, object, float) -> Tuple
+    """ The elim method.
+
+    :param annotations: Sparse boolean (genes x terms) matrix of reference genes, annotations are propagated.
+    :param query: Boolean mask of query genes (rows of `annotations`).
+    :param levels: Level of each term (parents are on lower levels than children).
+    :param closure: Sparse boolean (terms x terms) matrix, row `i` marks term `i` and all its ancestors.
+    :param n: The number of query genes.
+    :param N: The number of reference genes.
+    :param prob: Probability distribution with vectorized ``p_values``.
+    :param cutoff: Genes of terms with p-values below the cutoff are removed from their ancestors.
+    :return: Query counts, reference counts, p-values and a sparse (genes x terms) matrix of genes
+        that were counted for each term.
+    """
+    annotations = sp.csc_matrix(annotations, dtype=bool)
+    n_terms = annotations.shape[1]
+    k, m, p_values = np.zeros(n_terms), np.zeros(n_terms), np.ones(n_terms)
+    significant = np.zeros(n_terms, dtype=bool)
+    counted = []
+
+    for terms in _levels_bottom_up(levels):
+        genes = annotations[:, terms]
+        found = np.flatnonzero(significant)
+        if len(found):
+            # genes of significant descendants
+            removed = (annotations[:, found] @ closure[found][:, terms]).astype(bool)
+            genes = (genes > removed).tocsc()
+        counted.append((terms, genes))
+
+        k[terms] = genes.T @ query.astype(float)
+        m[terms] = np.asarray(genes.sum(axis=0)).ravel()
+        p_values[terms] = prob.p_values(k[terms], N, m[terms], n)
+        significant[terms] = p_values[terms] < cutoff
+
+    return k, m, p_values, _stack_columns(counted, annotations.shape)
+
+
+def weight(annotations, query, levels, parents, n, N, prob):  # noqa: N803
+    # type: (sp.csc_matrix, np.ndarray, np.ndarray, sp.csr_matrix, int, int, object) -> Tuple
+    """ The weight method.
+
+    Weighted counts are rounded before computing p-values. See :func:`elim` for parameters; `parents` is
+    a sparse boolean (terms x terms) matrix with parents of each term in its row.
+    """
+    annotations = sp.csc_matrix(annotations, dtype=float)
+    n_terms = annotations.shape[1]
+    k, m, p_values = np.zeros(n_terms), np.zeros(n_terms), np.ones(n_terms)
+    query = query.astype(float)
+    # (parents x children) edges
+    children = sp.csr_matrix(parents.T, dtype=bool)
+    counted = []
+
+    def test(k_, m_):
+        return prob.p_values(np.rint(k_), N, np.rint(m_), n)
+
+    for terms in _levels_bottom_up(levels):
+        genes = annotations[:, terms]
+        k[terms] = genes.T @ query
+        m[terms] = np.asarray(genes.sum(axis=0)).ravel()
+        p_values[terms] = test(k[terms], m[terms])
+        term_sig = _significance(p_values[terms])
+
+        edges = children[terms].tocoo()  # rows: terms of this level, columns: their children
+        child_sig = _significance(p_values[edges.col])
+        parent_sig = term_sig[edges.row]
+
+        # down-weight genes that are also annotated to a more significant child
+        stronger = child_sig > parent_sig
+        if stronger.any():
+            log_ratio = np.log(np.maximum(parent_sig[stronger] / child_sig[stronger], np.finfo(float).tiny))
+            ratios = sp.csr_matrix(
+                (log_ratio, (edges.col[stronger], edges.row[stronger])), shape=(n_terms, len(terms))
+            )
+            log_weights = (annotations @ ratios).tocsc()
+            genes = (genes + log_weights.expm1()).tocsc()
+            genes.eliminate_zeros()
+
+            k[terms] = genes.T @ query
+            m[terms] = np.asarray(genes.sum(axis=0)).ravel()
+            p_values[terms] = test(k[terms], m[terms])
+            term_sig = _significance(p_values[terms])
+        counted.append((terms, genes))
+
+        # penalize children of more significant terms
+        weaker = _significance(p_values[edges.col]) < term_sig[edges.row]
+        if weaker.any():
+            ratio = _significance(p_values[edges.col[weaker]]) / term_sig[edges.row[weaker]]
+            factors = np.ones(n_terms)
+            np.multiply.at(factors, edges.col[weaker], ratio)
+            penalized = np.unique(edges.col[weaker])
+            k[penalized] *= factors[penalized]
+            m[penalized] *= factors[penalized]
+            p_values[penalized] = test(k[penalized], m[penalized])
+
+    return k, m, p_values, _stack_columns(counted, annotations.shape) != 0
+
+
+def parent_child(annotations, query, parents, n, N, prob, intersection=False):  # noqa: N803
+    # type: (sp.csc_matrix, np.ndarray, sp.csr_matrix, int, int, object, bool) -> Tuple
+    """ The parent-child method: each term is tested against genes annotated to its parents.
+
+    Terms without parents are tested against all reference genes. See :func:`elim` and :func:`weight`
+    for parameters.
+    """
+    annotations = sp.csc_matrix(annotations, dtype=float)
+    parents = sp.csr_matrix(parents, dtype=float)
+    query = query.astype(float)
+
+    # the number of parents of each term in which a gene is annotated
+    in_parents = (annotations @ parents.T).tocsc()
+    n_parents = np.asarray(parents.sum(axis=1)).ravel()
+    population = in_parents.copy()
+    if intersection:
+        columns = np.repeat(np.arange(in_parents.shape[1]), np.diff(in_parents.indptr))
+        population.data = (in_parents.data == n_parents[columns]).astype(float)
+        population.eliminate_zeros()
+    population = population.astype(bool)
+
+    roots = n_parents == 0
+    population_n = np.where(roots, n, population.T @ query)
+    population_N = np.where(roots, N, np.asarray(population.sum(axis=0)).ravel())  # noqa: N806
+
+    k = annotations.T @ query
+    m = np.asarray(annotations.sum(axis=0)).ravel()
+    p_values = np.asarray(prob.p_values(k, population_N, m, population_n), dtype=float)
+    return k, m, p_values, annotations.astype(bool)
+
+
+def _stack_columns(blocks, shape):
+    # type: (list, tuple) -> sp.csc_matrix
+    """ Assemble a matrix from (column indices, columns) blocks. """
+    if not blocks:
+        return sp.csc_matrix(shape)
+    order = np.concatenate([terms for terms, _ in blocks])
+    matrix = sp.hstack([columns for _, columns in blocks], format='csc')
+    return matrix[:, np.argsort(order)]
@@ -58,9 +58,13 @@ from itertools import chain
 from contextlib import contextmanager
 from collections import defaultdict
 
-from orangecontrib.bioinformatics.kegg import api, conf, entry, pathway, databases
+import numpy as np
+import scipy.sparse as sp
+
+from orangecontrib.bioinformatics.kegg import api, conf, entry, pathway, caching, databases
 from orangecontrib.bioinformatics.ncbi import taxonomy
-from orangecontrib.bioinformatics.utils import statistics, progress_bar_milestones
+from orangecontrib.bioinformatics.utils import statistics
+from orangecontrib.bioinformatics.utils import cache as binary_cache
 from orangecontrib.bioinformatics.kegg.brite import Brite, BriteEntry
 
 KEGGGenome = databases.Genome
@@ -77,6 +81,10 @@ KEGGPathway = pathway.Pathway
 
 DEFAULT_CACHE_DIR = conf.params["cache.path"]
 
+PATHWAY_INDEX_SUFFIX = '_pathway_genes.cache'
+PATHWAY_INDEX_VERSION = 1
+PATHWAY_INDEX_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
 
 class Organism(object):
     """
@@ -97,6 +105,7 @@ class Organism(object):
     def __init__(self, org):
         self.org_code = self.organism_name_search(org)
         self.api = api.CachedKeggApi()
+        self._pathway_genes = None
 
     @property
     def org(self):
@@ -186,37 +195,121 @@ class Organism(object):
         and (list_of_genes, p_value, num_of_reference_genes) tuples
         as items.
 
+        Genes are counted in all pathways at once, with products of the (pathways x genes)
+        membership matrix of the organism and indicator vectors of query and reference genes.
+
         """
         if reference is None:
             reference = self.genes.keys()
         reference = set(reference)
+        genes = list(genes)
+
+        gene_ids, pathway_ids, membership = self._pathway_gene_matrix()
+        if callback:
+            callback(50.0)
+
+        query = self._gene_indicator(gene_ids, genes)
+        counts = membership @ query.astype(np.int64)
+        reference_counts = membership @ self._gene_indicator(gene_ids, reference).astype(np.int64)
 
-        allPathways = defaultdict(lambda: [[], 1.0, []])
-        milestones = progress_bar_milestones(len(genes), 100)
-        pathways_db = KEGGPathways()
-
-        pathways_for_gene = []
-        for i, gene in enumerate(genes):
-            pathways_for_gene.append(self.pathways([gene]))
-            if callback and i in milestones:
-                callback(i * 50.0 / len(genes))
-
-        # pre-cache for speed
-        pathways_db.pre_cache([pid for pfg in pathways_for_gene for pid in pfg])
-        for i, (gene, pathways) in enumerate(zip(genes, pathways_for_gene)):
-            for pathway in pathways:
-                if pathways_db.get_entry(pathway).gene:
-                    allPathways[pathway][0].append(gene)
-            if callback and i in milestones:
-                callback(50.0 + i * 50.0 / len(genes))
-
-        pItems = allPathways.items()
-
-        for i, (p_id, entry) in enumerate(pItems):
-            pathway = pathways_db.get_entry(p_id)
-            entry[2].extend(reference.intersection(pathway.gene or []))
-            entry[1] = prob.p_value(len(entry[0]), len(reference), len(entry[2]), len(genes))
-        return dict([(pid, (genes, p, len(ref))) for pid, (genes, p, ref) in allPathways.items()])
+        pathways = np.flatnonzero(counts)
+        if hasattr(prob, 'p_values'):
+            p_values = np.asarray(
+                prob.p_values(counts[pathways], len(reference), reference_counts[pathways], len(genes)), dtype=float
+            )
+        else:
+            p_values = [
+                prob.p_value(k, len(reference), m, len(genes))
+                for k, m in zip(counts[pathways].tolist(), reference_counts[pathways].tolist())
+            ]
+
+        # query genes in each pathway
+        mapped = membership[pathways][:, np.flatnonzero(query)].tocsr()
+        mapped.sort_indices()
+        query_genes = gene_ids[np.flatnonzero(query)].tolist()
+        indptr, indices = mapped.indptr.tolist(), mapped.indices.tolist()
+
+        if callback:
+            callback(100.0)
+        return {
+            pathway: ([query_genes[g] for g in indices[indptr[i] : indptr[i + 1]]], p_value, reference_count)
+            for i, (pathway, p_value, reference_count) in enumerate(
+                zip(pathway_ids[pathways].tolist(), np.asarray(p_values).tolist(), reference_counts[pathways].tolist())
+            )
+        }
+
+    def _pathway_gene_matrix(self):
+        """
+        Return sorted gene ids, sorted pathway ids and a sparse boolean (pathways x genes) membership
+        matrix of the organism.
+
+        The matrix is built once from the gene-pathway links and kept in memory. It is also saved
+        into the KEGG cache directory and reused while the links would be considered valid.
+        """
+        if self._pathway_genes is None:
+            path = os.path.join(conf.params["cache.path"], self.org_code + PATHWAY_INDEX_SUFFIX)
+            try:
+                self._pathway_genes = self._load_pathway_index(path)
+            except (OSError, ValueError, KeyError):
+                links = self.api.get_genes_pathway_organism(self.org_code)
+                gene_ids, genes = np.unique(np.array([gene for gene, _ in links], dtype=str), return_inverse=True)
+                pathway_ids, pathways = np.unique(
+                    np.array([path_id for _, path_id in links], dtype=str), return_inverse=True
+                )
+                membership = sp.csr_matrix(
+                    (np.ones(len(links), dtype=bool), (pathways.ravel(), genes.ravel())),
+                    shape=(len(pathway_ids), len(gene_ids)),
+                )
+                membership.sort_indices()
+                self._pathway_genes = (gene_ids, pathway_ids, membership)
+                try:
+                    self._save_pathway_index(path)
+                except OSError:
+                    # the index is an optimization only
+                    pass
+        return self._pathway_genes
+
+    def _save_pathway_index(self, path):
+        gene_ids, pathway_ids, membership = self._pathway_genes
+        arrays = {
+            'gene_ids': gene_ids,
+            'pathway_ids': pathway_ids,
+            'indptr': membership.indptr.astype(np.int64),
+            'indices': membership.indices.astype(np.int32),
+        }
+        metadata = {
+            'version': PATHWAY_INDEX_VERSION,
+            'organism': self.org_code,
+            'mtime': datetime.now().strftime(PATHWAY_INDEX_TIME_FORMAT),
+        }
+        binary_cache.write_cache(path, arrays, metadata)
+
+    def _load_pathway_index(self, path):
+        metadata = binary_cache.read_metadata(path, PATHWAY_INDEX_VERSION)
+        cached = caching.cache_entry(None, mtime=datetime.strptime(metadata['mtime'], PATHWAY_INDEX_TIME_FORMAT))
+        if metadata['organism'] != self.org_code or not self.api.get_genes_pathway_organism.is_entry_valid(
+            cached, (self.org_code,)
+        ):
+            raise ValueError('Pathway index {} is out of date'.format(path))
+
+        arrays = {
+            name: binary_cache.read_array(path, name) for name in ('gene_ids', 'pathway_ids', 'indptr', 'indices')
+        }
+        membership = sp.csr_matrix(
+            (np.ones(len(arrays['indices']), dtype=bool), arrays['indices'], arrays['indptr']),
+            shape=(len(arrays['pathway_ids']), len(arrays['gene_ids'])),
+        )
+        return arrays['gene_ids'], arrays['pathway_ids'], membership
+
+    @staticmethod
+    def _gene_indicator(gene_ids, genes):
+        """ Return a boolean mask of `gene_ids` (sorted) that are in `genes`. """
+        genes = np.array([str(gene) for gene in genes], dtype=str)
+        indicator = np.zeros(len(gene_ids), dtype=bool)
+        if len(gene_ids) and len(genes):
+            positions = np.minimum(np.searchsorted(gene_ids, genes), len(gene_ids) - 1)
+            indicator[positions[gene_ids[positions] == genes]] = True
+        return indicator
 
     def get_genes_by_enzyme(self, enzyme):
         enzyme = KEGGEnzyme().get_entry(enzyme)
@@ -234,14 +327,16 @@ class Organism(object):
 
     def get_pathways_by_genes(self, gene_ids):
         """ Pathways that include all genes in gene_ids. """
-        l = self.api.get_genes_pathway_organism(self.org_code)
         gene_ids = set(gene_ids)
-        gtp = defaultdict(set)
-        for a, b in l:
-            gtp[a].add(b)
-        pathways = [gtp[g] for g in gene_ids]
-        pathways = reduce(set.intersection, pathways)
-        return sorted(pathways)
+        if not gene_ids:
+            return []
+        all_gene_ids, pathway_ids, membership = self._pathway_gene_matrix()
+        indicator = self._gene_indicator(all_gene_ids, gene_ids)
+        if indicator.sum() < len(gene_ids):
+            # genes that are not in any pathway
+            return []
+        counts = membership @ indicator.astype(np.int64)
+        return pathway_ids[counts == len(gene_ids)].tolist()
 
     def get_pathways_by_enzymes(self, enzyme_ids):
         enzyme_ids = set(enzyme_ids)
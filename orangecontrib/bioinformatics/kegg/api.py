@@ -334,6 +334,12 @@ except ImportError:
     from Orange.utils import lru_cache
 
 
+#: File name of the cache database in ``cache.path``
+CACHE_FILENAME = "kegg_api_cache_3.sqlite3"
+#: Databases of previous cache versions, removed when the cache is created
+OBSOLETE_CACHE_FILENAMES = ("kegg_api_cache_2.sqlite3",)
+
+
 class CachedKeggApi(KeggApi):
     def __init__(self, store=None):
         KeggApi.__init__(self)
@@ -346,7 +352,14 @@ class CachedKeggApi(KeggApi):
 
         path = conf.params["cache.path"]
         touch_dir(path)
-        return caching.Sqlite3Store(os.path.join(path, "kegg_api_cache_2.sqlite3"))
+        filename = os.path.join(path, CACHE_FILENAME)
+        if not os.path.exists(filename):
+            for obsolete in OBSOLETE_CACHE_FILENAMES:
+                try:
+                    os.remove(os.path.join(path, obsolete))
+                except OSError:
+                    pass
+        return caching.Sqlite3Store(filename)
 
     def last_modified(self, args, kwargs=None):
         return getattr(self, "default_release", "")
@@ -395,7 +408,6 @@ class CachedKeggApi(KeggApi):
 
         with closing(get.cache_store()) as store:
             # Which ids are already cached
-            # TODO: Invalidate entries by release string.
             for id in ids:
                 key = get.key_from_args((id,))
                 if not get.key_has_valid_cache(key, store):
@@ -427,11 +439,11 @@ class CachedKeggApi(KeggApi):
                     key = get.key_from_args((id,))
                     if entry is not None:
                         entry = entry + "///\n"
-                    store[key] = cache_entry(entry, mtime=datetime.now())
+                    store[key] = cache_entry(entry, mtime=datetime.now(), release=get.release_from_args((id,)))
 
         # Finally join all the results, but drop all None objects
 
-        with closing(get.cache_store()):
+        with closing(get.cache_store()) as store:
             keys = [get.key_from_args((id,)) for id in ids]
             entries = [store[key].value for key in keys]
 
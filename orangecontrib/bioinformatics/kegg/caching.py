@@ -1,14 +1,21 @@
 """
 Caching framework for cached kegg api calls.
 
+Values are stored in sqlite3 databases (:class:`Sqlite3Store`) as compressed pickles. All stores of
+a database file share one connection per process; writes are buffered in memory and committed in
+batches, and the least recently used entries are evicted when the database grows over
+``cache.max_size`` (in megabytes).
+
 """
 import os
+import time
+import zlib
+import atexit
 import sqlite3
+import threading
 from datetime import date, datetime, timedelta
 from contextlib import closing
 
-import six
-
 from orangecontrib.bioinformatics.kegg import conf
 
 try:
@@ -20,7 +27,11 @@ except ImportError:
 try:
     from UserDict import DictMixin
 except ImportError:
-    from collections import MutableMapping as DictMixin
+    from collections.abc import MutableMapping as DictMixin
+
+# buffered writes are committed when there are this many of them or when the oldest is this old (in seconds)
+BATCH_SIZE = 64
+BATCH_INTERVAL = 5.0
 
 
 class Store(object):
@@ -37,106 +48,226 @@ class Store(object):
         pass
 
 
-class Sqlite3Store(Store, DictMixin):
+class _Database(object):
+    """
+    A sqlite3 connection to a cache file, shared by all stores of the file within a process.
+
+    Writes (and access times of read entries) are buffered and committed in a single transaction.
+    """
+
+    _open = {}
+    _open_lock = threading.Lock()
+
     def __init__(self, filename):
         self.filename = filename
-        self.con = sqlite3.connect(filename)
-        self.con.execute(
+        self.lock = threading.RLock()
+        self.pending = {}  # key -> (value, size, mtime) or None for deleted keys
+        self.accessed = {}  # key -> access time
+        self.oldest_pending = None
+
+        self.con = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        # auto vacuum must be set before tables are created, so evicted entries release disk space
+        self.con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        with self.con:
+            self.con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries
+                    (key TEXT PRIMARY KEY,
+                     value BLOB NOT NULL,
+                     size INTEGER NOT NULL,
+                     mtime REAL NOT NULL,
+                     atime REAL NOT NULL
+                    )
             """
-            CREATE TABLE IF NOT EXISTS cache
-                (key TEXT UNIQUE,
-                 value TEXT
-                )
-        """
-        )
-        self.con.execute(
+            )
+            self.con.execute(
+                """
+                CREATE INDEX IF NOT EXISTS entries_atime
+                ON entries (atime)
             """
-            CREATE INDEX IF NOT EXISTS cache_index
-            ON cache (key)
-        """
-        )
-        self.con.commit()
+            )
+
+    @classmethod
+    def get(cls, filename):
+        pid = os.getpid()
+        with cls._open_lock:
+            db = cls._open.get((filename, pid))
+            if db is None:
+                path = os.path.realpath(filename)
+                db = cls._open.get((path, pid)) or cls(filename)
+                cls._open[(path, pid)] = cls._open[(filename, pid)] = db
+            return db
+
+    @classmethod
+    def flush_all(cls):
+        with cls._open_lock:
+            databases = {db for (_, pid), db in cls._open.items() if pid == os.getpid()}
+        for db in databases:
+            db.flush()
+
+    def write(self, key, row):
+        with self.lock:
+            self.pending[key] = row
+            if self.oldest_pending is None:
+                self.oldest_pending = time.monotonic()
+            self.flush_if_needed()
+
+    def flush_if_needed(self):
+        with self.lock:
+            if len(self.pending) >= BATCH_SIZE or (
+                self.oldest_pending is not None and time.monotonic() - self.oldest_pending > BATCH_INTERVAL
+            ):
+                self.flush()
+
+    def flush(self):
+        """ Commit buffered writes and evict the least recently used entries if the cache is too large. """
+        with self.lock:
+            if not self.pending and not self.accessed:
+                return
+            written = [(key,) + row + (row[2],) for key, row in self.pending.items() if row is not None]
+            deleted = [(key,) for key, row in self.pending.items() if row is None]
+            accessed = [(atime, key) for key, atime in self.accessed.items() if key not in self.pending]
+            with self.con:
+                self.con.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", written)
+                self.con.executemany("DELETE FROM entries WHERE key=?", deleted)
+                self.con.executemany("UPDATE entries SET atime=? WHERE key=?", accessed)
+                evicted = self._evict() if written else 0
+            if evicted:
+                self.con.execute("PRAGMA incremental_vacuum")
+            self.pending, self.accessed, self.oldest_pending = {}, {}, None
+
+    def _evict(self):
+        max_size = int(float(conf.params.get("cache.max_size", 0)) * 2 ** 20)
+        if max_size <= 0:
+            return 0
+        (total,) = self.con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= max_size:
+            return 0
+
+        evicted = []
+        for key, size in self.con.execute("SELECT key, size FROM entries ORDER BY atime"):
+            if total <= max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self.con.executemany("DELETE FROM entries WHERE key=?", evicted)
+        return len(evicted)
+
+
+atexit.register(_Database.flush_all)
+
+
+class Sqlite3Store(Store, DictMixin):
+    """
+    A persistent mapping of string keys to (pickled, compressed) values in a sqlite3 database.
+
+    Stores are cheap to create: they share a connection to the database file. Writes become visible
+    to other processes once they are committed (in batches, on :func:`flush` and at exit).
+    """
+
+    def __init__(self, filename):
+        Store.__init__(self)
+        self.filename = filename
+        self._db = _Database.get(filename)
+
+    @staticmethod
+    def _encode(value):
+        return zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _decode(data):
+        return pickle.loads(zlib.decompress(data))
 
     def __getitem__(self, key):
-        cur = self.con.execute(
-            """
-            SELECT value
-            FROM cache
-            WHERE key=?
-        """,
-            (key,),
-        )
-        r = cur.fetchall()
-        if not r:
+        db = self._db
+        with db.lock:
+            if key in db.pending:
+                row = db.pending[key]
+                if row is None:
+                    raise KeyError(key)
+                data = row[0]
+            else:
+                r = db.con.execute("SELECT value FROM entries WHERE key=?", (key,)).fetchone()
+                if r is None:
+                    raise KeyError(key)
+                data = r[0]
+                db.accessed[key] = time.time()
+        try:
+            return self._decode(data)
+        except Exception:
             raise KeyError(key)
-        else:
-            pickle_str = r[0][0]
-            if not six.PY3:
-                pickle_str = str(pickle_str)
-            try:
-                return pickle.loads(pickle_str)
-            except Exception:
-                raise KeyError(key)
 
     def __setitem__(self, key, value):
-        value = pickle.dumps(value)
-        self.con.execute(
-            """
-            INSERT OR REPLACE INTO cache
-            VALUES (?, ?)
-        """,
-            (key, value),
-        )
-        self.con.commit()
+        data = self._encode(value)
+        now = time.time()
+        self._db.write(key, (sqlite3.Binary(data), len(data), now))
 
     def __delitem__(self, key):
-        self.con.execute(
-            """
-            DELETE FROM cache
-            WHERE key=?
-        """,
-            (key,),
-        )
-        self.con.commit()
+        if key not in self:
+            raise KeyError(key)
+        self._db.write(key, None)
+
+    def __contains__(self, key):
+        db = self._db
+        with db.lock:
+            if key in db.pending:
+                return db.pending[key] is not None
+            return db.con.execute("SELECT 1 FROM entries WHERE key=?", (key,)).fetchone() is not None
 
     def keys(self):
-        cur = self.con.execute(
-            """
-            SELECT key
-            FROM cache
-        """
-        )
-        return [str(r[0]) for r in cur.fetchall()]
+        self.flush()
+        with self._db.lock:
+            return [str(r[0]) for r in self._db.con.execute("SELECT key FROM entries")]
+
+    def flush(self):
+        """ Commit all buffered writes. """
+        self._db.flush()
 
     def close(self):
-        pass
+        # the connection stays open for other stores; commit only if enough writes are buffered
+        self._db.flush_if_needed()
 
     def __len__(self):
-        return None
+        self.flush()
+        with self._db.lock:
+            return self._db.con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
 
     def __iter__(self):
-        return None
+        # iterate over a snapshot, so entries can be deleted while iterating
+        return iter(self.keys())
 
 
 class DictStore(Store, DictMixin):
     def __init__(self):
         Store.__init__(self)
+        self._data = {}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
 
     def close(self):
         pass
 
     def __len__(self):
-        return None
+        return len(self._data)
 
     def __iter__(self):
-        return None
+        return iter(list(self._data))
 
 
 class cache_entry(object):
-    def __init__(self, value, mtime=None, expires=None):
+    def __init__(self, value, mtime=None, release=None):
         self.value = value
         self.mtime = mtime
-        self.expires = expires
+        self.release = release
 
 
 _SESSION_START = datetime.now()
@@ -144,7 +275,11 @@ _SESSION_START = datetime.now()
 
 class cached_wrapper(object):
     """
-    TODO: needs documentation
+    A cached method bound to an instance.
+
+    Results are stored as :class:`cache_entry` objects in the instance's cache store under keys
+    composed of the method name and arguments. An entry is used while it is valid
+    (see :func:`is_entry_valid`); if KEGG can not be reached, stale entries are used as well.
     """
 
     def __init__(self, function, instance, class_, cache_store, last_modified=None):
@@ -172,12 +307,16 @@ class cached_wrapper(object):
         if self.instance is not None:
             return self.instance.last_modified(args)
 
+    def release_from_args(self, args):
+        last_modified = self.last_modified_from_args(args)
+        return last_modified if isinstance(last_modified, str) and last_modified else None
+
     def invalidate_args(self, args):
         return self.invalidate_key(self.key_from_args(args))
 
     def invalidate_all(self):
         prefix = self.key_from_args(()).rstrip(",)")
-        with self.cache_store() as store:
+        with closing(self.cache_store()) as store:
             for key in store:
                 if key.startswith(prefix):
                     del store[key]
@@ -188,31 +327,35 @@ class cached_wrapper(object):
             timestamp = datetime.now()
 
         with closing(self.cache_store()) as store:
-            store[key] = cache_entry(value, mtime=timestamp)
+            store[key] = cache_entry(value, mtime=timestamp, release=self.release_from_args(args))
 
     def __call__(self, *args):
         key = self.key_from_args(args)
         with closing(self.cache_store()) as store:
-            if self.key_has_valid_cache(key, store):
-                rval = store[key].value
-            else:
+            entry = store.get(key)
+            if entry is not None and self.is_entry_valid(entry, args):
+                return entry.value
+            try:
                 rval = self.function(self.instance, *args)
-                store[key] = cache_entry(rval, datetime.now(), None)
+            except OSError:
+                if entry is None:
+                    raise
+                # stale data is better than none when KEGG is not reachable
+                return entry.value
+            store[key] = cache_entry(rval, mtime=datetime.now(), release=self.release_from_args(args))
 
         return rval
 
     def key_has_valid_cache(self, key, store):
-        if key not in store:
-            return False
-        else:
-            entry = store[key]
-            return self.is_entry_valid(entry, None)
+        entry = store.get(key)
+        return entry is not None and self.is_entry_valid(entry, None)
 
     def is_entry_valid(self, entry, args):
-        # For now always return True, the caching architecture needs to be
-        # completely reworked
-        return True
-
+        """
+        An entry is valid if it was stored for the current KEGG release or, if the release is not known,
+        if it is not older than allowed by the ``cache.invalidate`` policy ('always', 'session', 'daily',
+        'weekly').
+        """
         # Need to check datetime first (it subclasses date)
         if isinstance(entry.mtime, datetime):
             mtime = entry.mtime
@@ -223,13 +366,16 @@ class cached_wrapper(object):
 
         last_modified = self.last_modified_from_args(args)
 
-        if isinstance(last_modified, date):
+        if isinstance(last_modified, str):
+            # a release name; entries stored before releases were recorded are checked by age
+            release = getattr(entry, "release", None)
+            if last_modified and release is not None:
+                return release == last_modified
+            last_modified = None
+        elif isinstance(last_modified, date) and not isinstance(last_modified, datetime):
             last_modified = datetime(last_modified.year, last_modified.month, last_modified.day, 1, 1, 1)
-        elif isinstance(last_modified, str):
-            # Could have different format
-            mtime = mtime.strftime("%Y %m %d %H %M %S")
 
-        elif last_modified is None:
+        if last_modified is None:
             if conf.params["cache.invalidate"] == "always":
                 return False
             elif conf.params["cache.invalidate"] == "session":
@@ -238,8 +384,8 @@ class cached_wrapper(object):
                 last_modified = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             elif conf.params["cache.invalidate"] == "weekly":
                 last_modified = datetime.now() - timedelta(7)
-            else:  # ???
-                pass
+            else:
+                return True
         return last_modified <= mtime
 
 
@@ -287,12 +433,14 @@ def clear_cache():
     """Clear all locally cached KEGG data.
     """
     import glob
+    import shutil
 
     path = conf.params["cache.path"]
     if os.path.realpath(path) != os.path.realpath(conf.kegg_dir):
         raise Exception("Non default cache path. Please remove the contents " "of %r manually." % path)
 
-    for cache_filename in glob.glob(os.path.join(path, "*.sqlite3")):
+    # databases with their write-ahead logs
+    for cache_filename in glob.glob(os.path.join(path, "*.sqlite3*")):
         os.remove(cache_filename)
 
     for ko_filename in glob.glob(os.path.join(path, "*.keg")):
@@ -303,3 +451,7 @@ def clear_cache():
 
     for png_filename in glob.glob(os.path.join(path, "*.png")):
         os.remove(png_filename)
+
+    # binary indices (e.g. pathway genes of organisms) and temporary directories of interrupted writes
+    for index_path in glob.glob(os.path.join(path, "*.cache")) + glob.glob(os.path.join(path, "*.cache.*.tmp*")):
+        shutil.rmtree(index_path, ignore_errors=True)
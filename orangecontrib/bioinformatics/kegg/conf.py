@@ -25,6 +25,8 @@ default = """
 path = %(kegg_dir)s/
 store = sqlite3
 invalidate = weekly
+# maximum size of sqlite3 caches in MB, least recently used entries are evicted
+max_size = 1024
 
 [service]
 transport = urllib2
@@ -47,7 +49,7 @@ parser.read([os.path.expanduser("~/.obiKEGG/rc.cfg")])
 
 params = {}
 
-_ALL_PARAMS = ["cache.path", "cache.store", "cache.invalidate", "service.transport"]
+_ALL_PARAMS = ["cache.path", "cache.store", "cache.invalidate", "cache.max_size", "service.transport"]
 
 for p in _ALL_PARAMS:
     section, option = p.split(".")
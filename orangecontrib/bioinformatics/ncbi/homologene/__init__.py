@@ -1,46 +1,225 @@
-from typing import Dict, List, Optional
-from functools import reduce
-from collections import defaultdict
+import os
+import zipfile
+import tempfile
+from typing import List, Tuple, Union, Iterable, Optional
+
+import numpy as np
+import scipy.sparse as sp
 
 from orangecontrib.bioinformatics.utils import serverfiles
-from orangecontrib.bioinformatics.ncbi.gene import Gene
 
+# Columns of homologene.tab, in file order.
+HOMOLOGENE_COLUMNS = ('homology_group_id', 'tax_id', 'gene_id')
 
-def _from_data_to_gene(line: str):
-    gene = Gene()
-    for attr, val in zip(['homology_group_id', 'tax_id', 'gene_id'], line.strip().split('\t')):
-        setattr(gene, attr, val)
-    return gene
+# Strategies for collapsing many-to-many homolog mapping.
+HOMOLOGS_FIRST = 'first'
+HOMOLOGS_ALL = 'all'
+HOMOLOGS_STRATEGIES = (HOMOLOGS_FIRST, HOMOLOGS_ALL)
 
+# Aggregation of expression over homolog (paralog) groups.
+AGGREGATE_SUM = 'sum'
+AGGREGATE_MEAN = 'mean'
 
-class HomoloGene:
-    """ Wrapper around NCBI HomoloGene database """
 
-    def __init__(self):
-        self.file_path: str = serverfiles.localpath_download('homologene', 'homologene.tab')
+def _to_int_array(ids: Iterable) -> np.ndarray:
+    """ Convert identifiers to an int64 array. Non-numeric identifiers are mapped to -1. """
+    return np.fromiter((int(i) if str(i).isdigit() else -1 for i in ids), dtype=np.int64)
 
-        with open(self.file_path, 'r') as fp:
-            self._homologs: Dict[str, Gene] = {
-                h.gene_id: h for h in [_from_data_to_gene(line) for line in fp.readlines()]
-            }
 
-        def _helper(groups, gene):
-            groups[gene.homology_group_id].append(gene)
-            return groups
+class HomoloGene:
+    """ Wrapper around NCBI HomoloGene database
+
+    The table is kept in columnar form: three parallel integer arrays (``group_id``, ``tax_id``, ``gene_id``)
+    sorted by homology group. Parsed arrays are cached in a binary sidecar file next to ``homologene.tab``
+    and reused for as long as the source file is not modified.
+    """
 
-        self._homologs_by_group: Dict[str, List[Gene]] = reduce(_helper, self._homologs.values(), defaultdict(list))
+    def __init__(self):
+        self.file_path: str = serverfiles.localpath_download('homologene', 'homologene.tab')
+        self.cache_path: str = self.file_path + '.npz'
+
+        self.group_id, self.tax_id, self.gene_id = self._load()
+
+        # Index used to resolve gene ids to rows.
+        self._gene_order: np.ndarray = np.argsort(self.gene_id, kind='stable')
+        self._genes_sorted: np.ndarray = self.gene_id[self._gene_order]
+
+    def _load(self):
+        source_mtime = os.path.getmtime(self.file_path)
+
+        try:
+            with np.load(self.cache_path) as cache:
+                if cache['source_mtime'] == source_mtime:
+                    return cache['group_id'], cache['tax_id'], cache['gene_id']
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            pass
+
+        table = np.loadtxt(self.file_path, dtype=np.int64, delimiter='\t', ndmin=2).reshape(-1, 3)
+        table = table[np.lexsort((table[:, 2], table[:, 1], table[:, 0]))]
+        group_id, tax_id, gene_id = (np.ascontiguousarray(column) for column in table.T)
+
+        try:
+            # Write to a temporary file first, so an interrupted write never leaves a truncated cache.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.cache_path), suffix='.npz.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    np.savez(fp, group_id=group_id, tax_id=tax_id, gene_id=gene_id, source_mtime=source_mtime)
+                os.replace(tmp_path, self.cache_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError:
+            # Cache is an optimization only, we can live without it.
+            pass
+
+        return group_id, tax_id, gene_id
+
+    def _groups(self, gene_ids: np.ndarray) -> np.ndarray:
+        """ Return homology group of each gene, -1 if the gene is not in the database. """
+        if not len(self._genes_sorted):
+            return np.full(len(gene_ids), -1, dtype=np.int64)
+
+        pos = np.searchsorted(self._genes_sorted, gene_ids)
+        pos[pos == len(self._genes_sorted)] = 0
+        found = self._genes_sorted[pos] == gene_ids
+        return np.where(found, self.group_id[self._gene_order[pos]], -1)
+
+    def _organism_rows(self, organism: str):
+        """ Return (groups, genes) of the target organism, both sorted by group. """
+        # Non-numeric taxonomy ids (-1) match no rows.
+        mask = self.tax_id == _to_int_array([organism])[0]
+        return self.group_id[mask], self.gene_id[mask]
+
+    def find_homologs(self, gene_ids: List[str], organism: str) -> List[Optional[str]]:
+        """ Find homologs of genes in organism.
+
+        Parameters
+        ----------
+        gene_ids : list
+            Entrez IDs of query genes.
+        organism : str
+            Taxonomy id of target organism.
+
+        Returns
+        -------
+        list
+            Entrez ID of a homolog for each query gene. None if the homolog does not exist or is not unique.
+        """
+        groups = self._groups(_to_int_array(gene_ids))
+        target_groups, target_genes = self._organism_rows(organism)
+
+        left = np.searchsorted(target_groups, groups, side='left')
+        right = np.searchsorted(target_groups, groups, side='right')
+        unique = (right - left == 1) & (groups >= 0)
+
+        homologs = np.full(len(groups), -1, dtype=np.int64)
+        homologs[unique] = target_genes[left[unique]]
+        return [str(h) if h >= 0 else None for h in homologs.tolist()]
 
     def find_homolog(self, gene_id: str, organism: str) -> Optional[str]:
         """ Find homolog gene in organism. If the homolog does not exist, return None. """
-        homology_group = self._homologs.get(str(gene_id), Gene()).homology_group_id
-        homologs = [
-            gene.gene_id for gene in self._homologs_by_group.get(homology_group, []) if gene.tax_id == organism
-        ]
-        if len(homologs) == 1:
-            return homologs[0]
-        else:
-            # Is possible that find more then one gene?
-            return None
+        return self.find_homologs([gene_id], organism)[0]
+
+    def homolog_matrix(self, gene_ids: List[str], organism: str) -> Tuple[sp.csr_matrix, List[str]]:
+        """ Full many-to-many mapping of genes to their homologs in organism.
+
+        Parameters
+        ----------
+        gene_ids : list
+            Entrez IDs of query genes.
+        organism : str
+            Taxonomy id of target organism.
+
+        Returns
+        -------
+        tuple
+            Binary sparse matrix (query genes x target genes) and Entrez IDs of target genes (matrix columns).
+            Target genes are sorted by their Entrez ID.
+        """
+        groups = self._groups(_to_int_array(gene_ids))
+        target_groups, target_genes = self._organism_rows(organism)
+
+        left = np.searchsorted(target_groups, groups, side='left')
+        right = np.searchsorted(target_groups, groups, side='right')
+        counts = np.where(groups >= 0, right - left, 0)
+
+        # Row indices (into target_genes) of all homologs, grouped by query gene.
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        rows = np.arange(indptr[-1]) - np.repeat(indptr[:-1] - left, counts)
+
+        columns, indices = np.unique(target_genes[rows], return_inverse=True)
+        matrix = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.int8), indices.ravel(), indptr), shape=(len(groups), len(columns))
+        )
+        return matrix, [str(gene) for gene in columns.tolist()]
+
+    def map_homologs(
+        self, gene_ids: List[str], organism: str, strategy: str = HOMOLOGS_FIRST
+    ) -> List[Union[Optional[str], List[str]]]:
+        """ Find homologs of genes in organism, including genes with more than one homolog.
+
+        Parameters
+        ----------
+        gene_ids : list
+            Entrez IDs of query genes.
+        organism : str
+            Taxonomy id of target organism.
+        strategy : str
+            How to collapse multiple homologs of a gene:
+
+            * ``'first'`` -- homolog with the lowest Entrez ID, None if there is no homolog.
+            * ``'all'`` -- a list of all homologs (empty if there is no homolog).
+
+        Returns
+        -------
+        list
+            Homologs of each query gene.
+        """
+        if strategy not in HOMOLOGS_STRATEGIES:
+            raise ValueError(f'Unknown strategy {strategy!r}, use one of {HOMOLOGS_STRATEGIES}')
+
+        matrix, columns = self.homolog_matrix(gene_ids, organism)
+        indptr, indices = matrix.indptr, matrix.indices
+
+        if strategy == HOMOLOGS_FIRST:
+            return [columns[indices[start]] if start < end else None for start, end in zip(indptr[:-1], indptr[1:])]
+        return [[columns[i] for i in indices[start:end]] for start, end in zip(indptr[:-1], indptr[1:])]
+
+    def aggregate_expression(
+        self, data, gene_ids: List[str], organism: str, aggregate: str = AGGREGATE_SUM
+    ) -> Tuple[Union[np.ndarray, sp.spmatrix], List[str]]:
+        """ Map expression data to homologs in organism.
+
+        Expression of source genes that share a homolog is aggregated into a single column, and a source gene
+        with several homologs contributes to each of them. This is computed as a single sparse matrix product.
+
+        Parameters
+        ----------
+        data : array-like or sparse matrix
+            Expression data (samples x genes), columns correspond to `gene_ids`.
+        gene_ids : list
+            Entrez IDs of genes (columns of `data`).
+        organism : str
+            Taxonomy id of target organism.
+        aggregate : str
+            ``'sum'`` or ``'mean'`` of expression of source genes mapped to the same homolog.
+
+        Returns
+        -------
+        tuple
+            Expression data (samples x target genes) and Entrez IDs of target genes.
+        """
+        if aggregate not in (AGGREGATE_SUM, AGGREGATE_MEAN):
+            raise ValueError(f'Unknown aggregate {aggregate!r}')
+
+        matrix, columns = self.homolog_matrix(gene_ids, organism)
+        matrix = matrix.astype(float)
+
+        if aggregate == AGGREGATE_MEAN:
+            matrix = matrix @ sp.diags(1 / np.maximum(matrix.sum(axis=0).A1, 1))
+
+        result = data @ matrix if sp.issparse(data) else np.asarray(data, dtype=float) @ matrix
+        return result, columns
 
 
 if __name__ == "__main__":
@@ -53,7 +232,7 @@ if __name__ == "__main__":
     genes = Orange.data.Table("brown-selected")
 
     gm.genes = genes
-    _homologs = [homology.find_homolog(str(gene.gene_id), '9606') for gene in gm.genes]
+    _homologs = homology.find_homologs([str(gene.gene_id) for gene in gm.genes], '9606')
     _homologs = load_gene_summary('9606', _homologs)
 
     for gene, homolog in zip(gm.genes, _homologs):
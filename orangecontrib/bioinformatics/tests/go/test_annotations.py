@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from orangecontrib.bioinformatics import go
+from orangecontrib.bioinformatics.utils import statistics
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestAnnotations(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.ontology = go.Ontology(os.path.join(DATA_DIR, 'ontology.obo'))
+
+    def setUp(self) -> None:
+        self.file_path = os.path.join(DATA_DIR, 'gene2go.tab')
+        self.annotations = go.Annotations('9606', ontology=self.ontology, filename=self.file_path)
+
+    def naive_enrichment(self, genes, reference, prob):
+        """ Test every term annotated to query genes, propagating annotations with extract_super_graph. """
+        annotated = {}
+        for a in self.annotations.annotations:
+            for term in self.ontology.extract_super_graph([self.ontology[a.go_id].id]):
+                annotated.setdefault(term, set()).add(a.gene_id)
+
+        results = {}
+        for term, term_genes in annotated.items():
+            mapped = term_genes & set(genes) & set(reference)
+            if term_genes & set(genes):
+                ref_count = len(term_genes & set(reference))
+                p_value = prob.p_value(len(mapped), len(reference), ref_count, len(genes))
+                results[term] = (sorted(mapped), p_value, ref_count)
+        return results
+
+    def test_enriched_terms(self):
+        genes, reference = ['1', '2', '3'], self.annotations.genes()
+        self.assertEqual(reference, {str(gene) for gene in range(1, 9)})
+
+        for prob in (statistics.Binomial(), statistics.Hypergeometric()):
+            results = self.annotations.get_enriched_terms(genes, prob=prob, use_fdr=False)
+            expected = self.naive_enrichment(genes, reference, prob)
+            self.assertEqual(set(results), set(expected))
+            self.assertEqual(results['GO:0000009'][0], ['1'])
+            for term, (term_genes, p_value, ref_count) in results.items():
+                self.assertEqual(sorted(term_genes), expected[term][0])
+                self.assertAlmostEqual(p_value, expected[term][1])
+                self.assertEqual(ref_count, expected[term][2])
+
+        results = self.annotations.get_enriched_terms(genes, reference=['1', '2', '3', '6'], aspect='Process')
+        self.assertEqual(results['GO:0000006'][2], 3)
+        self.assertEqual(sorted(results['GO:0000006'][0]), ['1', '2'])
+        # p-values are FDR adjusted and listed in increasing order
+        p_values = [p_value for _, p_value, _ in results.values()]
+        self.assertEqual(p_values, sorted(p_values))
+
+        results = self.annotations.get_enriched_terms(['1', '7'], aspect='Component', use_fdr=False)
+        self.assertEqual(set(results), {'GO:0000008', 'GO:0000009'})
+
+    def test_genes_by_term(self):
+        self.assertEqual(sorted(self.annotations.get_genes_by_go_term('GO:0000003')), [1, 2, 3, 4])
+        # part_of is followed, NOT annotations (gene 8) are ignored
+        self.assertEqual(sorted(self.annotations.get_genes_by_go_term('GO:0000006')), [1, 2, 6])
+        self.assertEqual(len(self.annotations.get_annotations_by_go_id('GO:0000004')), 4)
+
+    def test_batches(self):
+        # a batch is a few lines, the result is the same as with a single batch
+        with mock.patch.object(go, 'ANNOTATIONS_BATCH_SIZE', 100):
+            annotations = go.Annotations('9606', ontology=self.ontology, filename=self.file_path)
+        self.assertEqual(len(annotations), 9)
+        self.assertEqual(annotations.header.split('\t')[0], '#tax_id')
+        self.assertEqual(list(annotations), list(self.annotations))
+        self.assertEqual(set(annotations.gene_annotations), {str(gene) for gene in range(1, 9)})
+
+    def test_add_annotations(self):
+        annotations = self.annotations
+        self.assertEqual(sorted(annotations.get_genes_by_go_term('GO:0000004')), [1, 2, 3, 5])
+        self.assertEqual(len(annotations.get_annotations_by_go_id('GO:0000004')), 4)
+        self.assertNotIn('9', annotations.genes())
+
+        # derived data is invalidated when annotations are added
+        annotations.add_annotation('9606\t9\tGO:0000004\tIDA\t-\tterm\t-\tProcess')
+        self.assertEqual(sorted(annotations.get_genes_by_go_term('GO:0000004')), [1, 2, 3, 5, 9])
+        self.assertEqual(len(annotations.get_annotations_by_go_id('GO:0000004')), 5)
+        self.assertEqual(annotations.get_enriched_terms(['9'])['GO:0000004'][0], ['9'])
+
+        # NOT annotations are skipped
+        annotations.extend(
+            [
+                '9606\t10\tGO:0000004\tIDA\t-\tterm\t-\tProcess',
+                '9606\t11\tGO:0000004\tIDA\tNOT\tterm\t-\tProcess',
+            ]
+        )
+        self.assertEqual(len(annotations), 11)
+        self.assertEqual(sorted(annotations.get_genes_by_go_term('GO:0000004')), [1, 2, 3, 5, 9, 10])
+
+    def test_evidence_codes(self):
+        annotations = self.annotations
+        self.assertEqual(sorted(annotations.get_genes_by_go_term('GO:0000003', evidence_codes=['IDA'])), [1, 3])
+        self.assertEqual(sorted(annotations.get_genes_by_go_term('GO:0000003', ['IDA', 'TAS'])), [1, 3, 4])
+
+        terms = annotations.get_annotated_terms(['1', '2'], evidence_codes=['IMP'])
+        self.assertEqual(set(terms), self.ontology.extract_super_graph(['GO:0000007']))
+        self.assertTrue(all(genes == {'2'} for genes in terms.values()))
+        terms = annotations.get_annotated_terms(['1', '2'], direct_annotation_only=True, evidence_codes=['IDA', 'IEA'])
+        self.assertEqual(terms, {'GO:0000007': {'1'}, 'GO:0000009': {'1'}})
+
+        results = annotations.get_enriched_terms(['5', '8'], evidence_codes=['IEA'], use_fdr=False)
+        self.assertEqual(set(results), {'GO:0000001', 'GO:0000002', 'GO:0000004'})
+        self.assertEqual(results['GO:0000002'][2], 2)
+
+        # codes that are not in evidence_dict are matched by name
+        annotations.add_annotation('9606\t9\tGO:0000004\tHTP\t-\tterm\t-\tProcess')
+        self.assertEqual(annotations.get_genes_by_go_term('GO:0000004', evidence_codes=['HTP']), [9])
+        self.assertEqual(sorted(annotations.get_genes_by_go_term('GO:0000004', ['HTP', 'IEA'])), [5, 9])
+
+    def test_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        file_path = os.path.join(tmp_dir, 'gene2go.tab')
+        shutil.copy(self.file_path, file_path)
+
+        annotations = go.Annotations('9606', ontology=self.ontology, filename=file_path, cache=True)
+        self.assertTrue(os.path.exists(file_path + go.ANNOTATIONS_CACHE_SUFFIX))
+        with mock.patch.object(go.Annotations, '_parse_file', side_effect=AssertionError):
+            cached = go.Annotations('9606', ontology=self.ontology, filename=file_path, cache=True)
+
+        self.assertEqual(len(cached), len(annotations))
+        self.assertEqual(cached.header, annotations.header)
+        self.assertEqual(cached.genes(), annotations.genes())
+        self.assertEqual(cached.get_enriched_terms(['1', '2']), annotations.get_enriched_terms(['1', '2']))
+        self.assertEqual(sorted(cached.get_genes_by_go_term('GO:0000003', ['IDA'])), [1, 3])
+        # records are created from columns when needed
+        self.assertEqual(sorted(cached), sorted(annotations))
+        self.assertEqual(set(cached.gene_annotations), set(annotations.gene_annotations))
+
+        # the cache is rebuilt when the file changes
+        with open(file_path, 'a') as f:
+            f.write('9606\t9\tGO:0000004\tIDA\t-\tterm\t-\tProcess\n')
+        self.assertEqual(len(go.Annotations('9606', ontology=self.ontology, filename=file_path, cache=True)), 10)
+        self.assertEqual(len(go.Annotations('9606', ontology=self.ontology, filename=file_path, cache=True)), 10)
+
+        # arrays of `cached` are memory mapped from the old cache, which is replaced, not overwritten
+        with open(self.file_path) as f:
+            lines = f.readlines()
+        with open(file_path, 'w') as f:
+            f.writelines(lines[:2])
+        self.assertEqual(len(go.Annotations('9606', ontology=self.ontology, filename=file_path, cache=True)), 1)
+        self.assertEqual(len(go.Annotations('9606', ontology=self.ontology, filename=file_path, cache=True)), 1)
+        self.assertEqual(cached.get_genes_by_go_term('GO:0000004', evidence_codes=['IEA']), [5])
+        results = cached.get_enriched_terms(['6'], evidence_codes=['IDA'])
+        self.assertEqual(sorted(results), ['GO:0000001', 'GO:0000006'])
+
+    def test_slim_gene_counts(self):
+        self.ontology.set_slims_subset('goslim_test')
+        self.addCleanup(self.ontology.set_slims_subset, set())
+        # genes count for the most specific slims of their terms only, NOT annotations are ignored
+        self.assertEqual(
+            self.annotations.get_slim_gene_counts(), {'GO:0000001': 3, 'GO:0000002': 6, 'GO:0000008': 2}
+        )
+        self.assertEqual(
+            self.annotations.get_slim_gene_counts(evidence_codes=['IDA']),
+            {'GO:0000001': 2, 'GO:0000002': 2, 'GO:0000008': 1},
+        )
+        self.assertEqual(self.annotations.get_slim_gene_counts(aspect='Component'), {'GO:0000008': 2})
+
+    def test_enriched_terms_many(self):
+        gene_lists = [['1', '2', '3'], ['6'], [], ['7', 'unknown'], ['4', '5', '8']]
+        reference = [str(gene) for gene in range(1, 8)]
+        callback = mock.Mock()
+
+        for kwargs in ({}, {'reference': reference, 'evidence_codes': ['IDA', 'IEA']}, {'use_fdr': False}):
+            results = self.annotations.get_enriched_terms_many(gene_lists, progress_callback=callback, **kwargs)
+            self.assertEqual(len(results), len(gene_lists))
+            for genes, result in zip(gene_lists, results):
+                self.assertEqual(result, self.annotations.get_enriched_terms(genes, **kwargs))
+        self.assertEqual(callback.call_args[0][0], 100)
+
+        self.ontology.set_slims_subset('goslim_test')
+        self.addCleanup(self.ontology.set_slims_subset, set())
+        results = self.annotations.get_enriched_terms_many(gene_lists, slims_only=True)
+        self.assertEqual(set(results[0]), {'GO:0000001', 'GO:0000002', 'GO:0000008'})
+        self.assertEqual(set(results[3]), {'GO:0000008'})
+        self.assertEqual(results[2], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
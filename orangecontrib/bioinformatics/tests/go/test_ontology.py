@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from orangecontrib.bioinformatics import go
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestOntology(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'ontology.obo')
+        shutil.copy(os.path.join(DATA_DIR, 'ontology.obo'), self.file_path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def check_ontology(self, ontology):
+        self.assertEqual(len(ontology), 10)
+        self.assertIn('GO:0000007', ontology)
+        self.assertIn('GO:0000103', ontology)
+        self.assertTrue({'is_a', 'part_of', 'has_part'} <= set(ontology.typedefs))
+
+        term = ontology['GO:0000007']
+        self.assertEqual(term.id, 'GO:0000007')
+        self.assertEqual(term.name, 'cellular glucose catabolic process')
+        self.assertEqual(term.namespace, 'biological_process')
+        self.assertEqual(
+            set(term.related),
+            {('is_a', 'GO:0000005'), ('part_of', 'GO:0000006'), ('has_part', 'GO:0000009')},
+        )
+        self.assertEqual(set(ontology['GO:0000006'].related_to), {('part_of', 'GO:0000007')})
+
+        # alternative ids map to the term
+        self.assertEqual(ontology['GO:0000103'].id, 'GO:0000003')
+        self.assertEqual(ontology.alias_mapper, {'GO:0000103': 'GO:0000003'})
+        # tags that are not indexed are read from the file
+        self.assertIn('breakdown of substances', ontology['GO:0000003'].def_)
+        self.assertEqual(ontology['GO:0000010'].is_obsolete, 'true')
+        self.assertEqual(ontology.defined_slims_subsets(), ['goslim_test'])
+
+    def test_parse(self):
+        self.check_ontology(go.Ontology(self.file_path))
+        self.assertFalse(os.path.exists(self.file_path + go.ONTOLOGY_CACHE_SUFFIX))
+
+    def test_cache(self):
+        self.check_ontology(go.Ontology(self.file_path, cache=True))
+        self.assertTrue(os.path.exists(self.file_path + go.ONTOLOGY_CACHE_SUFFIX))
+        # loaded from the cache
+        self.check_ontology(go.Ontology(self.file_path, cache=True))
+
+        # the cache is rebuilt when the file changes
+        with open(self.file_path, 'a') as f:
+            f.write('\n[Term]\nid: GO:0000011\nname: new process\nnamespace: biological_process\n')
+        ontology = go.Ontology(self.file_path, cache=True)
+        self.assertEqual(len(ontology), 11)
+        self.assertEqual(ontology['GO:0000011'].name, 'new process')
+
+    def test_rebuild_mapped_cache(self):
+        go.Ontology(self.file_path, cache=True)
+        # arrays of this ontology are memory mapped from the cache
+        old = go.Ontology(self.file_path, cache=True)
+
+        # the cache is rebuilt with smaller arrays, the old ontology is still usable
+        with open(self.file_path, 'r') as f:
+            content = f.read()
+        with open(self.file_path, 'w') as f:
+            f.write(content[: content.index('[Term]\nid: GO:0000002')])
+        self.assertEqual(len(go.Ontology(self.file_path, cache=True)), 1)
+        self.assertEqual(len(go.Ontology(self.file_path, cache=True)), 1)
+        self.assertEqual(old.term_depths(['GO:0000007'], maximum=True).tolist(), [5])
+        self.assertEqual(old['GO:0000009'].name, 'membrane')
+
+    def test_corrupt_cache(self):
+        go.Ontology(self.file_path, cache=True)
+        with open(os.path.join(self.file_path + go.ONTOLOGY_CACHE_SUFFIX, 'metadata.json'), 'w') as f:
+            f.write('{')
+        self.check_ontology(go.Ontology(self.file_path, cache=True))
+
+    def test_graph(self):
+        ontology = go.Ontology(self.file_path)
+        # has_part is not a relation to an ancestor
+        self.assertEqual(
+            ontology.extract_super_graph(['GO:0000007']),
+            {'GO:0000007', 'GO:0000005', 'GO:0000004', 'GO:0000003', 'GO:0000002', 'GO:0000006', 'GO:0000001'},
+        )
+        self.assertEqual(ontology.extract_super_graph('GO:0000009'), {'GO:0000009', 'GO:0000008'})
+        self.assertEqual(
+            ontology.extract_sub_graph(['GO:0000002']),
+            {'GO:0000002', 'GO:0000003', 'GO:0000004', 'GO:0000005', 'GO:0000007'},
+        )
+        self.assertEqual(ontology.extract_sub_graph(['GO:0000009']), {'GO:0000009'})
+        # alternative ids
+        self.assertEqual(ontology.extract_super_graph(['GO:0000103']), {'GO:0000103', 'GO:0000002', 'GO:0000001'})
+
+    def test_slims(self):
+        ontology = go.Ontology(self.file_path)
+        self.assertEqual(ontology.named_slims_subset('goslim_test'), ['GO:0000001', 'GO:0000002', 'GO:0000008'])
+        self.assertEqual(ontology.named_slims_subset('goslim_unknown'), [])
+
+        ontology.set_slims_subset('goslim_test')
+        terms = ['GO:0000001', 'GO:0000003', 'GO:0000006', 'GO:0000007', 'GO:0000009', 'GO:0000103']
+        self.assertEqual(
+            ontology.map_to_slims(terms),
+            {
+                'GO:0000001': {'GO:0000001'},
+                'GO:0000003': {'GO:0000002'},
+                'GO:0000006': {'GO:0000001'},
+                # the nearest slim on each path to the root
+                'GO:0000007': {'GO:0000001', 'GO:0000002'},
+                'GO:0000009': {'GO:0000008'},
+                'GO:0000103': {'GO:0000002'},
+            },
+        )
+        for term, slims in ontology.map_to_slims(terms).items():
+            self.assertEqual(ontology.slims_for_term(term), slims)
+
+        # mappings follow changes of the subset
+        ontology.set_slims_subset({'GO:0000003', 'GO:0000006'})
+        self.assertEqual(
+            ontology.map_to_slims(['GO:0000007', 'GO:0000004', 'GO:0000009']),
+            {'GO:0000007': {'GO:0000003', 'GO:0000006'}, 'GO:0000004': set(), 'GO:0000009': set()},
+        )
+
+        ontology.set_slims_subset('goslim_test')
+        counts = ontology.slim_gene_counts(
+            ['GO:0000007', 'GO:0000005', 'GO:0000009', 'GO:0000103', 'GO:0000099'], ['a', 'a', 'a', 'b', 'c']
+        )
+        self.assertEqual(counts, {'GO:0000001': 1, 'GO:0000002': 2, 'GO:0000008': 1})
+        self.assertEqual(ontology.slim_gene_counts([], []), {})
+
+    def test_depths(self):
+        ontology = go.Ontology(self.file_path)
+        terms = ['GO:{:07d}'.format(i) for i in range(1, 11)]
+        # roots (and the obsolete term without parents) have depth 1, has_part is not followed
+        self.assertEqual(ontology.term_depths(terms).tolist(), [1, 2, 3, 3, 4, 2, 3, 1, 2, 1])
+        self.assertEqual(ontology.term_depths(terms, maximum=True).tolist(), [1, 2, 3, 3, 4, 2, 5, 1, 2, 1])
+        self.assertEqual(ontology.term_depth('GO:0000007'), 3)
+        self.assertEqual(ontology.term_depth('GO:0000103'), 3)
+        self.assertEqual(ontology.term_depths([]).tolist(), [])
+
+        # depths from the cache are the same
+        go.Ontology(self.file_path, cache=True)
+        cached = go.Ontology(self.file_path, cache=True)
+        self.assertEqual(cached.term_depths(terms, maximum=True).tolist(), [1, 2, 3, 3, 4, 2, 5, 1, 2, 1])
+
+    def write_obo(self, stanzas):
+        with open(self.file_path, 'w') as f:
+            f.write('format-version: 1.2\n')
+            for term_id, relations in stanzas:
+                f.write('\n[Term]\nid: {}\nname: {}\nnamespace: biological_process\n'.format(term_id, term_id))
+                f.write(''.join(relation + '\n' for relation in relations))
+
+    def test_has_part_cycle(self):
+        self.write_obo(
+            [
+                ('GO:1', []),
+                ('GO:2', ['is_a: GO:1', 'relationship: has_part GO:3']),
+                ('GO:3', ['is_a: GO:1', 'relationship: part_of GO:2']),
+            ]
+        )
+        ontology = go.Ontology(self.file_path)
+        self.assertEqual(ontology.extract_super_graph(['GO:3']), {'GO:1', 'GO:2', 'GO:3'})
+        self.assertEqual(ontology.extract_sub_graph(['GO:2']), {'GO:2', 'GO:3'})
+        self.assertEqual(ontology.term_depth('GO:3'), 2)
+
+    def test_invalid_cycle(self):
+        # an is_a cycle is not valid, but it must not break the ontology
+        self.write_obo(
+            [('GO:1', []), ('GO:2', ['is_a: GO:1', 'is_a: GO:3']), ('GO:3', ['is_a: GO:2']), ('GO:4', ['is_a: GO:3'])]
+        )
+        ontology = go.Ontology(self.file_path)
+        with self.assertWarns(RuntimeWarning):
+            super_graph = ontology.extract_super_graph(['GO:4'])
+        # terms of the cycle get parents of the whole cycle
+        self.assertEqual(super_graph, {'GO:4', 'GO:3', 'GO:1'})
+        self.assertEqual(ontology.extract_super_graph(['GO:2']), {'GO:2', 'GO:1'})
+        self.assertEqual(ontology.extract_sub_graph(['GO:1']), {'GO:1', 'GO:2', 'GO:3', 'GO:4'})
+        self.assertEqual(ontology.term_depths(['GO:1', 'GO:2', 'GO:3', 'GO:4']).tolist(), [1, 2, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import math
+import unittest
+
+import numpy as np
+
+from orangecontrib.bioinformatics import go
+from orangecontrib.bioinformatics.go import similarity
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestSimilarity(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.ontology = go.Ontology(os.path.join(DATA_DIR, 'ontology.obo'))
+        cls.annotations = go.Annotations(
+            '9606', ontology=cls.ontology, filename=os.path.join(DATA_DIR, 'gene2go.tab')
+        )
+        cls.ic = cls.annotations.information_content(aspect='Process')
+
+    def naive_similarity(self, term1, term2, measure):
+        common = self.ontology.extract_super_graph([term1]) & self.ontology.extract_super_graph([term2])
+        if not common:
+            return 0.0
+        mica = max(self.ic[term] for term in common)
+        ic1, ic2 = self.ic[term1], self.ic[term2]
+        if measure == similarity.SIMILARITY_RESNIK:
+            return mica
+        if measure == similarity.SIMILARITY_LIN:
+            return 2 * mica / (ic1 + ic2) if ic1 + ic2 > 0 else 1.0
+        return 1 / (1 + ic1 + ic2 - 2 * mica)
+
+    def test_information_content(self):
+        # 7 genes are annotated to the root of biological process
+        expected = {
+            'GO:0000001': 0,
+            'GO:0000002': math.log(7 / 6),
+            'GO:0000003': math.log(7 / 4),
+            'GO:0000004': math.log(7 / 4),
+            'GO:0000005': math.log(7 / 3),
+            'GO:0000006': math.log(7 / 3),
+            'GO:0000007': math.log(7 / 2),
+        }
+        self.assertEqual(set(self.ic), set(expected))
+        for term, ic in expected.items():
+            self.assertAlmostEqual(self.ic[term], ic)
+
+        # roots of namespaces are computed separately
+        ic = self.annotations.information_content()
+        self.assertEqual(ic['GO:0000008'], 0)
+        self.assertEqual(ic['GO:0000009'], 0)
+        self.assertAlmostEqual(ic['GO:0000007'], self.ic['GO:0000007'])
+
+        ic = similarity.information_content([4, 2, 0, 1], [0, 0, 0, -1])
+        np.testing.assert_array_equal(ic, [0, np.log(2), np.nan, 0])
+
+    def test_term_similarity(self):
+        terms = sorted(self.ic)
+        for measure in similarity.SIMILARITY_MEASURES:
+            matrix = self.annotations.term_similarity(terms, measure=measure, aspect='Process')
+            self.assertEqual(matrix.shape, (len(terms), len(terms)))
+            for i, term1 in enumerate(terms):
+                for j, term2 in enumerate(terms):
+                    self.assertAlmostEqual(matrix[i, j], self.naive_similarity(term1, term2, measure))
+
+        matrix = self.annotations.term_similarity(['GO:0000007', 'GO:0000006'], ['GO:0000004'], aspect='Process')
+        np.testing.assert_allclose(matrix, [[math.log(7 / 4)], [0]])
+        with self.assertRaises(ValueError):
+            self.annotations.term_similarity(terms, measure='cosine')
+
+    def test_gene_similarity(self):
+        genes = ['1', '3', '6', '8', '7', 'unknown']
+        gene_terms = {
+            gene: [a.go_id for a in self.annotations.gene_annotations[gene] if a.aspect == 'Process']
+            for gene in genes[:4]
+        }
+        for measure in similarity.SIMILARITY_MEASURES:
+            matrix = self.annotations.gene_similarity(genes, measure=measure, chunk_size=2)
+            self.assertEqual(matrix.shape, (len(genes), len(genes)))
+            np.testing.assert_array_equal(matrix, matrix.T)
+            # genes without annotations in the aspect
+            self.assertTrue(np.isnan(matrix[4:]).all() and np.isnan(matrix[:, 4:]).all())
+
+            for i, gene1 in enumerate(genes[:4]):
+                for j, gene2 in enumerate(genes[:4]):
+                    terms = self.annotations.term_similarity(
+                        gene_terms[gene1], gene_terms[gene2], measure=measure, aspect='Process'
+                    )
+                    expected = (terms.max(axis=1).mean() + terms.max(axis=0).mean()) / 2
+                    self.assertAlmostEqual(matrix[i, j], expected, places=5)
+
+            parallel = self.annotations.gene_similarity(genes, measure=measure, chunk_size=1, max_workers=2)
+            np.testing.assert_allclose(parallel, matrix, equal_nan=True)
+
+        with self.assertRaises(ValueError):
+            self.annotations.gene_similarity(genes, measure='cosine')
+
+
+if __name__ == '__main__':
+    unittest.main()
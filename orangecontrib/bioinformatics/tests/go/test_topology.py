@@ -0,0 +1,127 @@
+import os
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from orangecontrib.bioinformatics import go
+from orangecontrib.bioinformatics.go import topology
+from orangecontrib.bioinformatics.utils import statistics
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+class TestTopology(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.ontology = go.Ontology(os.path.join(DATA_DIR, 'ontology.obo'))
+        cls.annotations = go.Annotations(
+            '9606', ontology=cls.ontology, filename=os.path.join(DATA_DIR, 'gene2go.tab')
+        )
+        cls.prob = statistics.Hypergeometric()
+
+    def term_genes(self):
+        """ Genes annotated to each term, annotations are propagated with extract_super_graph. """
+        genes = {}
+        for a in self.annotations.annotations:
+            for term in self.ontology.extract_super_graph([self.ontology[a.go_id].id]):
+                genes.setdefault(term, set()).add(a.gene_id)
+        return genes
+
+    def parents(self, term):
+        return {
+            parent for relation, parent in self.ontology[term].related if relation in go.ANCESTOR_RELATIONS
+        }
+
+    def assertResults(self, results, expected):  # noqa: N802
+        self.assertEqual(set(results), set(expected))
+        for term, (genes, p_value, ref_count) in results.items():
+            self.assertEqual(sorted(genes), expected[term][0], term)
+            self.assertAlmostEqual(p_value, expected[term][1], msg=term)
+            self.assertEqual(ref_count, expected[term][2], term)
+
+    def test_elim(self):
+        genes = {'1', '2', '3'}
+        reference = self.annotations.genes()
+        term_genes = self.term_genes()
+        terms = [term for term, annotated in term_genes.items() if annotated & genes]
+
+        for cutoff in (0.01, 0.5):
+            expected, removed = {}, {term: set() for term in terms}
+            # descendants are processed before their ancestors
+            depths = dict(zip(terms, self.ontology.term_depths(terms, maximum=True).tolist()))
+            for term in sorted(terms, key=depths.get, reverse=True):
+                counted = term_genes[term] - removed[term]
+                p_value = self.prob.p_value(len(counted & genes), len(reference), len(counted), len(genes))
+                expected[term] = (sorted(counted & genes), p_value, len(counted))
+                if p_value < cutoff:
+                    for ancestor in self.ontology.extract_super_graph([term]) - {term}:
+                        removed[ancestor] |= term_genes[term]
+
+            results = self.annotations.get_enriched_terms_topology(genes, method='elim', cutoff=cutoff)
+            self.assertResults(results, expected)
+
+        # genes of GO:0000005 are removed from its ancestors
+        self.assertEqual(results['GO:0000004'][2], 1)
+        self.assertEqual(results['GO:0000003'][2], 1)
+
+    def test_parent_child(self):
+        genes = {'1', '2', '3', '6'}
+        reference = self.annotations.genes()
+        term_genes = self.term_genes()
+        terms = [term for term, annotated in term_genes.items() if annotated & genes]
+
+        for method, combine in (
+            (topology.TOPOLOGY_PARENT_CHILD_UNION, set.union),
+            (topology.TOPOLOGY_PARENT_CHILD_INTERSECTION, set.intersection),
+        ):
+            expected = {}
+            for term in terms:
+                parents = self.parents(term)
+                population = combine(*(term_genes[p] for p in parents)) if parents else reference
+                p_value = self.prob.p_value(
+                    len(term_genes[term] & genes), len(population), len(term_genes[term]), len(population & genes)
+                )
+                expected[term] = (sorted(term_genes[term] & genes), p_value, len(term_genes[term]))
+
+            self.assertResults(self.annotations.get_enriched_terms_topology(genes, method=method), expected)
+
+    def test_weight(self):
+        genes = {'1', '2', '3'}
+        results = self.annotations.get_enriched_terms_topology(genes, method='weight')
+        classic = self.annotations.get_enriched_terms(genes, prob=self.prob, use_fdr=False)
+        self.assertEqual(set(results), set(classic))
+        for term, (term_genes, p_value, _) in results.items():
+            self.assertEqual(sorted(term_genes), sorted(classic[term][0]))
+            self.assertTrue(0 <= p_value <= 1)
+
+    def test_weight_chain(self):
+        # a child (genes 0, 1) of a parent (genes 0, 1, 2), query genes are 0 and 1
+        annotations = sp.csc_matrix(np.array([[1, 1], [1, 1], [1, 0], [0, 0]], dtype=bool))
+        query = np.array([True, True, False, False])
+        levels = np.array([0, 1])
+        parents = sp.csr_matrix(np.array([[0, 0], [1, 0]], dtype=bool))
+        k, m, p_values, counted = topology.weight(annotations, query, levels, parents, 2, 4, self.prob)
+
+        # the child is more significant, so its genes are down-weighted in the parent
+        ratio = np.log10(2) / np.log10(6)
+        np.testing.assert_allclose(k, [2 * ratio, 2])
+        np.testing.assert_allclose(m, [2 * ratio + 1, 2])
+        np.testing.assert_allclose(p_values, [5 / 6, 1 / 6])
+        np.testing.assert_array_equal(counted.toarray(), annotations.toarray())
+
+    def test_reference_and_aspect(self):
+        results = self.annotations.get_enriched_terms_topology(
+            ['1', '7'], reference=['1', '2', '7'], method='elim', aspect='Component'
+        )
+        self.assertEqual(set(results), {'GO:0000008', 'GO:0000009'})
+        self.assertEqual(sorted(results['GO:0000009'][0]), ['1', '7'])
+        self.assertEqual(results['GO:0000008'][2], 2)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            self.annotations.get_enriched_terms_topology(['1'], method='classic')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import os
 import shutil
 import tempfile
 import unittest
@@ -84,6 +85,15 @@ class TestKeggApi(unittest.TestCase):
         self.assertIsNotNone(api.list_pathways("hsa"))
         self.assertIsNotNone(api.info("pathway"))
 
+    def test_obsolete_cache(self):
+        obsolete = os.path.join(self._tmpdir, keggapi.OBSOLETE_CACHE_FILENAMES[0])
+        with open(obsolete, "wb") as f:
+            f.write(b"old cache")
+
+        keggapi.CachedKeggApi().cache_store()
+        self.assertFalse(os.path.exists(obsolete))
+        self.assertTrue(os.path.exists(os.path.join(self._tmpdir, keggapi.CACHE_FILENAME)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,198 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from contextlib import closing
+
+from orangecontrib.bioinformatics.kegg import conf as keggconf
+from orangecontrib.bioinformatics.kegg import caching
+
+
+class Release(object):
+    """ An object with cached methods, entries are valid for the current KEGG release. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.release = 'r1'
+        self.calls = 0
+        self.error = False
+
+    def cache_store(self):
+        return caching.Sqlite3Store(self.filename)
+
+    def last_modified(self, args):
+        return self.release
+
+    def double(self, x):
+        self.calls += 1
+        if self.error:
+            raise OSError('KEGG is not reachable')
+        return 2 * x
+
+
+class TestSqlite3Store(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+        self.filename = os.path.join(self._tmpdir, 'cache.sqlite3')
+        self.store = caching.Sqlite3Store(self.filename)
+
+    def tearDown(self):
+        self.store.flush()
+        shutil.rmtree(self._tmpdir)
+
+    def count(self, key=None):
+        """ The number of entries committed to the database, as seen by another connection. """
+        with closing(sqlite3.connect(self.filename)) as con:
+            if key is None:
+                return con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return con.execute("SELECT COUNT(*) FROM entries WHERE key=?", (key,)).fetchone()[0]
+
+    def test_mapping(self):
+        store = self.store
+        for i in range(10):
+            store['key{}'.format(i)] = {'value': i}
+
+        self.assertEqual(store['key3'], {'value': 3})
+        self.assertIn('key3', store)
+        self.assertNotIn('unknown', store)
+        self.assertEqual(len(store), 10)
+        self.assertEqual(sorted(store), ['key{}'.format(i) for i in range(10)])
+
+        del store['key3']
+        self.assertNotIn('key3', store)
+        self.assertIsNone(store.get('key3'))
+        self.assertEqual(len(store), 9)
+        with self.assertRaises(KeyError):
+            del store['key3']
+        with self.assertRaises(KeyError):
+            store['unknown']
+
+        # stores of the same file share buffered writes
+        store['shared'] = 1
+        self.assertEqual(caching.Sqlite3Store(self.filename)['shared'], 1)
+
+        # entries can be deleted while iterating
+        for key in store:
+            del store[key]
+        self.assertEqual(len(store), 0)
+
+    def test_batches(self):
+        store = self.store
+        store['first'] = 1
+        self.assertEqual(self.count('first'), 0)
+        self.assertEqual(store['first'], 1)
+
+        with closing(store):
+            for i in range(caching.BATCH_SIZE - 1):
+                store[str(i)] = i
+        self.assertEqual(self.count(), caching.BATCH_SIZE)
+
+        store['last'] = 1
+        with mock.patch.object(caching, 'BATCH_INTERVAL', 0):
+            store.close()
+        self.assertEqual(self.count('last'), 1)
+
+        del store['last']
+        self.assertEqual(self.count('last'), 1)
+        caching._Database.flush_all()
+        self.assertEqual(self.count('last'), 0)
+
+    def test_evict(self):
+        store = self.store
+        value = os.urandom(20000)
+        with mock.patch.dict(keggconf.params, {'cache.max_size': '0.05'}):
+            store['hot'] = 1
+            for i in range(5):
+                store['value{}'.format(i)] = value
+                store.flush()
+                # reading an entry makes it recently used
+                self.assertEqual(store['hot'], 1)
+
+        # the least recently used entries are evicted, the total size is below 0.05 MB
+        self.assertEqual(sorted(store), ['hot', 'value3', 'value4'])
+
+        with mock.patch.dict(keggconf.params, {'cache.max_size': '0'}):
+            for i in range(5):
+                store['value{}'.format(i)] = value
+            store.flush()
+        self.assertEqual(len(store), 6)
+
+
+class TestCachedWrapper(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+        self.instance = Release(os.path.join(self._tmpdir, 'cache.sqlite3'))
+        self.double = caching.cached_wrapper(Release.double, self.instance, Release, self.instance.cache_store)
+
+    def tearDown(self):
+        caching._Database.flush_all()
+        shutil.rmtree(self._tmpdir)
+
+    def test_release(self):
+        instance, double = self.instance, self.double
+        self.assertEqual(double(2), 4)
+        self.assertEqual(double(2), 4)
+        self.assertEqual(instance.calls, 1)
+
+        # entries of another release are not valid
+        instance.release = 'r2'
+        self.assertEqual(double(2), 4)
+        self.assertEqual(instance.calls, 2)
+
+        # stale entries are used when KEGG is not reachable
+        instance.release, instance.error = 'r3', True
+        self.assertEqual(double(2), 4)
+        self.assertEqual(instance.calls, 3)
+        with self.assertRaises(OSError):
+            double(3)
+
+    def test_is_entry_valid(self):
+        self.instance.release = ''
+        double = self.double
+        now = datetime.now()
+        with mock.patch.dict(keggconf.params, {'cache.invalidate': 'weekly'}):
+            self.assertTrue(double.is_entry_valid(caching.cache_entry(1, mtime=now), None))
+            self.assertFalse(double.is_entry_valid(caching.cache_entry(1, mtime=now - timedelta(8)), None))
+            self.assertFalse(double.is_entry_valid(caching.cache_entry(1), None))
+        with mock.patch.dict(keggconf.params, {'cache.invalidate': 'always'}):
+            self.assertFalse(double.is_entry_valid(caching.cache_entry(1, mtime=now), None))
+
+        # an entry of the current release is valid regardless of its age
+        self.instance.release = 'r1'
+        entry = caching.cache_entry(1, mtime=now - timedelta(30), release='r1')
+        self.assertTrue(double.is_entry_valid(entry, None))
+        self.assertFalse(double.is_entry_valid(caching.cache_entry(1, mtime=now, release='r0'), None))
+
+    def test_invalidate(self):
+        double = self.double
+        double.memoize((5,), None, 10)
+        double.memoize((6,), None, 12)
+        with closing(self.instance.cache_store()) as store:
+            store['other'] = 1
+            self.assertEqual(store['double(5,)'].value, 10)
+            self.assertEqual(store['double(5,)'].release, 'r1')
+
+        double.invalidate_args((5,))
+        self.assertFalse(double.has_key('double(5,)'))
+        self.assertTrue(double.has_key('double(6,)'))
+
+        double.invalidate_all()
+        self.assertEqual(list(self.instance.cache_store()), ['other'])
+
+
+class TestDictStore(unittest.TestCase):
+    def test_dict_store(self):
+        store = caching.DictStore()
+        store['a'] = 1
+        store['b'] = 2
+        del store['a']
+        self.assertEqual(len(store), 1)
+        self.assertEqual(list(store), ['b'])
+        self.assertIn('b', store)
+
+
+if __name__ == '__main__':
+    unittest.main()
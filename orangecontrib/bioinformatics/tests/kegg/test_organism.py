@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from collections import defaultdict
+
+from orangecontrib.bioinformatics import kegg
+from orangecontrib.bioinformatics.kegg import conf as keggconf
+from orangecontrib.bioinformatics.utils import statistics
+
+links = [
+    ('hsa:1', 'path:hsa00010'),
+    ('hsa:2', 'path:hsa00010'),
+    ('hsa:3', 'path:hsa00010'),
+    ('hsa:2', 'path:hsa00020'),
+    ('hsa:4', 'path:hsa00020'),
+    ('hsa:5', 'path:hsa00030'),
+    ('hsa:10', 'path:hsa00030'),
+]
+
+
+class GenesPathwayOrganism:
+    """ Stands in for the cached `get_genes_pathway_organism` of :class:`kegg.api.CachedKeggApi`. """
+
+    def __init__(self):
+        self.calls = 0
+        self.valid = True
+
+    def __call__(self, org):
+        self.calls += 1
+        return {'hsa': list(links)}[org]
+
+    def is_entry_valid(self, entry, args):
+        return self.valid
+
+
+class MockApi:
+    def __init__(self):
+        self.get_genes_pathway_organism = GenesPathwayOrganism()
+
+
+class ScalarBinomial:
+    """ A distribution without vectorized p-values. """
+
+    def __init__(self):
+        self.prob = statistics.Binomial()
+
+    def p_value(self, k, N, m, n):  # noqa: N803
+        return self.prob.p_value(k, N, m, n)
+
+
+class TestOrganism(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="kegg-tests")
+        self._old_cache_path = keggconf.params["cache.path"]
+        keggconf.params["cache.path"] = self._tmpdir
+
+    def tearDown(self):
+        keggconf.params["cache.path"] = self._old_cache_path
+        shutil.rmtree(self._tmpdir)
+
+    def organism(self):
+        with mock.patch.object(kegg.Organism, 'organism_name_search', return_value='hsa'), mock.patch.object(
+            kegg.api, 'CachedKeggApi', MockApi
+        ):
+            return kegg.Organism('hsa')
+
+    def naive_enrichment(self, genes, reference, prob):
+        pathway_genes = defaultdict(set)
+        for gene, pathway in links:
+            pathway_genes[pathway].add(gene)
+
+        results = {}
+        for pathway, members in pathway_genes.items():
+            mapped = [gene for gene in genes if gene in members]
+            if mapped:
+                ref_count = len(members & set(reference))
+                p_value = prob.p_value(len(mapped), len(reference), ref_count, len(genes))
+                results[pathway] = (mapped, p_value, ref_count)
+        return results
+
+    def test_enriched_pathways(self):
+        organism = self.organism()
+        genes = ['hsa:2', 'hsa:1', 'hsa:10', 'unknown']
+        reference = ['hsa:{}'.format(i) for i in range(1, 10)] + ['hsa:10']
+
+        for prob in (statistics.Binomial(), statistics.Hypergeometric(), ScalarBinomial()):
+            results = organism.get_enriched_pathways(genes, reference, prob=prob)
+            expected = self.naive_enrichment(genes, reference, prob)
+            self.assertEqual(set(results), set(expected))
+            for pathway, (mapped, p_value, ref_count) in results.items():
+                self.assertEqual(sorted(mapped), sorted(expected[pathway][0]))
+                self.assertAlmostEqual(p_value, expected[pathway][1])
+                self.assertEqual(ref_count, expected[pathway][2])
+
+        # genes outside of the reference are counted in the query
+        results = organism.get_enriched_pathways(['hsa:4', 'hsa:5'], ['hsa:1', 'hsa:2'])
+        self.assertEqual(results['path:hsa00020'][0], ['hsa:4'])
+        self.assertEqual(results['path:hsa00020'][2], 1)
+        self.assertEqual(results['path:hsa00030'][2], 0)
+
+        self.assertEqual(organism.get_enriched_pathways(['unknown'], reference), {})
+        self.assertEqual(organism.get_enriched_pathways([], reference), {})
+
+        # links are retrieved once
+        self.assertEqual(organism.api.get_genes_pathway_organism.calls, 1)
+
+    def test_enriched_pathways_callback(self):
+        callback = mock.Mock()
+        self.organism().get_enriched_pathways(['hsa:1'], ['hsa:1', 'hsa:2'], callback=callback)
+        self.assertEqual([c[0][0] for c in callback.call_args_list], [50.0, 100.0])
+
+    def test_pathways_by_genes(self):
+        organism = self.organism()
+        self.assertEqual(organism.get_pathways_by_genes(['hsa:2']), ['path:hsa00010', 'path:hsa00020'])
+        self.assertEqual(organism.get_pathways_by_genes(['hsa:1', 'hsa:2', 'hsa:1']), ['path:hsa00010'])
+        self.assertEqual(organism.get_pathways_by_genes(['hsa:1', 'hsa:4']), [])
+        self.assertEqual(organism.get_pathways_by_genes(['hsa:2', 'unknown']), [])
+        self.assertEqual(organism.get_pathways_by_genes([]), [])
+
+    def test_pathway_index(self):
+        index_path = os.path.join(self._tmpdir, 'hsa' + kegg.PATHWAY_INDEX_SUFFIX)
+        organism = self.organism()
+        self.assertEqual(organism.get_pathways_by_genes(['hsa:5']), ['path:hsa00030'])
+        self.assertEqual(os.listdir(self._tmpdir), [os.path.basename(index_path)])
+
+        # the index is loaded from the cache
+        cached = self.organism()
+        self.assertEqual(cached.get_pathways_by_genes(['hsa:5']), ['path:hsa00030'])
+        self.assertEqual(cached.api.get_genes_pathway_organism.calls, 0)
+        self.assertEqual(
+            cached.get_enriched_pathways(['hsa:2', 'hsa:5'], ['hsa:1', 'hsa:2', 'hsa:5']),
+            organism.get_enriched_pathways(['hsa:2', 'hsa:5'], ['hsa:1', 'hsa:2', 'hsa:5']),
+        )
+
+        # an index that is out of date is rebuilt and replaced, arrays mapped from the old index stay valid
+        rebuilt = self.organism()
+        rebuilt.api.get_genes_pathway_organism.valid = False
+        self.assertEqual(rebuilt.get_pathways_by_genes(['hsa:4']), ['path:hsa00020'])
+        self.assertEqual(rebuilt.api.get_genes_pathway_organism.calls, 1)
+        self.assertEqual(os.listdir(self._tmpdir), [os.path.basename(index_path)])
+        self.assertEqual(cached.get_pathways_by_genes(['hsa:2']), ['path:hsa00010', 'path:hsa00020'])
+
+        # a corrupt index is rebuilt
+        with open(os.path.join(index_path, 'metadata.json'), 'w') as f:
+            f.write('{')
+        corrupt = self.organism()
+        self.assertEqual(corrupt.get_pathways_by_genes(['hsa:10']), ['path:hsa00030'])
+        self.assertEqual(corrupt.api.get_genes_pathway_organism.calls, 1)
+        self.assertEqual(self.organism().get_pathways_by_genes(['hsa:10']), ['path:hsa00030'])
+
+    def test_pathway_index_save_error(self):
+        organism = self.organism()
+        with mock.patch.object(kegg.np, 'save', side_effect=OSError):
+            self.assertEqual(organism.get_pathways_by_genes(['hsa:3']), ['path:hsa00010'])
+        # a partially written index is removed
+        self.assertEqual(os.listdir(self._tmpdir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
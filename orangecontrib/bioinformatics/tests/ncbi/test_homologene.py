@@ -1,6 +1,14 @@
+import os
+import shutil
+import tempfile
 import unittest
 from os.path import basename, normpath
+from unittest import mock
 
+import numpy as np
+import scipy.sparse as sp
+
+from orangecontrib.bioinformatics.utils import serverfiles
 from orangecontrib.bioinformatics.ncbi.homologene import HomoloGene
 
 
@@ -13,3 +21,86 @@ class TestHomoloGene(unittest.TestCase):
         self.assertEqual(self.homology.find_homolog('920', '9913'), '407098')
         self.assertEqual(self.homology.find_homolog('920', '10090'), '12504')
         self.assertEqual(self.homology.find_homolog('920', '10116'), '24932')
+
+    def test_find_homologs(self):
+        self.assertEqual(self.homology.find_homologs(['920', '920', 'unknown'], '10090'), ['12504', '12504', None])
+        self.assertEqual(self.homology.find_homologs([], '10090'), [])
+
+    def test_homolog_matrix(self):
+        matrix, columns = self.homology.homolog_matrix(['920', 'unknown'], '10090')
+        self.assertEqual(matrix.shape, (2, len(columns)))
+        self.assertIn('12504', columns)
+        self.assertEqual(matrix[0, columns.index('12504')], 1)
+        self.assertEqual(matrix[1].nnz, 0)
+
+        self.assertEqual(self.homology.map_homologs(['920', 'unknown'], '10090', strategy='all'), [['12504'], []])
+        self.assertRaises(ValueError, self.homology.map_homologs, ['920'], '10090', strategy='unknown')
+
+
+class TestHomoloGeneCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.tmp_dir, 'homologene.tab')
+        with open(self.file_path, 'w') as fp:
+            fp.write('1\t9606\t920\n1\t10090\t12504\n2\t9606\t921\n')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def homologene(self):
+        with mock.patch.object(serverfiles, 'localpath_download', return_value=self.file_path):
+            return HomoloGene()
+
+    def test_cache(self):
+        self.assertEqual(self.homologene().find_homologs(['920', '921'], '10090'), ['12504', None])
+        # no temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['homologene.tab', 'homologene.tab.npz'])
+        self.assertEqual(self.homologene().find_homologs(['920'], '10090'), ['12504'])
+
+    def test_truncated_cache(self):
+        with open(self.file_path + '.npz', 'wb') as fp:
+            fp.write(b'PK\x03\x04truncated')
+        self.assertEqual(self.homologene().find_homologs(['920'], '10090'), ['12504'])
+
+    def test_non_numeric_organism(self):
+        self.assertEqual(self.homologene().find_homologs(['920'], 'mouse'), [None])
+
+
+class TestAggregateExpression(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        file_path = os.path.join(self.tmp_dir, 'homologene.tab')
+        with open(file_path, 'w') as fp:
+            # 920 and 922 share a homolog, 921 has two homologs and 923 has none
+            fp.write('1\t9606\t920\n1\t9606\t922\n1\t10090\t12504\n')
+            fp.write('2\t9606\t921\n2\t10090\t2001\n2\t10090\t2002\n3\t9606\t923\n')
+        with mock.patch.object(serverfiles, 'localpath_download', return_value=file_path):
+            self.homology = HomoloGene()
+
+        self.genes = ['920', '922', '921', '923', 'unknown']
+        self.data = np.array([[1, 2, 4, 8, 16], [10, 20, 40, 80, 160]])
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sum(self):
+        result, columns = self.homology.aggregate_expression(self.data, self.genes, '10090')
+        self.assertEqual(columns, ['2001', '2002', '12504'])
+        np.testing.assert_array_equal(result, [[4, 4, 3], [40, 40, 30]])
+
+        result, columns = self.homology.aggregate_expression(sp.csr_matrix(self.data), self.genes, '10090')
+        self.assertTrue(sp.issparse(result))
+        np.testing.assert_array_equal(result.toarray(), [[4, 4, 3], [40, 40, 30]])
+
+    def test_mean(self):
+        result, columns = self.homology.aggregate_expression(self.data, self.genes, '10090', aggregate='mean')
+        self.assertEqual(columns, ['2001', '2002', '12504'])
+        np.testing.assert_array_equal(result, [[4, 4, 1.5], [40, 40, 15]])
+
+    def test_unmapped(self):
+        result, columns = self.homology.aggregate_expression(self.data[:, 3:], self.genes[3:], '10090')
+        self.assertEqual(columns, [])
+        self.assertEqual(result.shape, (2, 0))
+
+        with self.assertRaises(ValueError):
+            self.homology.aggregate_expression(self.data, self.genes, '10090', aggregate='max')
@@ -1,8 +1,18 @@
 import os
+import shutil
 import unittest
-from tempfile import mkstemp
+from tempfile import mkstemp, mkdtemp
+from unittest.mock import patch
 
+import numpy as np
+
+from Orange.data import Table, Domain, StringVariable, ContinuousVariable
+
+from orangecontrib.bioinformatics import geneset
 from orangecontrib.bioinformatics.geneset import GeneSet, GeneSets, GeneSetException, filename, filename_parse
+from orangecontrib.bioinformatics.geneset.gsea import _fdr, gsea
+from orangecontrib.bioinformatics.geneset.scoring import score_table, score_samples
+from orangecontrib.bioinformatics.geneset.utils import _open_gmt_file, write_gmt_file
 
 
 class TestGeneSets(unittest.TestCase):
@@ -54,6 +64,86 @@ class TestGeneSets(unittest.TestCase):
         os.close(fd)
         os.remove(file_name)
 
+    def test_gmt_file_non_numeric(self):
+        temp_dir = mkdtemp()
+        gs1 = GeneSet(gs_id='test1', name='name1', genes={'ENSG2', '10', 'ENSG1', '9'}, hierarchy=('A',), organism='1')
+        gs2 = GeneSet(gs_id='test2', name='name2', genes={'3', '21'}, hierarchy=('A',), organism='1')
+
+        def read(path):
+            with _open_gmt_file(path, 'r') as gmt_file:
+                return gmt_file.read()
+
+        for file_name in ('sets.gmt', 'sets.gmt.gz'):
+            file_path = os.path.join(temp_dir, file_name)
+            write_gmt_file(iter([gs1, gs2]), file_path)
+            lines = [line.split('\t')[2:] for line in read(file_path).splitlines()]
+            self.assertEqual(lines, [['9', '10', 'ENSG1', 'ENSG2'], ['3', '21']])
+
+            gene_sets = GeneSets.from_gmt_file_format(file_path)
+            self.assertEqual({gs.gs_id: gs.genes for gs in gene_sets}, {'test1': gs1.genes, 'test2': gs2.genes})
+
+            # encoded collections are written from the CSR matrix, the output must be the same
+            compact_path = os.path.join(temp_dir, 'compact-' + file_name)
+            gene_sets.compact()
+            gene_sets.to_gmt_file_format(compact_path)
+            GeneSets([gs1, gs2]).to_gmt_file_format(file_path)
+            self.assertEqual(read(compact_path), read(file_path))
+
+        shutil.rmtree(temp_dir)
+
+    def test_gmt_file_cache(self):
+        temp_dir = mkdtemp()
+        file_name = os.path.join(temp_dir, self.test_file)
+
+        gs1 = GeneSet(gs_id='test1', name='test_name1', genes={'1', '2'}, hierarchy=self.test_hierarchy, organism='1')
+        gs2 = GeneSet(gs_id='test2', name='test_name2', genes={'2', '3'}, hierarchy=self.test_hierarchy, organism='1')
+        GeneSets([gs1, gs2]).to_gmt_file_format(file_name)
+
+        parsed = GeneSets.from_gmt_file_format(file_name, cache=True)
+        self.assertTrue(os.path.isdir(file_name + '.cache'))
+
+        cached = GeneSets.from_gmt_file_format(file_name, cache=True)
+        self.assertEqual(parsed, cached)
+        self.assertEqual({gs.gs_id: gs.genes for gs in cached}, {'test1': {'1', '2'}, 'test2': {'2', '3'}})
+        self.assertEqual(cached.common_hierarchy(), self.test_hierarchy)
+
+        # genes of these sets are decoded from the memory mapped cache when accessed
+        lazy = GeneSets.from_gmt_file_format(file_name, cache=True)
+
+        # cache is invalidated when the source file changes
+        GeneSets([gs1]).to_gmt_file_format(file_name)
+        os.utime(file_name, ns=(0, 0))
+        self.assertEqual(len(GeneSets.from_gmt_file_format(file_name, cache=True)), 1)
+        self.assertEqual(len(GeneSets.from_gmt_file_format(file_name, cache=True)), 1)
+        self.assertEqual(sorted(os.listdir(temp_dir)), [self.test_file, self.test_file + '.cache'])
+
+        # the old cache was replaced, not overwritten, so sets loaded from it are still valid
+        self.assertEqual({gs.gs_id: gs.genes for gs in lazy}, {'test1': {'1', '2'}, 'test2': {'2', '3'}})
+
+        shutil.rmtree(temp_dir)
+
+    def test_gmt_files(self):
+        temp_dir = mkdtemp()
+        gs1 = GeneSet(gs_id='test1', name='test_name1', genes={'1', '2'}, hierarchy=('A', 'a'), organism='1')
+        gs2 = GeneSet(gs_id='test2', name='test_name2', genes={'2', '3'}, hierarchy=('B', 'b'), organism='1')
+        gs3 = GeneSet(gs_id='test3', name='test_name3', genes={'4'}, hierarchy=('B', 'b'), organism='1')
+
+        file_names = [os.path.join(temp_dir, filename(hierarchy, '1')) for hierarchy in (('A', 'a'), ('B', 'b'))]
+        GeneSets([gs1]).to_gmt_file_format(file_names[0])
+        GeneSets([gs2, gs3]).to_gmt_file_format(file_names[1])
+
+        # files are parsed in worker processes first, then loaded from caches
+        for max_workers in (2, 1):
+            gene_sets = GeneSets.from_gmt_files(file_names, cache=True, max_workers=max_workers)
+            self.assertEqual({gs.gs_id: gs.genes for gs in gene_sets}, {gs.gs_id: gs.genes for gs in (gs1, gs2, gs3)})
+            self.assertEqual(gene_sets.hierarchies(), {('A', 'a'), ('B', 'b')})
+
+            compact = gene_sets.compact()
+            self.assertEqual(list(compact.genes), ['1', '2', '3', '4'])
+            self.assertEqual([compact.set_genes(i) for i in range(3)], [gs.genes for gs in compact.gene_sets])
+
+        shutil.rmtree(temp_dir)
+
     def test_gene_set(self):
 
         gs1 = GeneSet(
@@ -96,6 +186,216 @@ class TestGeneSets(unittest.TestCase):
         split_by_hierarchy = sets.split_by_hierarchy()
         self.assertLess(len(split_by_hierarchy), len(sets))
 
+    def test_compact_gene_sets(self):
+        gs1 = GeneSet(gs_id='test1', name='test_name1', genes={'1', '2', '3'}, hierarchy=self.test_hierarchy)
+        gs2 = GeneSet(gs_id='test2', name='test_name2', genes={'3', '4'}, hierarchy=self.test_hierarchy)
+        gs3 = GeneSet(gs_id='test3', name='test_name3', genes=set(), hierarchy=self.test_hierarchy)
+
+        sets = GeneSets([gs1, gs2, gs3])
+        compact = sets.compact()
+        self.assertIs(compact, sets.compact())
+        self.assertEqual(list(compact.genes), ['1', '2', '3', '4'])
+        self.assertEqual(compact.membership.shape, (3, 4))
+
+        order = [gs.gs_id for gs in compact.gene_sets]
+        sizes = dict(zip(order, compact.set_sizes()))
+        self.assertEqual(sizes, {'test1': 3, 'test2': 2, 'test3': 0})
+
+        overlap = dict(zip(order, compact.overlap(['3', '4', 'unknown'])))
+        self.assertEqual(overlap, {'test1': 1, 'test2': 2, 'test3': 0})
+
+        overlaps = compact.overlaps([['1', '2'], ['4'], []])
+        self.assertEqual(overlaps.shape, (3, 3))
+        self.assertEqual(list(overlaps[order.index('test1')]), [2, 0, 0])
+
+        index = order.index('test2')
+        self.assertEqual(compact.set_genes(index), {'3', '4'})
+        self.assertEqual(compact.set_genes(index, compact.indicator(['4'])), {'4'})
+
+        sets.discard(gs3)
+        self.assertEqual(len(sets.compact()), 2)
+
+        # in-place set operators invalidate the encoding as well
+        sets |= {gs3}
+        self.assertEqual(len(sets.compact()), 3)
+        sets -= {gs1}
+        self.assertEqual(len(sets.compact()), 2)
+        sets &= {gs2}
+        self.assertEqual(len(sets.compact()), 1)
+        sets ^= {gs1}
+        self.assertEqual(len(sets.compact()), 2)
+        self.assertIsInstance(sets, GeneSets)
+        sets.difference_update([gs1])
+        self.assertEqual(len(sets.compact()), 1)
+
+    def test_enrich(self):
+        reference = [str(gene) for gene in range(100)]
+        query = ['1', '2', '3', '50']
+        gs1 = GeneSet(gs_id='test1', name='test_name1', genes={'1', '2', '3', '4'}, hierarchy=('A', 'a'))
+        gs2 = GeneSet(gs_id='test2', name='test_name2', genes={str(g) for g in range(40, 80)}, hierarchy=('B', 'b'))
+        gs3 = GeneSet(gs_id='test3', name='test_name3', genes={'200'}, hierarchy=('B', 'b'))
+        sets = GeneSets([gs1, gs2, gs3])
+
+        results = sets.enrich(query, reference)
+        self.assertEqual(len(results.gene_sets), 3)
+        self.assertEqual(len(results.fdr), 3)
+
+        for i, gene_set in enumerate(results.gene_sets):
+            expected = gene_set.set_enrichment(reference, query)
+            self.assertEqual(results.query[i], len(expected.query))
+            self.assertEqual(results.reference[i], len(expected.reference))
+            self.assertAlmostEqual(results.p_values[i], expected.p_value)
+
+        results = sets.enrich(query, reference, hierarchies=[('B', 'b')])
+        self.assertEqual({gs.gs_id for gs in results.gene_sets}, {'test2', 'test3'})
+
+    def test_catalog(self):
+        gs_a = GeneSet(gs_id='test1', name='test_name1', genes={'1', '2'}, hierarchy=('A', 'a'), organism='1')
+        gs_b = GeneSet(gs_id='test2', name='test_name2', genes={'2', '3'}, hierarchy=('B', 'b'), organism='1')
+        collections = {(('A', 'a'), '1'): GeneSets([gs_a]), (('B', 'b'), '1'): GeneSets([gs_b])}
+
+        tmp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for (hierarchy, organism), gene_sets in collections.items():
+            gene_sets.to_gmt_file_format(os.path.join(tmp_dir, filename(hierarchy, organism)))
+
+        def local_path(domain, file_name):
+            return os.path.join(tmp_dir, file_name)
+
+        with patch.object(geneset, 'list_all', return_value=set(collections)) as list_all, patch.object(
+            geneset, 'load_gene_sets', wraps=geneset.load_gene_sets
+        ) as load_gene_sets, patch.object(geneset.serverfiles, 'localpath', side_effect=local_path), patch.object(
+            geneset.serverfiles, 'localpath_download', side_effect=local_path
+        ) as download:
+            catalog = geneset.GeneSetsCatalog(max_loaded=1)
+            self.assertEqual(catalog.hierarchies('1'), [('A', 'a'), ('B', 'b')])
+            self.assertEqual(catalog.hierarchies('2'), [])
+            self.assertEqual(list_all.call_count, 1)
+
+            # counts are only read from caches of loaded files
+            self.assertIsNone(catalog.info(('B', 'b'), '1'))
+            self.assertEqual(download.call_count, 0)
+
+            self.assertIs(catalog.load(('A', 'a'), '1'), catalog.load(('A', 'a'), '1'))
+            self.assertEqual(load_gene_sets.call_count, 1)
+
+            loaded = catalog.load_many([('A', 'a'), ('B', 'b')], '1')
+            self.assertEqual({gs.gs_id: gs.genes for gs in loaded}, {'test1': {'1', '2'}, 'test2': {'2', '3'}})
+            self.assertEqual(catalog.info(('B', 'b'), '1'), {'set_count': 1, 'gene_count': 2})
+
+            # genes are read from caches, loaded collections are not affected
+            loaded = list(catalog._loaded)
+            self.assertEqual(catalog.genes('1'), {'1', '2', '3'})
+            self.assertEqual(list(catalog._loaded), loaded)
+
+            catalog.refresh()
+            catalog.hierarchies()
+            self.assertEqual(list_all.call_count, 2)
+
+            # files without a cache are parsed
+            shutil.rmtree(os.path.join(tmp_dir, filename(('A', 'a'), '1') + '.cache'))
+            self.assertEqual(catalog.genes('1'), {'1', '2', '3'})
+            self.assertEqual(len(catalog._loaded), 0)
+
+    def test_overlap_matrix(self):
+        gs1 = GeneSet(gs_id='test1', name='test_name1', genes={'1', '2', '3', '4'}, hierarchy=('A', 'a'))
+        gs2 = GeneSet(gs_id='test2', name='test_name2', genes={'1', '2', '3'}, hierarchy=('A', 'a'))
+        gs3 = GeneSet(gs_id='test3', name='test_name3', genes={'4', '5'}, hierarchy=('A', 'a'))
+        gs4 = GeneSet(gs_id='test4', name='test_name4', genes={'6'}, hierarchy=('A', 'a'))
+        sets = GeneSets([gs1, gs2, gs3, gs4])
+
+        gene_sets, jaccard = sets.overlap_matrix()
+        index = {gene_set.gs_id: i for i, gene_set in enumerate(gene_sets)}
+        i, j, k, m = (index[gs.gs_id] for gs in (gs1, gs2, gs3, gs4))
+        self.assertAlmostEqual(jaccard[i, j], 3 / 4)
+        self.assertAlmostEqual(jaccard[i, k], 1 / 5)
+        self.assertEqual(jaccard[j, k], 0)
+        self.assertEqual(jaccard[i, i], 0)
+        self.assertEqual(jaccard.nnz, 4)
+
+        _, intersections = sets.overlap_matrix('intersection')
+        self.assertEqual(intersections[i, j], 3)
+
+        _, coefficients = sets.overlap_matrix('overlap', threshold=0.5)
+        self.assertEqual(coefficients[i, j], 1)
+        self.assertEqual(coefficients[i, k], 0)
+
+        with self.assertRaises(GeneSetException):
+            sets.overlap_matrix('unknown')
+
+        clusters = sets.redundancy_clusters(threshold=0.5)
+        self.assertEqual(
+            sorted([gs.gs_id for gs in cluster] for cluster in clusters), [['test1', 'test2'], ['test3'], ['test4']]
+        )
+
+        collapsed = sets.collapse_redundant(threshold=0.5, scores={gs1: 0.1, gs2: 0.01})
+        self.assertEqual({gs.gs_id for gs in collapsed}, {'test2', 'test3', 'test4'})
+
+    def test_gsea(self):
+        genes = [str(gene) for gene in range(100)]
+        scores = [100 - gene for gene in range(100)]
+        top = GeneSet(gs_id='top', name='top', genes={str(g) for g in range(0, 20)}, hierarchy=('A', 'a'))
+        bottom = GeneSet(gs_id='bottom', name='bottom', genes={str(g) for g in range(80, 100)}, hierarchy=('A', 'a'))
+        small = GeneSet(gs_id='small', name='small', genes={'1', '2'}, hierarchy=('A', 'a'))
+
+        results = gsea(GeneSets([top, bottom, small]), genes, scores, permutations=200, max_workers=1, random_state=0)
+        es = {gene_set.gs_id: score for gene_set, score in zip(results.gene_sets, results.es)}
+        p_values = {gene_set.gs_id: p for gene_set, p in zip(results.gene_sets, results.p_values)}
+
+        # small sets are not tested
+        self.assertEqual(set(es), {'top', 'bottom'})
+        self.assertAlmostEqual(es['top'], 1)
+        self.assertAlmostEqual(es['bottom'], -1)
+        self.assertLess(p_values['top'], 0.05)
+        self.assertLess(p_values['bottom'], 0.05)
+        self.assertTrue(all(results.nes[results.es > 0] > 0))
+        self.assertTrue(all(results.fdr < 0.05))
+
+        # false discovery rates are estimated from normalized null scores of all sets, separately for each sign
+        nes = np.array([2.0, 1.0, -1.0])
+        null_nes = np.array([[0.5, 2.5], [1.0, -0.5], [-2.0, 3.0]])
+        np.testing.assert_almost_equal(_fdr(nes, null_nes), [1.0, 0.75, 0.5])
+
+        # permutations in worker processes
+        parallel = gsea(GeneSets([top, bottom]), genes, scores, permutations=200, max_workers=2, random_state=0)
+        np.testing.assert_almost_equal(sorted(parallel.es), sorted(results.es))
+        self.assertTrue(all(parallel.p_values < 0.05))
+
+        with self.assertRaises(GeneSetException):
+            gsea(GeneSets([top]), genes, scores[:-1])
+
+    def test_score_samples(self):
+        genes = [str(gene) for gene in range(10)]
+        x = np.array([np.arange(10, 0, -1), np.arange(1, 11)], dtype=float)
+        top = GeneSet(gs_id='top', name='top', genes={'0', '1'}, hierarchy=('A', 'a'))
+        bottom = GeneSet(gs_id='bottom', name='bottom', genes={'8', '9'}, hierarchy=('A', 'a'))
+        unknown = GeneSet(gs_id='unknown', name='unknown', genes={'100'}, hierarchy=('A', 'a'))
+        sets = GeneSets([top, bottom, unknown])
+
+        scores, scored_sets = score_samples(sets, x, genes, method='auc', max_rank=2, max_workers=1)
+        scores = dict(zip((gene_set.gs_id for gene_set in scored_sets), scores.T.tolist()))
+        self.assertEqual(scores, {'top': [1, 0], 'bottom': [0, 1]})
+
+        scores, scored_sets = score_samples(sets, x, genes, method='ssgsea', max_workers=1)
+        scores = dict(zip((gene_set.gs_id for gene_set in scored_sets), scores.T.tolist()))
+        self.assertGreater(scores['top'][0], 0)
+        self.assertLess(scores['top'][1], 0)
+        self.assertLess(scores['bottom'][0], 0)
+
+        # chunks scored in worker processes
+        parallel, _ = score_samples(sets, x, genes, method='ssgsea', chunk_size=1, max_workers=2)
+        np.testing.assert_almost_equal(parallel, score_samples(sets, x, genes, method='ssgsea', max_workers=1)[0])
+
+        with self.assertRaises(GeneSetException):
+            score_samples(sets, x, genes, method='unknown')
+
+        domain = Domain([ContinuousVariable(gene) for gene in genes], metas=[StringVariable('name')])
+        data = Table.from_numpy(domain, x, metas=np.array([['a'], ['b']], dtype=object))
+        scored = score_table(data, sets, max_rank=2, chunk_size=1)
+        self.assertEqual(sorted(var.name for var in scored.domain.attributes), ['bottom', 'top'])
+        self.assertEqual(scored.domain.metas, data.domain.metas)
+        self.assertEqual(scored.get_column('top').tolist(), [1, 0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -90,6 +90,19 @@ class TestStatistics(unittest.TestCase):
                 assert np.isnan(p).sum() == 0
                 assert np.isnan(r).sum() == 0
 
+    def test_p_values(self):
+        """ Test vectorized p-values against scalar ones. """
+        k, N, m, n = np.array([0, 3, 5, 10]), 1000, np.array([5, 10, 30, 200]), 40  # noqa: N806
+        for prob in (statistics.Hypergeometric(), statistics.Binomial()):
+            expected = [prob.p_value(k_, N, m_, n) for k_, m_ in zip(k, m)]
+            np.testing.assert_allclose(prob.p_values(k, N, m, n), expected, rtol=1e-6)
+
+    def test_fdr(self):
+        p_values = [0.01, 0.04, 0.03, 0.005, 0.5]
+        np.testing.assert_allclose(statistics.FDR(p_values), [0.025, 0.05, 0.05, 0.025, 0.5])
+        np.testing.assert_allclose(statistics.FDR(np.array(p_values)), [0.025, 0.05, 0.05, 0.025, 0.5])
+        self.assertEqual(statistics.FDR([]), [])
+
 
 if __name__ == '__main__':
     unittest.main()
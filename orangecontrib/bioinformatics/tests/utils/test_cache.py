@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from orangecontrib.bioinformatics.utils import cache
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'data.txt.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_source_key(self):
+        file_path = os.path.join(self.tmp_dir, 'data.txt')
+        with open(file_path, 'w') as f:
+            f.write('data')
+        key = cache.source_key(file_path)
+        self.assertEqual(cache.source_key(file_path), key)
+        with open(file_path, 'a') as f:
+            f.write('more data')
+        self.assertNotEqual(cache.source_key(file_path), key)
+
+    def test_write_read(self):
+        cache.write_cache(self.path, {'values': np.arange(5), 'names': np.array(['a', 'b'])}, {'version': 1})
+        np.testing.assert_array_equal(cache.read_array(self.path, 'values'), np.arange(5))
+        np.testing.assert_array_equal(cache.read_array(self.path, 'names'), ['a', 'b'])
+        self.assertEqual(cache.read_metadata(self.path, 1), {'version': 1})
+
+        # out of date caches
+        with self.assertRaises(ValueError):
+            cache.read_metadata(self.path, 2)
+        cache.write_cache(self.path, {}, {'version': 1, 'source': 'a'})
+        self.assertEqual(cache.read_metadata(self.path, 1, 'a')['source'], 'a')
+        with self.assertRaises(ValueError):
+            cache.read_metadata(self.path, 1, 'b')
+
+    def test_replace_mapped(self):
+        cache.write_cache(self.path, {'values': np.arange(1000)}, {'version': 1})
+        mapped = cache.read_array(self.path, 'values')
+
+        # the new cache is smaller, the old mapping stays valid
+        cache.write_cache(self.path, {'values': np.arange(3)}, {'version': 1})
+        np.testing.assert_array_equal(cache.read_array(self.path, 'values'), np.arange(3))
+        self.assertEqual(int(mapped[-1]), 999)
+        self.assertEqual(os.listdir(self.tmp_dir), [os.path.basename(self.path)])
+
+    def test_interrupted_write(self):
+        cache.write_cache(self.path, {'values': np.arange(3)}, {'version': 1})
+        with mock.patch.object(np, 'save', side_effect=OSError):
+            with self.assertRaises(OSError):
+                cache.write_cache(self.path, {'values': np.arange(5)}, {'version': 1})
+
+        # the old cache is kept, temporary files are removed
+        np.testing.assert_array_equal(cache.read_array(self.path, 'values'), np.arange(3))
+        self.assertEqual(os.listdir(self.tmp_dir), [os.path.basename(self.path)])
+
+
+if __name__ == '__main__':
+    unittest.main()
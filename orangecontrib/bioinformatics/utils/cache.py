@@ -0,0 +1,71 @@
+""" Binary caches of parsed files
+
+A cache is a directory with arrays stored as ``.npy`` files, which are memory mapped when loaded,
+and a ``metadata.json`` file. Caches are never modified in place: a new version is written into
+a temporary sibling directory that then replaces the old one, so arrays that are still memory
+mapped from the old version stay valid and an interrupted write never leaves a partial cache.
+"""
+import os
+import json
+import shutil
+import tempfile
+from typing import Dict, Optional
+
+import numpy as np
+
+METADATA_FILE = 'metadata.json'
+
+
+def source_key(file_path: str) -> str:
+    """ Identify the version of a file on disk (modification time and size). """
+    stat = os.stat(file_path)
+    return '{}:{}'.format(stat.st_mtime_ns, stat.st_size)
+
+
+def write_cache(path: str, arrays: Dict[str, np.ndarray], metadata: dict) -> None:
+    """ Write a cache into directory `path`, replacing the existing one.
+
+    :param path: Cache directory
+    :param arrays: Arrays to store, by name.
+    :param metadata: JSON serializable metadata.
+    """
+    parent, name = os.path.split(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=name + '.', suffix='.tmp', dir=parent)
+    try:
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_path, array_name + '.npy'), array)
+        with open(os.path.join(tmp_path, METADATA_FILE), 'w', encoding='utf-8') as fp:
+            json.dump(metadata, fp)
+
+        if os.path.exists(path):
+            # a directory can not replace a non-empty one; memory mapped files of the old
+            # cache stay readable after it is removed
+            old_path = tmp_path + '.old'
+            os.replace(path, old_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def read_metadata(path: str, version: int, source: Optional[str] = None) -> dict:
+    """ Read metadata of a cache written with :func:`write_cache`.
+
+    :param path: Cache directory
+    :param version: Expected value of ``version`` in metadata.
+    :param source: If given, it must match ``source`` in metadata (see :func:`source_key`).
+    :raises ValueError: If the cache is out of date.
+    """
+    with open(os.path.join(path, METADATA_FILE), 'r', encoding='utf-8') as fp:
+        metadata = json.load(fp)
+
+    if metadata.get('version') != version or (source is not None and metadata.get('source') != source):
+        raise ValueError('Cache {} is out of date'.format(path))
+    return metadata
+
+
+def read_array(path: str, name: str) -> np.ndarray:
+    """ Memory map array `name` of a cache written with :func:`write_cache`. """
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
@@ -4,7 +4,7 @@ from typing import Tuple, Union
 
 import numpy as np
 import scipy
-from scipy.stats import hypergeom
+from scipy.stats import binom, hypergeom
 
 ALT_TWO = "two-sided"
 ALT_LESS = "less"
@@ -228,6 +228,13 @@ class Binomial(LogBin):
             else:
                 return value
 
+    @staticmethod
+    def p_values(k, N, m, n):  # noqa: N803
+        """ Vectorized :meth:`p_value`. Arguments are array-like (broadcasted), returns an array of p-values. """
+        k, N, m, n = (np.asarray(arg, dtype=float) for arg in (k, N, m, n))  # noqa: N806
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return binom.sf(k - 1, n, m / N)
+
 
 class Hypergeometric(LogBin):
     """ `Hypergeometric distribution <http://en.wikipedia.org/wiki/Hypergeometric_distribution>`_ is
@@ -268,6 +275,11 @@ class Hypergeometric(LogBin):
             else:
                 return value
 
+    @staticmethod
+    def p_values(k, N, m, n):  # noqa: N803
+        """ Vectorized :meth:`p_value`. Arguments are array-like (broadcasted), returns an array of p-values. """
+        return hypergeom.sf(np.asarray(k) - 1, N, m, n)
+
 
 # to speed-up FDR, calculate ahead sum([1/i for i in range(1, m+1)]), for m in [1,100000].
 # For higher values of m use an approximation, with error less or equal to
@@ -290,39 +302,24 @@ def FDR(p_values, dependent=False, m=None, ordered=False):  # noqa: N802
     :param ordered: prevent sorting of p-values if they are already sorted (default False).
     """
 
-    if not ordered:
-        ordered = is_sorted(p_values)
-
-    if not ordered:
-        joined = [(v, i) for i, v in enumerate(p_values)]
-        joined.sort()
-        p_values = [p[0] for p in joined]
-        indices = [p[1] for p in joined]
+    p_values = np.asarray(p_values, dtype=float)
 
     if not m:
         m = len(p_values)
-    if m <= 0 or not p_values:
+    if m <= 0 or not len(p_values):
         return []
 
     if dependent:  # correct q for dependent tests
         k = c[m - 1] if m <= len(c) else math.log(m) + 0.57721566490153286060651209008240243104215933593992
         m = m * k
 
-    tmp_fdrs = [p * m / (i + 1.0) for (i, p) in enumerate(p_values)]
-    fdrs = []
-    cmin = tmp_fdrs[-1]
-    for f in reversed(tmp_fdrs):
-        cmin = min(f, cmin)
-        fdrs.append(cmin)
-    fdrs.reverse()
-
-    if not ordered:
-        new = [None] * len(fdrs)
-        for v, i in zip(fdrs, indices):
-            new[i] = v
-        fdrs = new
-
-    return fdrs
+    order = np.arange(len(p_values)) if ordered else np.argsort(p_values, kind='stable')
+
+    tmp_fdrs = p_values[order] * m / np.arange(1, len(p_values) + 1)
+    fdrs = np.empty_like(tmp_fdrs)
+    fdrs[order] = np.minimum.accumulate(tmp_fdrs[::-1])[::-1]
+
+    return fdrs.tolist()
 
 
 def Bonferroni(p_values, m=None):  # noqa: N802
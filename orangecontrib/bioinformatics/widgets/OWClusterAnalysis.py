@@ -469,6 +469,7 @@ class OWClusterAnalysis(OWWidget):
 
             # save setting on selected hierarchies
             self.stored_gene_sets_selection = tuple(selected_sets)
+            self.gs_widget.load_selected_gene_sets()
             ref_genes = set(self.input_genes_ids)
 
             try:
@@ -36,6 +36,7 @@ from Orange.widgets.widget import OWWidget
 
 from orangecontrib.bioinformatics.utils import serverfiles
 from orangecontrib.bioinformatics.geneset import DOMAIN as gene_sets_domain
+from orangecontrib.bioinformatics.geneset import catalog as gene_sets_catalog
 from orangecontrib.bioinformatics.geneset import filename
 from orangecontrib.bioinformatics.go.config import DOMAIN as gene_ontology_domain
 from orangecontrib.bioinformatics.go.config import FILENAME_ANNOTATION
@@ -456,6 +457,9 @@ class OWDatabasesUpdate(OWWidget):
             self.setStatusMessage('')
 
         fs, index = result
+        if fs.domain == gene_sets_domain:
+            gene_sets_catalog.refresh()
+
         # re-evaluate File State
         info = serverfiles.info(fs.domain, fs.filename)
         fs.refresh_state(info_local=info, info_server=info)
@@ -471,6 +475,8 @@ class OWDatabasesUpdate(OWWidget):
 
     def submit_remove_task(self, domain, filename):
         serverfiles.LOCALFILES.remove(domain, filename)
+        if domain == gene_sets_domain:
+            gene_sets_catalog.refresh()
 
         index = self.tree_item_index(domain, filename)
         fs = self.update_items[index]
@@ -913,6 +919,8 @@ class FileUploadHelper(QDialog):
 
         # if copy successful create .info file
         create_info_file(file_path, **self.info_state)
+        if self.info_state['domain'] == gene_sets_domain:
+            gene_sets_catalog.refresh()
 
     def __handle_file_selector(self):
         self.file_path = QFileDialog.getOpenFileName(self, 'Open File')[0]
@@ -156,11 +156,11 @@ class OWGeneSetEnrichment(_OWGeneSets.OWGeneSets):
         return filters
 
     def create_partial(self):
-        reference_genes = (
-            self.reference_genes
-            if (self.use_reference_data and self.reference_data)
-            else self.gs_widget.gs_object.genes()
-        )
+        if self.use_reference_data and self.reference_data:
+            reference_genes = self.reference_genes
+        else:
+            # genes of all available hierarchies may need to be read from disk, do it in the worker thread
+            reference_genes = self.gs_widget.genes
 
         return partial(
             self.set_items,
@@ -177,15 +177,20 @@ class OWGeneSetEnrichment(_OWGeneSets.OWGeneSets):
         if not genes:
             return
 
-        for gene_set in sorted(gene_sets):
-            if gene_set.hierarchy not in sets_to_display:
-                continue
+        if callable(reference_genes):
+            reference_genes = reference_genes()
+        reference_genes = [] if reference_genes is None else reference_genes
+        query = genes.intersection(reference_genes)
+        results = gene_sets.enrich(query, reference_genes, hierarchies=sets_to_display)
 
-            reference_genes = [] if reference_genes is None else reference_genes
-            enrichemnt_result = gene_set.set_enrichment(reference_genes, genes.intersection(reference_genes))
+        for gene_set, count, ref_count, p_value, enrichment in zip(
+            results.gene_sets, results.query, results.reference, results.p_values, results.enrichment_score
+        ):
             callback()
 
-            if len(enrichemnt_result.query) > 0:
+            if count > 0:
+                query_genes = gene_set.genes.intersection(query)
+
                 category_column = QStandardItem()
                 name_column = QStandardItem()
                 count_column = QStandardItem()
@@ -201,21 +206,21 @@ class OWGeneSetEnrichment(_OWGeneSets.OWGeneSets):
                 name_column.setData(gene_set.link, LinkRole)
                 name_column.setForeground(QColor(Qt.blue))
 
-                count_column.setData(len(enrichemnt_result.query), Qt.DisplayRole)
-                count_column.setData(set(enrichemnt_result.query), Qt.UserRole)
+                count_column.setData(int(count), Qt.DisplayRole)
+                count_column.setData(query_genes, Qt.UserRole)
 
                 genes_column.setData(len(gene_set.genes), Qt.DisplayRole)
                 genes_column.setData(
                     set(gene_set.genes), Qt.UserRole
                 )  # store genes to get then on output on selection
 
-                ref_column.setData(len(enrichemnt_result.reference), Qt.DisplayRole)
+                ref_column.setData(int(ref_count), Qt.DisplayRole)
 
-                pval_column.setData(enrichemnt_result.p_value, Qt.DisplayRole)
-                pval_column.setData(enrichemnt_result.p_value, Qt.ToolTipRole)
+                pval_column.setData(float(p_value), Qt.DisplayRole)
+                pval_column.setData(float(p_value), Qt.ToolTipRole)
 
-                enrichment_column.setData(enrichemnt_result.enrichment_score, Qt.DisplayRole)
-                enrichment_column.setData(enrichemnt_result.enrichment_score, Qt.ToolTipRole)
+                enrichment_column.setData(float(enrichment), Qt.DisplayRole)
+                enrichment_column.setData(float(enrichment), Qt.ToolTipRole)
 
                 model_items.append(
                     [
@@ -407,6 +407,7 @@ class OWGeneSets(OWWidget):
 
         # save setting on selected hierarchies
         self.stored_gene_sets_selection = self.gs_widget.get_hierarchies(only_selected=True)
+        self.gs_widget.load_selected_gene_sets()
 
         f = self.create_partial()
 
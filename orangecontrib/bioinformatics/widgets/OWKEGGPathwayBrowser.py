@@ -6,6 +6,8 @@ from functools import reduce, partial
 from contextlib import contextmanager
 from collections import defaultdict
 
+import numpy as np
+
 from AnyQt.QtGui import QPen, QBrush, QColor, QPixmap, QPainter, QTransform, QKeySequence, QPainterPath
 from AnyQt.QtCore import Qt, Slot, QSize, QRectF, QItemSelectionModel
 from AnyQt.QtWidgets import (
@@ -799,29 +801,29 @@ class OWKEGGPathwayBrowser(widget.OWWidget):
 
 
 def pathway_enrichment(genesets, genes, reference, prob=None, callback=None):
-    result_sets = []
-    p_values = []
     if prob is None:
         prob = statistics.Hypergeometric()
 
-    for i, gs in enumerate(genesets):
-        cluster = gs.genes.intersection(genes)
-        ref = gs.genes.intersection(reference)
-        k = len(cluster)
-        N = len(reference)
-        m = len(ref)
-        n = len(genes)
-        if k:
-            p_val = prob.p_value(k, N, m, n)
-            result_sets.append((gs.gs_id, cluster, ref))
-            p_values.append(p_val)
-        if callback is not None:
-            callback(100.0 * i / len(genesets))
+    if callback is not None:
+        callback(0.0)
+
+    results = genesets.enrich(genes, reference, prob=prob)
+    hits = np.flatnonzero(results.query)
 
+    if callback is not None:
+        callback(50.0)
+
+    result_sets = [results.gene_sets[i] for i in hits]
     # FDR correction
-    p_values = statistics.FDR(p_values)
+    p_values = statistics.FDR(results.p_values[hits])
+
+    if callback is not None:
+        callback(100.0)
 
-    return {_id: (genes, p_val, len(ref)) for (_id, genes, ref), p_val in zip(result_sets, p_values)}
+    return {
+        gs.gs_id: (gs.genes.intersection(genes), p_val, int(results.reference[i]))
+        for gs, i, p_val in zip(result_sets, hits, p_values)
+    }
 
 
 @contextmanager
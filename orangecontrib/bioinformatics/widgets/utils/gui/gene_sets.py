@@ -7,7 +7,7 @@ import numpy as np
 from AnyQt.QtCore import Qt
 from AnyQt.QtWidgets import QWidget, QGroupBox, QTreeView, QTreeWidget, QTreeWidgetItem, QTreeWidgetItemIterator
 
-from orangecontrib.bioinformatics.geneset import GeneSet, GeneSets, list_all, load_gene_sets
+from orangecontrib.bioinformatics.geneset import GeneSet, GeneSets, catalog
 
 # TODO: better handle stored selection
 # TODO: Don't use hardcoded 'Custom sets', use table name if available
@@ -20,7 +20,8 @@ class GeneSetsSelection(QWidget):
 
         self.parent = parent
         self.stored_selection = settings_var
-        # gene sets object
+        self.tax_id = None
+        # gene sets object, holds only loaded (selected) hierarchies and custom sets
         self.gs_object = GeneSets()  # type: GeneSets
 
         self.hierarchy_tree_widget = QTreeWidget(self)
@@ -55,7 +56,7 @@ class GeneSetsSelection(QWidget):
                 GeneSet(
                     gs_id=key,
                     hierarchy=self.custom_set_hier,
-                    organism=self.gs_object.common_org(),
+                    organism=self.tax_id if self.tax_id is not None else self.gs_object.common_org(),
                     name=key,
                     genes=set(value),
                 )
@@ -67,19 +68,38 @@ class GeneSetsSelection(QWidget):
     def load_gene_sets(self, tax_id):
         # type: (str) -> None
         self.gs_object = GeneSets()
+        self.tax_id = tax_id
         self.clear()
 
-        gene_sets = list_all(organism=tax_id)
-        self.set_hierarchy_model(self.hierarchy_tree_widget, self.hierarchy_tree(gene_sets))
+        self.set_hierarchy_model(self.hierarchy_tree_widget, self.hierarchy_tree(catalog.hierarchies(tax_id)))
+        self.set_selected_hierarchies()
+        self.load_selected_gene_sets()
 
-        for gene_set in gene_sets:
-            g_sets = load_gene_sets(gene_set, tax_id)
-            self.gs_object.update([g_set for g_set in g_sets])
+    def load_selected_gene_sets(self):
+        """ Load gene sets from selected hierarchies that are not loaded yet. """
+        if self.tax_id is None:
+            return
 
-        self.set_selected_hierarchies()
+        loaded = self.gs_object.hierarchies()
+        available = set(catalog.hierarchies(self.tax_id))
+
+        missing = [
+            hierarchy
+            for hierarchy in self.get_hierarchies(only_selected=True)
+            if hierarchy not in loaded and hierarchy in available
+        ]
+        if missing:
+            self.gs_object.update(catalog.load_many(missing, self.tax_id), validate=False)
+
+    def genes(self):
+        """ Return genes from all available (not only loaded) hierarchies and custom sets. """
+        genes = catalog.genes(self.tax_id) if self.tax_id is not None else set()
+        custom_sets = self.gs_object.map_hierarchy_to_sets().get(self.custom_set_hier, [])
+        return genes.union(*(gene_set.genes for gene_set in custom_sets))
 
     def clear_gene_sets(self):
         self.gs_object = GeneSets()
+        self.tax_id = None
 
     def clear(self):
         # reset hierarchy widget state
@@ -87,7 +107,11 @@ class GeneSetsSelection(QWidget):
 
     def update_gs_hierarchy(self, select_customs_flag=False):
         self.clear()
-        self.set_hierarchy_model(self.hierarchy_tree_widget, self.hierarchy_tree(self.gs_object.hierarchies()))
+        hierarchies = self.gs_object.hierarchies()
+        if self.tax_id is not None:
+            hierarchies.update(catalog.hierarchies(self.tax_id))
+
+        self.set_hierarchy_model(self.hierarchy_tree_widget, self.hierarchy_tree(hierarchies))
         if select_customs_flag:
             self.set_custom_sets()
         else: